@@ -1,16 +1,14 @@
+import argparse
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+from trajectory_log import load_log, iter_log_chunks
+from metrics import format_summary
 
-# Paths to log files
-LOG_FIXED = "data/traffic_log_fixed.csv"
-LOG_ADAPT = "data/traffic_log_adaptive.csv"
-LOG_RL = "data/traffic_log_rl.csv"
-
-# Load logs
-fixed_log = pd.read_csv(LOG_FIXED)
-adapt_log = pd.read_csv(LOG_ADAPT)
-rl_log = pd.read_csv(LOG_RL)
+# Paths to log files (.npy directories as written by animated_compare; .csv/.parquet also work)
+LOG_FIXED = "data/traffic_log_fixed"
+LOG_ADAPT = "data/traffic_log_adaptive"
+LOG_RL = "data/traffic_log_rl"
 
 
 def compute_metrics(df):
@@ -43,72 +41,155 @@ def compute_metrics(df):
             queue_total.mean(), avg_speed_total, avg_speed_x, avg_speed_y)
 
 
-# --- Compute metrics ---
-times_f, qx_f, qy_f, qtot_f, avg_q_f, avg_s_f, avg_sx_f, avg_sy_f = compute_metrics(fixed_log)
-times_a, qx_a, qy_a, qtot_a, avg_q_a, avg_s_a, avg_sx_a, avg_sy_a = compute_metrics(adapt_log)
-times_r, qx_r, qy_r, qtot_r, avg_q_r, avg_s_r, avg_sx_r, avg_sy_r = compute_metrics(rl_log)
-
-
-# --- Total queue length comparison ---
-plt.figure(figsize=(10, 5))
-plt.plot(times_f, qtot_f, label="Fixed Timer", color="red")
-plt.plot(times_a, qtot_a, label="Adaptive V2I", color="green")
-plt.plot(times_r, qtot_r, label="RL Agent", color="blue")
-plt.title("Total Queue Length Over Time (X + Y)")
-plt.xlabel("Time (s)")
-plt.ylabel("Number of Stopped Vehicles")
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig("visuals/queue_total_comparison.png")
-plt.show()
-
-
-# --- Queue length by direction (RL example) ---
-plt.figure(figsize=(10, 5))
-plt.plot(times_r, qx_r, label="Queue X (RL)", color="blue")
-plt.plot(times_r, qy_r, label="Queue Y (RL)", color="purple")
-plt.title("Queue Length by Direction (RL Agent)")
-plt.xlabel("Time (s)")
-plt.ylabel("Number of Stopped Vehicles")
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig("visuals/queue_rl_by_direction.png")
-plt.show()
-
-
-# --- Bar chart: average values ---
-labels = ["Fixed Timer", "Adaptive V2I", "RL Agent"]
-avg_queues = [avg_q_f, avg_q_a, avg_q_r]
-avg_speeds = [avg_s_f, avg_s_a, avg_s_r]
-
-x = np.arange(len(labels))
-width = 0.35
-
-fig, ax1 = plt.subplots(figsize=(9, 5))
-
-# Average queue length
-ax1.bar(x - width / 2, avg_queues, width, label="Avg Queue Length", color="orange")
-ax1.set_ylabel("Average Queue Length")
-ax1.set_xticks(x)
-ax1.set_xticklabels(labels)
-ax1.legend(loc="upper left")
-
-# Average speed
-ax2 = ax1.twinx()
-ax2.bar(x + width / 2, avg_speeds, width, label="Avg Speed (m/s)", color="teal")
-ax2.set_ylabel("Average Speed (m/s)")
-ax2.legend(loc="upper right")
-
-plt.title("Performance Comparison of Traffic Light Modes")
-plt.tight_layout()
-plt.savefig("visuals/performance_comparison_intersection.png")
-plt.show()
-
-
-# --- Print summary ---
-print("=== Performance Summary ===")
-print(f"Fixed Timer    | Avg Queue: {avg_q_f:.2f}, Avg Speed Total: {avg_s_f:.2f} m/s (X: {avg_sx_f:.2f}, Y: {avg_sy_f:.2f})")
-print(f"Adaptive V2I   | Avg Queue: {avg_q_a:.2f}, Avg Speed Total: {avg_s_a:.2f} m/s (X: {avg_sx_a:.2f}, Y: {avg_sy_a:.2f})")
-print(f"RL Agent       | Avg Queue: {avg_q_r:.2f}, Avg Speed Total: {avg_s_r:.2f} m/s (X: {avg_sx_r:.2f}, Y: {avg_sy_r:.2f})")
+def compute_metrics_streaming(path, chunk_rows=1 << 20):
+    """
+    Same result as compute_metrics(load_log(path)), computed in one pass
+    over the log with bounded memory.
+
+    The log is read chunk by chunk. Rows of the last time step of a chunk
+    are kept back until the step is complete (it may span several chunks),
+    so every time step is aggregated from all of its rows at once and gives
+    exactly the same numbers as the in-memory groupbys. Requires the log to
+    be ordered by time, which is how the simulation writes it.
+    """
+    parts = {"queue_x": [], "queue_y": [], "queue_total": [],
+             "speed_x": [], "speed_y": [], "speed_total": []}
+    pending = []  # pieces of the time step still being read
+    last_done = None
+
+    def aggregate(df):
+        nonlocal last_done
+        if last_done is not None and df["time"].min() <= last_done:
+            raise ValueError(f"{path} is not ordered by time")
+        last_done = df["time"].max()
+        by_direction = df.groupby(["time", "direction"]).agg(stopped=("stopped", "sum"),
+                                                              speed=("speed", "mean"))
+        by_time = df.groupby("time").agg(stopped=("stopped", "sum"), speed=("speed", "mean"))
+        for direction in ["x", "y"]:
+            rows = by_direction[by_direction.index.get_level_values("direction") == direction]
+            rows = rows.droplevel("direction")
+            parts["queue_" + direction].append(rows["stopped"])
+            parts["speed_" + direction].append(rows["speed"])
+        parts["queue_total"].append(by_time["stopped"])
+        parts["speed_total"].append(by_time["speed"])
+
+    for chunk in iter_log_chunks(path, chunk_rows):
+        if not len(chunk):
+            continue
+        times = chunk["time"].to_numpy()
+        earlier = np.flatnonzero(times != times[-1])
+        if earlier.size:
+            # Everything before the last time step of the chunk is complete
+            tail = earlier[-1] + 1
+            head = chunk.iloc[:tail]
+            aggregate(pd.concat(pending + [head], ignore_index=True) if pending else head)
+            pending = [chunk.iloc[tail:]]
+        else:
+            # The whole chunk is one time step
+            if pending and pending[0]["time"].iloc[0] != times[-1]:
+                aggregate(pd.concat(pending, ignore_index=True))
+                pending = []
+            pending.append(chunk)
+    if pending:
+        aggregate(pd.concat(pending, ignore_index=True))
+
+    series = {name: pd.concat(values) if values else pd.Series(dtype=float)
+              for name, values in parts.items()}
+    for name in series:
+        series[name].index.name = "time"
+    queue_x = series["queue_x"].rename("stopped")
+    queue_y = series["queue_y"].rename("stopped")
+    queue_total = series["queue_total"].rename("stopped")
+    times = list(queue_total.index)
+
+    return (times, queue_x, queue_y, queue_total, queue_total.mean(),
+            series["speed_total"].mean(), series["speed_x"].mean(), series["speed_y"].mean())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the traffic light modes from their logs.")
+    parser.add_argument("--streaming", action="store_true",
+                        help="read the logs chunk by chunk instead of loading them into memory")
+    parser.add_argument("--chunk-rows", type=int, default=1 << 20,
+                        help="rows per chunk in streaming mode")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.streaming:
+        def metrics(path):
+            return compute_metrics_streaming(path, args.chunk_rows)
+    else:
+        def metrics(path):
+            return compute_metrics(load_log(path))
+
+    # --- Compute metrics ---
+    times_f, qx_f, qy_f, qtot_f, avg_q_f, avg_s_f, avg_sx_f, avg_sy_f = metrics(LOG_FIXED)
+    times_a, qx_a, qy_a, qtot_a, avg_q_a, avg_s_a, avg_sx_a, avg_sy_a = metrics(LOG_ADAPT)
+    times_r, qx_r, qy_r, qtot_r, avg_q_r, avg_s_r, avg_sx_r, avg_sy_r = metrics(LOG_RL)
+
+    # --- Total queue length comparison ---
+    plt.figure(figsize=(10, 5))
+    plt.plot(times_f, qtot_f, label="Fixed Timer", color="red")
+    plt.plot(times_a, qtot_a, label="Adaptive V2I", color="green")
+    plt.plot(times_r, qtot_r, label="RL Agent", color="blue")
+    plt.title("Total Queue Length Over Time (X + Y)")
+    plt.xlabel("Time (s)")
+    plt.ylabel("Number of Stopped Vehicles")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig("visuals/queue_total_comparison.png")
+    plt.show()
+
+    # --- Queue length by direction (RL example) ---
+    plt.figure(figsize=(10, 5))
+    plt.plot(times_r, qx_r, label="Queue X (RL)", color="blue")
+    plt.plot(times_r, qy_r, label="Queue Y (RL)", color="purple")
+    plt.title("Queue Length by Direction (RL Agent)")
+    plt.xlabel("Time (s)")
+    plt.ylabel("Number of Stopped Vehicles")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig("visuals/queue_rl_by_direction.png")
+    plt.show()
+
+    # --- Bar chart: average values ---
+    labels = ["Fixed Timer", "Adaptive V2I", "RL Agent"]
+    avg_queues = [avg_q_f, avg_q_a, avg_q_r]
+    avg_speeds = [avg_s_f, avg_s_a, avg_s_r]
+
+    x = np.arange(len(labels))
+    width = 0.35
+
+    fig, ax1 = plt.subplots(figsize=(9, 5))
+
+    # Average queue length
+    ax1.bar(x - width / 2, avg_queues, width, label="Avg Queue Length", color="orange")
+    ax1.set_ylabel("Average Queue Length")
+    ax1.set_xticks(x)
+    ax1.set_xticklabels(labels)
+    ax1.legend(loc="upper left")
+
+    # Average speed
+    ax2 = ax1.twinx()
+    ax2.bar(x + width / 2, avg_speeds, width, label="Avg Speed (m/s)", color="teal")
+    ax2.set_ylabel("Average Speed (m/s)")
+    ax2.legend(loc="upper right")
+
+    plt.title("Performance Comparison of Traffic Light Modes")
+    plt.tight_layout()
+    plt.savefig("visuals/performance_comparison_intersection.png")
+    plt.show()
+
+    # --- Print summary ---
+    print("=== Performance Summary ===")
+    print(format_summary("Fixed Timer", avg_q_f, avg_s_f, avg_sx_f, avg_sy_f))
+    print(format_summary("Adaptive V2I", avg_q_a, avg_s_a, avg_sx_a, avg_sy_a))
+    print(format_summary("RL Agent", avg_q_r, avg_s_r, avg_sx_r, avg_sy_r))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 import random
-import copy
-import csv
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 import matplotlib.animation as animation
-from stable_baselines3 import PPO
 import numpy as np
 from vehicle import Vehicle, STOP_LINE_DISTANCE
 from traffic_light import TrafficLight
+from leader_index import LeaderIndex
+from trajectory_log import open_recorder
+from metrics import OnlineMetrics
+from profiling import PhaseTimer
+from v2i import V2IBatch, V2IBus
+from policy_service import PolicyService
+from numpy_policy import load_policy
+from compile_policy import PolicyTable, POLICY_TABLE
+from snapshot import Snapshot
 import os
 
 # Fix OpenMP warning
@@ -21,26 +27,50 @@ LIGHT_POSITION = 0
 SIM_DURATION = 60
 DT = 0.5
 
-# RL model
-try:
-    model = PPO.load("traffic_rl_model")
-    RL_AVAILABLE = True
-except:
-    print("⚠️ RL model not found, RL mode will be skipped.")
-    RL_AVAILABLE = False
+RL_MODEL = "traffic_rl_model"
 
-# Logs
-LOG_FIXED = "data/traffic_log_fixed.csv"
-LOG_ADAPT = "data/traffic_log_adaptive.csv"
-LOG_RL = "data/traffic_log_rl.csv"
+# Set to True to drive the RL light from the compiled policy table (compile_policy.py)
+RL_TABLE = False
 
-for path in [LOG_FIXED, LOG_ADAPT, LOG_RL]:
-    with open(path, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            "time", "vehicle_id", "direction", "position_x", "position_y",
-            "speed", "stopped", "troublemaker", "light_state"
-        ])
+# Logs: "npy" (columnar binary, default), "parquet" or "csv"
+LOG_FORMAT = "npy"
+LOG_SUFFIX = {"npy": "", "parquet": ".parquet", "csv": ".csv"}[LOG_FORMAT]
+LOG_FIXED = "data/traffic_log_fixed" + LOG_SUFFIX
+LOG_ADAPT = "data/traffic_log_adaptive" + LOG_SUFFIX
+LOG_RL = "data/traffic_log_rl" + LOG_SUFFIX
+
+# Set to False to skip the trajectory logs; the online metrics summary is still printed
+LOGGING = True
+
+# V2I reports of the current tick (reused by every sim_step call)
+V2I_BATCH = V2IBatch()
+
+# Set to True to print per-phase timings of the simulation step for each mode
+PROFILE = False
+
+
+def load_rl_model(path=RL_MODEL):
+    """
+    Load the trained agent, or return None if it is not available.
+    The torch-free export (path + ".npz", see numpy_policy) is used when
+    present, otherwise the PPO agent.
+    """
+    try:
+        return load_policy(path)
+    except Exception:
+        print("⚠️ RL model not found, RL mode will be skipped.")
+        return None
+
+
+def load_policy_table(path=POLICY_TABLE):
+    """
+    Load the compiled policy table, or return None if it is not available.
+    """
+    try:
+        return PolicyTable.load(path)
+    except OSError:
+        print("⚠️ Policy table not found, run compile_policy.py; using the RL model.")
+        return None
 
 
 def generate_vehicle(direction, lane, start_pos, vid, troublemaker_id):
@@ -56,18 +86,18 @@ def generate_vehicle(direction, lane, start_pos, vid, troublemaker_id):
     )
 
 
-def generate_vehicles():
+def generate_vehicles(num_vehicles_x=NUM_VEHICLES_X, num_vehicles_y=NUM_VEHICLES_Y):
     """
     Generate vehicles for both X and Y directions, including one troublemaker.
     """
     vehicles = []
-    troublemaker_id = random.randint(0, NUM_VEHICLES_X + NUM_VEHICLES_Y - 1)
+    troublemaker_id = random.randint(0, num_vehicles_x + num_vehicles_y - 1)
     vid = 0
 
     # Horizontal (X)
     for lane in [-3, +3]:
         pos = -100
-        for _ in range(NUM_VEHICLES_X // 2):
+        for _ in range(num_vehicles_x // 2):
             v = generate_vehicle("x", lane, pos, vid, troublemaker_id)
             vehicles.append(v)
             pos -= random.randint(20, 30)
@@ -76,7 +106,7 @@ def generate_vehicles():
     # Vertical (Y)
     for lane in [-3, +3]:
         pos = -100
-        for _ in range(NUM_VEHICLES_Y // 2):
+        for _ in range(num_vehicles_y // 2):
             v = generate_vehicle("y", lane, pos, vid, troublemaker_id)
             vehicles.append(v)
             pos -= random.randint(20, 30)
@@ -144,96 +174,206 @@ def update_lights(light, lights):
         lights[1].set_color("green" if light.state == "green_y" else "red")
 
 
-# Setup initial vehicles
-random.seed(42)
-vehicles_fixed = generate_vehicles()
-vehicles_adaptive = copy.deepcopy(vehicles_fixed)
-vehicles_rl = copy.deepcopy(vehicles_fixed) if RL_AVAILABLE else []
-
-# Setup traffic lights
-light_fixed = TrafficLight(position=LIGHT_POSITION, mode="fixed")
-light_adaptive = TrafficLight(position=LIGHT_POSITION, mode="adaptive")
-light_rl = TrafficLight(position=LIGHT_POSITION, mode="rl") if RL_AVAILABLE else None
-
-# Setup subplots
-cols = 3 if RL_AVAILABLE else 2
-fig, axes = plt.subplots(1, cols, figsize=(6 * cols, 6))
-if cols == 2:
-    ax1, ax2 = axes
-    ax3 = None
-else:
-    ax1, ax2, ax3 = axes
-
-lights_fixed = setup_scene(ax1, "Fixed Timer")
-lights_adaptive = setup_scene(ax2, "Adaptive (V2I)")
-if RL_AVAILABLE:
-    lights_rl = setup_scene(ax3, "Reinforcement Learning")
-
-patches_fixed = init_vehicle_patches(ax1, vehicles_fixed)
-patches_adaptive = init_vehicle_patches(ax2, vehicles_adaptive)
-patches_rl = init_vehicle_patches(ax3, vehicles_rl) if RL_AVAILABLE else []
+def rl_observation(vehicles, light):
+    """
+    Observation of the RL agent: [queue_x, queue_y, light_state].
+    """
+    if light.bus is not None:
+        queue_x, queue_y = light.bus.queue("x"), light.bus.queue("y")
+    else:
+        queue_x = sum(1 for v in vehicles if v.direction == "x" and v.stopped)
+        queue_y = sum(1 for v in vehicles if v.direction == "y" and v.stopped)
+    state_num = 0 if light.state.startswith("green_x") else 1
+    return np.array([queue_x, queue_y, state_num], dtype=np.float32)
 
 
-def update(frame):
+def sim_step(t, vehicles, light, leader_index, model=None, patches=None, recorder=None,
+             metrics=None, lights=None, dt=DT, timer=None, action=None):
     """
-    Update function for the animation.
-    Runs simulation steps for each mode, updates vehicles and lights.
+    Advance one mode by one tick: light update (RL action or V2I data),
+    vehicle movement, metrics and logging. Drawing is skipped when no
+    patches/lights are given, so the loop can also run headless.
+    A light with a V2IBus already has its data; otherwise the V2I reports
+    are collected here. Metrics attached to the bus (OnlineMetrics.attach)
+    read its counters instead of the vehicles.
+    action: RL action already decided for this tick (e.g. by a
+    PolicyService for all RL lights at once); otherwise `model` is asked.
+    timer: optional profiling.PhaseTimer that gets one mark per phase.
     """
-    t = frame * DT
-
-    def sim_step(vehicles, light, patches, logfile, lights, rl=False):
-        if rl and RL_AVAILABLE:
-            queue_x = sum(1 for v in vehicles if v.direction == "x" and v.stopped)
-            queue_y = sum(1 for v in vehicles if v.direction == "y" and v.stopped)
-            state_num = 0 if light.state.startswith("green_x") else 1
-            obs = np.array([queue_x, queue_y, state_num], dtype=np.float32)
-            action, _ = model.predict(obs, deterministic=True)
-            light.update(DT, rl_action=action)
+    if timer is not None:
+        timer.start()
+    if light.mode == "rl" and (action is not None or model is not None):
+        if action is None:
+            action, _ = model.predict(rl_observation(vehicles, light), deterministic=True)
+            if timer is not None:
+                timer.mark("policy")
+        light.update(dt, rl_action=action)
+    else:
+        if light.bus is None:
+            V2I_BATCH.collect(vehicles)
+            light.receive_counts(V2I_BATCH.queue("x"), V2I_BATCH.queue("y"))
+        if timer is not None:
+            timer.mark("v2i")
+        light.update(dt)
+    if timer is not None:
+        timer.mark("light_update")
+
+    leader_index.refresh()
+    fronts = [leader_index.leader(v) for v in vehicles]
+    if timer is not None:
+        timer.mark("leader_search")
+
+    for v, front in zip(vehicles, fronts):
+        v.move(dt, front_vehicle=front, light=light, light_pos=LIGHT_POSITION)
+    if timer is not None:
+        timer.mark("move")
+
+    if metrics is not None:
+        if light.bus is not None and light.bus.listener is metrics:
+            metrics.observe_bus(t, light.bus)
         else:
-            data = [v.send_data(LIGHT_POSITION) for v in vehicles]
-            light.receive_data(data)
-            light.update(DT)
-
-        with open(logfile, "a", newline="") as f:
-            writer = csv.writer(f)
-            for i, v in enumerate(vehicles):
-                if v.direction == "x":
-                    front = min([ov for ov in vehicles if ov.direction == "x" and ov.x > v.x],
-                                key=lambda x: x.x, default=None)
-                else:
-                    front = min([ov for ov in vehicles if ov.direction == "y" and ov.y > v.y],
-                                key=lambda x: x.y, default=None)
-
-                v.move(DT, front_vehicle=front, light=light, light_pos=LIGHT_POSITION)
-
-                color = "purple" if v.is_troublemaker else \
-                        "red" if v.stopped else \
-                        ("blue" if v.type == "car" else "orange")
-                patches[i].set_xy((v.x - 2, v.y - 2))
-                patches[i].set_color(color)
-
-                writer.writerow([round(t,1), v.id, v.direction, round(v.x,2), round(v.y,2),
-                                 round(v.speed,2), v.stopped, v.is_troublemaker, light.state])
-
+            metrics.observe(t, vehicles)
+    if recorder is not None:
+        recorder.record(t, vehicles, light.state)
+    if timer is not None:
+        timer.mark("logging")
+
+    if patches is not None:
+        for i, v in enumerate(vehicles):
+            color = "purple" if v.is_troublemaker else \
+                    "red" if v.stopped else \
+                    ("blue" if v.type == "car" else "orange")
+            patches[i].set_xy((v.x - 2, v.y - 2))
+            patches[i].set_color(color)
+    if lights is not None:
         update_lights(light, lights)
-        return light.state
-
-    sim_step(vehicles_fixed, light_fixed, patches_fixed, LOG_FIXED, lights_fixed)
-    sim_step(vehicles_adaptive, light_adaptive, patches_adaptive, LOG_ADAPT, lights_adaptive)
-    if RL_AVAILABLE:
-        sim_step(vehicles_rl, light_rl, patches_rl, LOG_RL, lights_rl, rl=True)
-
-    drawn = patches_fixed + patches_adaptive
-    if RL_AVAILABLE:
-        drawn += patches_rl + [lights_rl[0], lights_rl[1]]
-    return drawn + [lights_fixed[0], lights_fixed[1], lights_adaptive[0], lights_adaptive[1]]
-
-
-frames = int(SIM_DURATION / DT)
-ani = animation.FuncAnimation(fig, update, frames=frames, interval=300, blit=True, repeat=False)
-plt.tight_layout()
-
-# Save animation as GIF
-# ani.save("visuals/simulation_comparison.gif", writer="pillow", fps=3)
-
-plt.show()
+    if timer is not None:
+        timer.mark("rendering")
+    return light.state
+
+
+def main():
+    table = load_policy_table() if RL_TABLE else None
+    model = load_rl_model() if table is None else None
+    rl_available = model is not None or table is not None
+    policy = PolicyService(model) if model is not None else None
+
+    os.makedirs("data", exist_ok=True)
+    recorder_fixed = open_recorder(LOG_FIXED, LOG_FORMAT) if LOGGING else None
+    recorder_adaptive = open_recorder(LOG_ADAPT, LOG_FORMAT) if LOGGING else None
+    recorder_rl = open_recorder(LOG_RL, LOG_FORMAT) if LOGGING and rl_available else None
+
+    # Metrics computed while the simulation runs
+    metrics_fixed = OnlineMetrics(DT)
+    metrics_adaptive = OnlineMetrics(DT)
+    metrics_rl = OnlineMetrics(DT)
+
+    # Optional per-phase timing
+    timer_fixed = PhaseTimer() if PROFILE else None
+    timer_adaptive = PhaseTimer() if PROFILE else None
+    timer_rl = PhaseTimer() if PROFILE else None
+
+    # Setup initial vehicles
+    random.seed(42)
+    vehicles_fixed = generate_vehicles()
+    start = Snapshot.capture(vehicles_fixed, rng=None)
+    vehicles_adaptive = start.restore(rng=None)[0]
+    vehicles_rl = start.restore(rng=None)[0] if rl_available else []
+
+    # Setup traffic lights
+    light_fixed = TrafficLight(position=LIGHT_POSITION, mode="fixed")
+    light_adaptive = TrafficLight(position=LIGHT_POSITION, mode="adaptive")
+    light_rl = None
+    if rl_available:
+        light_rl = TrafficLight(position=LIGHT_POSITION, mode="rl" if table is None else "rl_table")
+        light_rl.policy_table = table
+
+    # V2I buses: vehicles report state changes, the lights read the aggregates
+    for light, vehicles in [(light_fixed, vehicles_fixed), (light_adaptive, vehicles_adaptive),
+                            (light_rl, vehicles_rl)]:
+        if light is not None:
+            light.bus = V2IBus(LIGHT_POSITION)
+            light.bus.register(vehicles)
+    metrics_fixed.attach(light_fixed.bus)
+    metrics_adaptive.attach(light_adaptive.bus)
+    if light_rl is not None:
+        metrics_rl.attach(light_rl.bus)
+
+    # Per-lane leader lookup for each mode
+    index_fixed = LeaderIndex(vehicles_fixed)
+    index_adaptive = LeaderIndex(vehicles_adaptive)
+    index_rl = LeaderIndex(vehicles_rl)
+
+    # Setup subplots
+    cols = 3 if rl_available else 2
+    fig, axes = plt.subplots(1, cols, figsize=(6 * cols, 6))
+    if cols == 2:
+        ax1, ax2 = axes
+        ax3 = None
+    else:
+        ax1, ax2, ax3 = axes
+
+    lights_fixed = setup_scene(ax1, "Fixed Timer")
+    lights_adaptive = setup_scene(ax2, "Adaptive (V2I)")
+    if rl_available:
+        lights_rl = setup_scene(ax3, "Reinforcement Learning")
+
+    patches_fixed = init_vehicle_patches(ax1, vehicles_fixed)
+    patches_adaptive = init_vehicle_patches(ax2, vehicles_adaptive)
+    patches_rl = init_vehicle_patches(ax3, vehicles_rl) if rl_available else []
+
+    def update(frame):
+        """
+        Update function for the animation.
+        Runs simulation steps for each mode, updates vehicles and lights.
+        """
+        t = frame * DT
+
+        sim_step(t, vehicles_fixed, light_fixed, index_fixed, patches=patches_fixed,
+                 recorder=recorder_fixed, metrics=metrics_fixed, lights=lights_fixed, timer=timer_fixed)
+        sim_step(t, vehicles_adaptive, light_adaptive, index_adaptive, patches=patches_adaptive,
+                 recorder=recorder_adaptive, metrics=metrics_adaptive, lights=lights_adaptive,
+                 timer=timer_adaptive)
+        if rl_available:
+            action = None
+            if policy is not None:
+                # Actions of all RL lights of this tick in one forward pass
+                policy.submit(light_rl, rl_observation(vehicles_rl, light_rl))
+                action = policy.flush()[light_rl]
+            sim_step(t, vehicles_rl, light_rl, index_rl, patches=patches_rl, recorder=recorder_rl,
+                     metrics=metrics_rl, lights=lights_rl, timer=timer_rl, action=action)
+
+        drawn = patches_fixed + patches_adaptive
+        if rl_available:
+            drawn += patches_rl + [lights_rl[0], lights_rl[1]]
+        return drawn + [lights_fixed[0], lights_fixed[1], lights_adaptive[0], lights_adaptive[1]]
+
+    frames = int(SIM_DURATION / DT)
+    ani = animation.FuncAnimation(fig, update, frames=frames, interval=300, blit=True, repeat=False)
+    plt.tight_layout()
+
+    # Save animation as GIF: python render_headless.py --output visuals/simulation_comparison.gif
+
+    plt.show()
+
+    # Write out the buffered log rows
+    for recorder in [recorder_fixed, recorder_adaptive, recorder_rl]:
+        if recorder is not None:
+            recorder.close()
+
+    # --- Print summary (online metrics, no log needed) ---
+    print("=== Performance Summary ===")
+    print(metrics_fixed.summary_line("Fixed Timer"))
+    print(metrics_adaptive.summary_line("Adaptive V2I"))
+    if rl_available:
+        print(metrics_rl.summary_line("RL Agent"))
+
+    if PROFILE:
+        print(timer_fixed.report("Fixed Timer"))
+        print(timer_adaptive.report("Adaptive V2I"))
+        if rl_available:
+            print(timer_rl.report("RL Agent"))
+
+
+if __name__ == "__main__":
+    main()
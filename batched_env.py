@@ -0,0 +1,443 @@
+import argparse
+import random
+import multiprocessing as mp
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from intersection_env import IntersectionEnv, generate_vehicles
+from vector_engine import VehicleArrays, LightArrays, LIGHT_MODE_CODES
+from collision import fleet_collisions
+
+
+class BatchedIntersectionEnv(VecEnv):
+    """
+    N independent intersections stepped together, as a Stable-Baselines3 VecEnv.
+
+    All vehicles of all intersections live in one VehicleArrays fleet and all
+    lights in one LightArrays, so a step costs a handful of NumPy calls no
+    matter how many intersections there are. Every instance follows the
+    rules of IntersectionEnv(engine="arrays") and returns the same
+    observation [queue_x, queue_y, light_state], reward and info keys.
+
+    Seeding: instance i is reset with seed + i after seed(seed). Once an
+    instance has been seeded, its automatic resets draw the next seed from
+    the instance's own seed stream (seed_rngs, like IntersectionEnv.rng),
+    so whole training runs are reproducible and match
+    DummyVecEnv(IntersectionEnv) episode after episode (see
+    `python batched_env.py --check`).
+
+    get_attr/set_attr read and write the entry of each instance for the
+    attributes in INSTANCE_ATTRS (e.g. rngs); other attributes are shared
+    by all instances. env_method calls a method of the batch once and
+    returns its result for every requested index.
+    """
+
+    # Attributes holding one value per instance
+    INSTANCE_ATTRS = ("time", "step_counter", "last_action", "rngs", "seed_rngs", "seeded")
+
+    def __init__(self, num_envs, num_vehicles_x=8, num_vehicles_y=8, sim_duration=120, dt=0.25):
+        self.num_vehicles_x = num_vehicles_x
+        self.num_vehicles_y = num_vehicles_y
+        self.sim_duration = sim_duration
+        self.dt = dt
+        self.action_interval = 8  # agent can act every 8 steps (~2 seconds)
+        self.render_mode = None
+
+        observation_space = spaces.Box(low=0, high=100, shape=(3,), dtype=np.float32)
+        action_space = spaces.Discrete(2)
+        super().__init__(num_envs, observation_space, action_space)
+
+        self.time = np.zeros(num_envs)
+        self.step_counter = np.zeros(num_envs, dtype=np.int64)
+        self.last_action = np.zeros(num_envs, dtype=np.int64)
+        self.lights = LightArrays(num_envs, mode="rl")
+        self.fleet = VehicleArrays(0)
+        self.rngs = [random.Random() for _ in range(num_envs)]   # troublemaker braking
+        self.seed_rngs = [random.Random() for _ in range(num_envs)]   # seeds of the auto-resets
+        self.seeded = np.zeros(num_envs, dtype=bool)
+        self._actions = None
+
+    def reset(self):
+        """
+        Reset every intersection and return the stacked observations.
+        """
+        self._reset_instances(np.arange(self.num_envs), self._seeds)
+        self._reset_seeds()
+        self._reset_options()
+        queue_x, queue_y = self.fleet.queue_counts_by_instance(self.num_envs)
+        return self._get_obs(queue_x, queue_y)
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions).reshape(self.num_envs)
+
+    def step_wait(self):
+        """
+        Advance all intersections by one tick and auto-reset finished ones.
+        """
+        n = self.num_envs
+        self.time += self.dt
+        self.step_counter += 1
+        dones = self.time >= self.sim_duration
+
+        # Apply actions only every `action_interval` steps
+        decide = self.step_counter % self.action_interval == 0
+        self.last_action[decide] = self._actions[decide]
+        rl_action = self.last_action.copy()
+
+        self.lights.update(self.dt, rl_action=rl_action)
+
+        fleet = self.fleet
+        can_go = self.lights.can_go(fleet.instance, fleet.direction)
+        fleet.step(self.dt, can_go=can_go, rngs=self.rngs)
+
+        queue_x, queue_y = fleet.queue_counts_by_instance(n)
+        passed = np.bincount(fleet.instance[fleet.pos >= 0], minlength=n)
+        crashes = self._crashes()
+
+        # Reward function
+        rewards = -(queue_x + queue_y) - 10 * crashes + 3 * passed
+        rewards = rewards - 2 * (rl_action == 1)
+
+        obs = self._get_obs(queue_x, queue_y)
+        infos = [{"queue_x": int(queue_x[i]), "queue_y": int(queue_y[i]),
+                  "crashes": int(crashes[i]), "passed": int(passed[i])} for i in range(n)]
+
+        finished = np.flatnonzero(dones)
+        if finished.size:
+            for i in finished:
+                infos[i]["terminal_observation"] = obs[i].copy()
+                infos[i]["TimeLimit.truncated"] = False
+            self._reset_instances(finished, [None] * n)
+            queue_x, queue_y = self.fleet.queue_counts_by_instance(n)
+            obs[finished] = self._get_obs(queue_x, queue_y)[finished]
+
+        return obs, rewards.astype(np.float32), dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        value = getattr(self, attr_name)
+        if attr_name in self.INSTANCE_ATTRS:
+            return [value[i] for i in self._get_indices(indices)]
+        return [value for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        indices = self._get_indices(indices)
+        if attr_name in self.INSTANCE_ATTRS:
+            values = getattr(self, attr_name)
+            for i in indices:
+                values[i] = value
+        elif len(set(indices)) == self.num_envs:
+            setattr(self, attr_name, value)
+        else:
+            raise ValueError(f"{attr_name} is shared by all instances and can only be set for all of them")
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        # The methods act on the whole batch: call once, whatever the number of indices
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+    def _get_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def _reset_instances(self, indices, seeds):
+        """
+        Generate fresh vehicles and lights for the given instances.
+        """
+        fleets = [self.fleet.select(~np.isin(self.fleet.instance, indices))]
+        global_state = random.getstate()
+        for i in indices:
+            seed = seeds[i]
+            if seed is not None:
+                seed = int(seed)
+                self.seed_rngs[i].seed(seed)
+                self.seeded[i] = True
+            elif self.seeded[i]:
+                seed = self.seed_rngs[i].getrandbits(32)
+
+            # Same generator as IntersectionEnv.reset, then keep its random stream
+            random.seed(seed)
+            vehicles = generate_vehicles(self.num_vehicles_x, self.num_vehicles_y)
+            self.rngs[i].setstate(random.getstate())
+            fleets.append(VehicleArrays.from_vehicles(vehicles, instance=i))
+        random.setstate(global_state)
+
+        self.fleet = VehicleArrays.concatenate(fleets)
+        self.lights.reset(indices)
+        self.lights.mode[indices] = LIGHT_MODE_CODES["rl"]
+        self.time[indices] = 0
+        self.step_counter[indices] = 0
+
+    def _crashes(self):
+        """
+        Number of overlapping vehicle pairs in every instance.
+        """
+        i, _ = fleet_collisions(self.fleet, by_instance=True)
+        return np.bincount(self.fleet.instance[i], minlength=self.num_envs)
+
+    def _get_obs(self, queue_x, queue_y):
+        """
+        Stacked observation vectors: [queue_x, queue_y, light_state].
+        """
+        state_num = self.lights.light_state_numbers()
+        return np.stack([queue_x, queue_y, state_num], axis=1).astype(np.float32)
+
+
+# Shared buffers of ShardedIntersectionEnv: name -> (dtype, values per instance)
+_SHARED_BUFFERS = {
+    "actions": (np.int64, 1),
+    "obs": (np.float32, 3),
+    "terminal_obs": (np.float32, 3),
+    "rewards": (np.float32, 1),
+    "dones": (np.bool_, 1),
+    "queue_x": (np.int64, 1),
+    "queue_y": (np.int64, 1),
+    "crashes": (np.int64, 1),
+    "passed": (np.int64, 1),
+}
+
+
+def _shared_views(buffers, num_envs):
+    """
+    NumPy views onto the shared buffers.
+    """
+    views = {}
+    for name, (dtype, width) in _SHARED_BUFFERS.items():
+        view = np.frombuffer(buffers[name], dtype=dtype)
+        views[name] = view.reshape(num_envs, width) if width > 1 else view
+    return views
+
+
+def _shard_worker(remote, parent_remote, buffers, num_envs, start, count, env_kwargs):
+    """
+    Worker process: steps one BatchedIntersectionEnv holding instances
+    [start, start + count) and writes the results into the shared buffers.
+    """
+    parent_remote.close()
+    env = BatchedIntersectionEnv(count, **env_kwargs)
+    views = {name: view[start:start + count] for name, view in _shared_views(buffers, num_envs).items()}
+    while True:
+        cmd, data = remote.recv()
+        result = None
+        if cmd == "seed":
+            env.seed(data + start)
+        elif cmd == "reset":
+            views["obs"][:] = env.reset()
+        elif cmd == "step":
+            obs, rewards, dones, infos = env.step(views["actions"].copy())
+            views["obs"][:] = obs
+            views["rewards"][:] = rewards
+            views["dones"][:] = dones
+            for key in ("queue_x", "queue_y", "crashes", "passed"):
+                views[key][:] = [info[key] for info in infos]
+            for i in np.flatnonzero(dones):
+                views["terminal_obs"][i] = infos[i]["terminal_observation"]
+        elif cmd in ("get_attr", "set_attr", "env_method"):
+            # Errors go back to the main process instead of ending the worker
+            try:
+                if cmd == "env_method":
+                    method_name, method_args, method_kwargs, indices = data
+                    result = env.env_method(method_name, *method_args, indices=indices, **method_kwargs)
+                else:
+                    result = getattr(env, cmd)(*data)
+            except Exception as error:
+                result = error
+            if cmd == "set_attr" and result is None:
+                result = [None] * len(data[-1])
+        elif cmd == "close":
+            remote.close()
+            break
+        remote.send(result)
+
+
+class ShardedIntersectionEnv(VecEnv):
+    """
+    BatchedIntersectionEnv split over several worker processes.
+
+    Each worker steps a contiguous shard of the instances and exchanges
+    actions, observations, rewards and info fields with the main process
+    through shared memory; only a short command goes through the pipes.
+    Instance i is seeded with seed + i whatever the number of workers, so
+    results do not depend on how the instances are sharded. get_attr,
+    set_attr and env_method go to the BatchedIntersectionEnv of the shard
+    holding each instance.
+    """
+
+    def __init__(self, num_envs, num_workers, start_method=None, **env_kwargs):
+        self.num_workers = min(num_workers, num_envs)
+        if start_method is None:
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.buffers = {name: ctx.RawArray(np.ctypeslib.as_ctypes_type(dtype), num_envs * width)
+                        for name, (dtype, width) in _SHARED_BUFFERS.items()}
+        self.views = _shared_views(self.buffers, num_envs)
+
+        self.bounds = bounds = np.linspace(0, num_envs, self.num_workers + 1).astype(int)
+        self.remotes, self.processes = [], []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            remote, work_remote = ctx.Pipe()
+            args = (work_remote, remote, self.buffers, num_envs, int(start), int(stop - start),
+                    env_kwargs)
+            process = ctx.Process(target=_shard_worker, args=args, daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.closed = False
+
+        # After the workers: VecEnv reads render_mode through get_attr
+        observation_space = spaces.Box(low=0, high=100, shape=(3,), dtype=np.float32)
+        action_space = spaces.Discrete(2)
+        super().__init__(num_envs, observation_space, action_space)
+
+    def _command(self, cmd, data=None):
+        for remote in self.remotes:
+            remote.send((cmd, data))
+        for remote in self.remotes:
+            remote.recv()
+
+    def _forward(self, cmd, indices, *data):
+        """
+        Send a command for the given instances to the workers holding them
+        (with indices local to each shard) and return the results in the
+        order of indices.
+        """
+        indices = list(self._get_indices(indices))
+        shards = {}
+        for k, i in enumerate(indices):
+            w = int(np.searchsorted(self.bounds, i, side="right")) - 1
+            shards.setdefault(w, []).append(k)
+        for w, ks in shards.items():
+            local = [indices[k] - int(self.bounds[w]) for k in ks]
+            self.remotes[w].send((cmd, (*data, local)))
+        results, error = [None] * len(indices), None
+        for w, ks in shards.items():
+            shard_results = self.remotes[w].recv()
+            if isinstance(shard_results, Exception):
+                error = shard_results
+                continue
+            for k, value in zip(ks, shard_results):
+                results[k] = value
+        if error is not None:
+            raise error
+        return results
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self._command("seed", self._seeds[0])
+        self._command("reset")
+        self._reset_seeds()
+        self._reset_options()
+        return self.views["obs"].copy()
+
+    def step_async(self, actions):
+        self.views["actions"][:] = np.asarray(actions).reshape(self.num_envs)
+        for remote in self.remotes:
+            remote.send(("step", None))
+
+    def step_wait(self):
+        for remote in self.remotes:
+            remote.recv()
+        views = self.views
+        dones = views["dones"].copy()
+        infos = [{"queue_x": int(views["queue_x"][i]), "queue_y": int(views["queue_y"][i]),
+                  "crashes": int(views["crashes"][i]), "passed": int(views["passed"][i])}
+                 for i in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i]["terminal_observation"] = views["terminal_obs"][i].copy()
+            infos[i]["TimeLimit.truncated"] = False
+        return views["obs"].copy(), views["rewards"].copy(), dones, infos
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def get_attr(self, attr_name, indices=None):
+        return self._forward("get_attr", indices, attr_name)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._forward("set_attr", indices, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._forward("env_method", indices, method_name, method_args, method_kwargs)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+    def _get_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+# --- Equivalence check ---
+
+def check_batched(num_envs=4, steps=1200, seed=0, **env_kwargs):
+    """
+    Step a BatchedIntersectionEnv and, one instance at a time, a
+    DummyVecEnv(IntersectionEnv(engine="arrays")) seeded with seed + i,
+    with the same random actions over several episodes (auto-resets
+    included). Returns the number of (instance, step) pairs where the
+    observation, reward or done flag differs.
+    """
+    from stable_baselines3.common.vec_env import DummyVecEnv
+
+    actions = np.random.default_rng(seed).integers(0, 2, (steps, num_envs))
+    batched = BatchedIntersectionEnv(num_envs, **env_kwargs)
+    batched.seed(seed)
+    results = [batched.reset()]
+    for t in range(steps):
+        obs, rewards, dones, _ = batched.step(actions[t])
+        results.append((obs, rewards, dones))
+
+    mismatches = 0
+    for i in range(num_envs):
+        single = DummyVecEnv([lambda: IntersectionEnv(engine="arrays", **env_kwargs)])
+        single.seed(seed + i)
+        mismatches += not np.array_equal(single.reset()[0], results[0][i])
+        for t in range(steps):
+            obs, rewards, dones, _ = single.step(actions[t, i:i + 1])
+            expected = results[t + 1]
+            mismatches += not (np.array_equal(obs[0], expected[0][i]) and rewards[0] == expected[1][i]
+                               and dones[0] == expected[2][i])
+        single.close()
+    return mismatches
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare BatchedIntersectionEnv with IntersectionEnv.")
+    parser.add_argument("--check", action="store_true", help="run the comparison")
+    parser.add_argument("--envs", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=1200, help="480 steps per episode by default")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.check:
+        print("Nothing to do; use --check to compare with DummyVecEnv(IntersectionEnv).")
+        return
+    mismatches = check_batched(args.envs, args.steps, args.seed)
+    print(f"{args.envs} instances x {args.steps} steps: " +
+          ("identical observations, rewards and dones" if not mismatches else f"{mismatches} mismatching steps"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from intersection_env import IntersectionEnv, generate_vehicles
+from traffic_light import TrafficLight
+from leader_index import LeaderIndex
+from jit_kernels import AVAILABLE as JIT_AVAILABLE
+
+VEHICLE_COUNTS = [16, 64, 256, 1024, 4096, 10000]
+DTS = [0.25, 0.5]
+MODES = ["fixed", "adaptive", "rl"]
+CASES = ["sim_step", "env_step", "vehicle_move", "light_update"]
+
+
+def make_scenario(num_vehicles, mode, seed=0):
+    """
+    Vehicles, light and leader index for one benchmark run.
+    """
+    random.seed(seed)
+    vehicles = generate_vehicles(num_vehicles // 2, num_vehicles - num_vehicles // 2)
+    light = TrafficLight(position=0, mode=mode)
+    return vehicles, light, LeaderIndex(vehicles)
+
+
+def bench_sim_step(num_vehicles, dt, mode, engine, ticks, model=None):
+    """
+    animated_compare.sim_step (headless) for one controller mode.
+    """
+    from animated_compare import sim_step
+    vehicles, light, index = make_scenario(num_vehicles, mode)
+    start = time.perf_counter()
+    for k in range(ticks):
+        sim_step(k * dt, vehicles, light, index, model=model, dt=dt)
+    return time.perf_counter() - start
+
+
+def bench_env_step(num_vehicles, dt, mode, engine, ticks, model=None):
+    """
+    IntersectionEnv.step (rl controller) with the given engine.
+    """
+    env = IntersectionEnv(num_vehicles_x=num_vehicles // 2,
+                          num_vehicles_y=num_vehicles - num_vehicles // 2,
+                          sim_duration=float("inf"), dt=dt, engine=engine)
+    env.reset(seed=0)
+    start = time.perf_counter()
+    for k in range(ticks):
+        env.step(k % 2)
+    return time.perf_counter() - start
+
+
+def bench_vehicle_move(num_vehicles, dt, mode, engine, ticks, model=None):
+    """
+    Vehicle.move calls only (leaders looked up outside the timed section).
+    """
+    vehicles, light, index = make_scenario(num_vehicles, mode)
+    elapsed = 0.0
+    for _ in range(ticks):
+        light.update(dt)
+        index.refresh()
+        fronts = [index.leader(v) for v in vehicles]
+        start = time.perf_counter()
+        for v, front in zip(vehicles, fronts):
+            v.move(dt, front_vehicle=front, light=light, light_pos=0)
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def bench_light_update(num_vehicles, dt, mode, engine, ticks, model=None):
+    """
+    TrafficLight.update with V2I data (fixed/adaptive) or alternating actions (rl).
+    """
+    light = TrafficLight(position=0, mode=mode)
+    start = time.perf_counter()
+    for k in range(ticks):
+        if mode == "rl":
+            light.update(dt, rl_action=k % 2)
+        else:
+            light.queue_x, light.queue_y = k % 5, k % 3
+            light.update(dt)
+    return time.perf_counter() - start
+
+
+BENCHMARKS = {
+    "sim_step": (bench_sim_step, ["objects"], MODES),
+    "env_step": (bench_env_step, ["objects", "arrays"] + (["jit"] if JIT_AVAILABLE else []), ["rl"]),
+    "vehicle_move": (bench_vehicle_move, ["objects"], ["fixed"]),
+    "light_update": (bench_light_update, ["objects"], MODES),
+}
+
+
+def peak_memory(func, *args):
+    """
+    Peak traced memory (bytes) of a call, setup included.
+    """
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_suite(cases, vehicle_counts, dts, modes, ticks, max_updates, model=None, memory=True):
+    """
+    Run every benchmark over the grid and return a list of result dicts.
+    """
+    results = []
+    for case in cases:
+        func, engines, case_modes = BENCHMARKS[case]
+        counts = vehicle_counts if case != "light_update" else [0]
+        for engine in engines:
+            for mode in [m for m in case_modes if m in modes]:
+                if mode == "rl" and case == "sim_step" and model is None:
+                    continue
+                for n in counts:
+                    for dt in dts:
+                        n_ticks = ticks if n == 0 else max(5, min(ticks, max_updates // n))
+                        if case == "light_update":
+                            n_ticks = max_updates
+                        func(n, dt, mode, engine, 2, model)  # warm-up
+                        seconds = func(n, dt, mode, engine, n_ticks, model)
+                        result = {
+                            "case": case, "engine": engine, "mode": mode, "vehicles": n, "dt": dt,
+                            "ticks": n_ticks, "seconds": seconds,
+                            "ticks_per_sec": n_ticks / seconds,
+                            "vehicle_updates_per_sec": n * n_ticks / seconds,
+                        }
+                        if memory:
+                            result["peak_memory_bytes"] = peak_memory(
+                                func, n, dt, mode, engine, min(n_ticks, 10), model)
+                        results.append(result)
+                        print(f"{case:<13}{engine:<8}{mode:<9}n={n:<6}dt={dt:<5}"
+                              f"{result['ticks_per_sec']:>12.1f} ticks/s"
+                              f"{result['vehicle_updates_per_sec']:>14.0f} veh-updates/s")
+    return results
+
+
+def result_key(result):
+    return (result["case"], result["engine"], result["mode"], result["vehicles"], result["dt"])
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the throughput ratio against a baseline; return the regressions.
+    """
+    reference = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    print("\n=== Comparison with baseline (ticks/s ratio) ===")
+    for r in results:
+        base = reference.get(result_key(r))
+        if base is None:
+            continue
+        ratio = r["ticks_per_sec"] / base["ticks_per_sec"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  <-- regression"
+            regressions.append((r, ratio))
+        print(f"{r['case']:<13}{r['engine']:<8}{r['mode']:<9}n={r['vehicles']:<6}dt={r['dt']:<5}"
+              f"{ratio:>8.2f}x{flag}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Throughput benchmarks for the simulation hot paths.")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--vehicles", nargs="+", type=int, default=VEHICLE_COUNTS)
+    parser.add_argument("--dt", nargs="+", type=float, default=DTS)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--ticks", type=int, default=200, help="ticks per run (fewer for large fleets)")
+    parser.add_argument("--max-updates", type=int, default=200_000,
+                        help="cap on vehicle updates per run")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed throughput drop before a case counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    model = None
+    if "rl" in args.modes and "sim_step" in args.cases:
+        from animated_compare import load_rl_model
+        model = load_rl_model()
+
+    results = run_suite(args.cases, args.vehicles, args.dt, args.modes, args.ticks,
+                        args.max_updates, model=model, memory=not args.no_memory)
+    report = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import numpy as np
+from vector_engine import DIRECTION_CODES
+
+# Vehicle footprint across its lane (meters)
+VEHICLE_WIDTH = 2.0
+
+# Grid cell size of the spatial hash; at least the longest vehicle (6 m),
+# so a vehicle covers at most 2 x 2 cells
+CELL_SIZE = 8.0
+
+
+def vehicle_boxes(direction, pos, lane, length):
+    """
+    Axis-aligned footprints (x0, y0, x1, y1) of vehicles given as arrays.
+
+    A vehicle occupies [pos, pos + length] along its direction (the gap
+    to a leader is measured from pos + length, as in Vehicle.move) and
+    VEHICLE_WIDTH around its lane offset across it.
+    """
+    is_x = direction == DIRECTION_CODES["x"]
+    front = pos + length
+    lane_lo = lane - VEHICLE_WIDTH / 2
+    lane_hi = lane + VEHICLE_WIDTH / 2
+    return (np.where(is_x, pos, lane_lo), np.where(is_x, lane_lo, pos),
+            np.where(is_x, front, lane_hi), np.where(is_x, lane_hi, front))
+
+
+def find_collisions(x0, y0, x1, y1, group=None, cell_size=CELL_SIZE):
+    """
+    All pairs of overlapping boxes, found with a uniform-grid spatial hash.
+
+    Every box is entered in the grid cells it covers; only boxes sharing a
+    cell are compared, so the cost grows with the number of vehicles and
+    not with the number of pairs. This covers both same-lane bumper
+    overlaps and cross traffic in the conflict zone at the origin.
+    group: optional array; boxes of different groups (e.g. intersection
+    instances) never collide.
+    Returns two index arrays (i < j), sorted by (i, j).
+    """
+    n = len(x0)
+    empty = np.empty(0, dtype=np.int64)
+    if n < 2:
+        return empty, empty
+    if group is None:
+        group = np.zeros(n, dtype=np.int64)
+
+    cx0 = np.floor(x0 / cell_size).astype(np.int64)
+    cy0 = np.floor(y0 / cell_size).astype(np.int64)
+    cx1 = np.floor(x1 / cell_size).astype(np.int64)
+    cy1 = np.floor(y1 / cell_size).astype(np.int64)
+
+    # One entry per (box, covered cell)
+    nx = cx1 - cx0 + 1
+    counts = nx * (cy1 - cy0 + 1)
+    box = np.repeat(np.arange(n), counts)
+    local = np.arange(len(box)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cx = cx0[box] + local % nx[box]
+    cy = cy0[box] + local // nx[box]
+    grp = np.asarray(group)[box]
+
+    order = np.lexsort((box, cy, cx, grp))
+    box, cx, cy, grp = box[order], cx[order], cy[order], grp[order]
+
+    # Compare entries d apart within the same cell; runs are contiguous,
+    # so once no entries d apart share a cell, none further apart do
+    first, second = [], []
+    d = 1
+    while d < len(box):
+        same = (cx[:-d] == cx[d:]) & (cy[:-d] == cy[d:]) & (grp[:-d] == grp[d:])
+        if not same.any():
+            break
+        k = np.flatnonzero(same)
+        a, b = box[k], box[k + d]
+        overlap = (x0[a] < x1[b]) & (x0[b] < x1[a]) & (y0[a] < y1[b]) & (y0[b] < y1[a])
+        # Report each pair only in the first cell both boxes cover
+        owner = (cx[k] == np.maximum(cx0[a], cx0[b])) & (cy[k] == np.maximum(cy0[a], cy0[b]))
+        keep = overlap & owner
+        first.append(a[keep])
+        second.append(b[keep])
+        d += 1
+
+    if not first:
+        return empty, empty
+    a = np.concatenate(first)
+    b = np.concatenate(second)
+    i, j = np.minimum(a, b), np.maximum(a, b)
+    order = np.lexsort((j, i))
+    return i[order], j[order]
+
+
+def vehicle_collisions(vehicles):
+    """
+    Colliding pairs of Vehicle objects, as a list of (id, id) tuples.
+    """
+    n = len(vehicles)
+    if n < 2:
+        return []
+    direction = np.fromiter((DIRECTION_CODES[v.direction] for v in vehicles), np.int8, n)
+    pos = np.fromiter((v.x if v.direction == "x" else v.y for v in vehicles), float, n)
+    lane = np.fromiter((v.lane for v in vehicles), float, n)
+    length = np.fromiter((v.length for v in vehicles), float, n)
+    i, j = find_collisions(*vehicle_boxes(direction, pos, lane, length))
+    return [(vehicles[a].id, vehicles[b].id) for a, b in zip(i.tolist(), j.tolist())]
+
+
+def fleet_collisions(fleet, by_instance=False):
+    """
+    Colliding pairs of a VehicleArrays fleet, as two index arrays into the fleet.
+    by_instance: only vehicles of the same instance can collide.
+    """
+    group = fleet.instance if by_instance else None
+    boxes = vehicle_boxes(fleet.direction, fleet.pos, fleet.lane, fleet.length)
+    return find_collisions(*boxes, group=group)
@@ -0,0 +1,139 @@
+import argparse
+import time
+import numpy as np
+from numpy_policy import load_policy
+
+# Largest queue covered by the table (upper bound of the observation space)
+MAX_QUEUE = 100
+
+POLICY_TABLE = "traffic_rl_table.npz"
+
+
+class PolicyTable:
+    """
+    Greedy actions of a policy for every observation
+    [queue_x, queue_y, light_state] with queues up to max_queue, as a
+    dense (max_queue + 1, max_queue + 1, 2) table.
+
+    Used by lights in rl_table mode (TrafficLight.policy_table,
+    LightArrays.policy_table): the action is one lookup, no network is
+    evaluated. Longer queues are clamped to max_queue.
+    """
+
+    def __init__(self, actions):
+        self.actions = np.asarray(actions, dtype=np.int8)
+        self.max_queue = self.actions.shape[0] - 1
+        self.rows = self.actions.tolist()   # for scalar lookups
+
+    def action(self, queue_x, queue_y, light_state):
+        """
+        Action for one observation.
+        """
+        m = self.max_queue
+        return self.rows[min(int(queue_x), m)][min(int(queue_y), m)][light_state]
+
+    def lookup(self, queue_x, queue_y, light_state):
+        """
+        Actions for arrays of observations.
+        """
+        m = self.max_queue
+        return self.actions[np.minimum(queue_x, m), np.minimum(queue_y, m), light_state]
+
+    def save(self, path=POLICY_TABLE):
+        np.savez_compressed(path, actions=self.actions)
+
+    @classmethod
+    def load(cls, path=POLICY_TABLE):
+        with np.load(path) as data:
+            return cls(data["actions"])
+
+
+def observation_grid(max_queue=MAX_QUEUE):
+    """
+    Every observation covered by a table, in table order.
+    """
+    queue = np.arange(max_queue + 1)
+    grid = np.meshgrid(queue, queue, [0, 1], indexing="ij")
+    return np.stack(grid, axis=-1).reshape(-1, 3).astype(np.float32)
+
+
+def compile_policy(model, max_queue=MAX_QUEUE):
+    """
+    Evaluate `model` (PPO or NumpyPolicy) once over the whole observation
+    grid and return its greedy actions as a PolicyTable.
+    """
+    actions, _ = model.predict(observation_grid(max_queue), deterministic=True)
+    return PolicyTable(np.asarray(actions).reshape(max_queue + 1, max_queue + 1, 2))
+
+
+def validate_table(table, model, episodes=3, rate=900, duration=600, seed=0):
+    """
+    Agreement between the table and the live model.
+
+    grid: every observation of the table. beyond: observations with a
+    queue past max_queue (clamped by the table). rollouts: the
+    observations met while the model drives open-boundary episodes at
+    `rate` vehicles/hour per lane.
+    Returns {name: (observations, mismatches)}.
+    """
+    from intersection_env import IntersectionEnv
+    from open_boundary import uniform_arrivals
+
+    report = {}
+    grid = observation_grid(table.max_queue)
+    expected, _ = model.predict(grid, deterministic=True)
+    report["grid"] = (len(grid), int(np.count_nonzero(table.actions.reshape(-1) != expected)))
+
+    rng = np.random.default_rng(seed)
+    queues = rng.integers(0, 4 * table.max_queue, (20_000, 2))
+    beyond = np.column_stack([queues, rng.integers(0, 2, len(queues))])
+    beyond = beyond[queues.max(axis=1) > table.max_queue]
+    expected, _ = model.predict(beyond.astype(np.float32), deterministic=True)
+    looked_up = table.lookup(beyond[:, 0], beyond[:, 1], beyond[:, 2])
+    report["beyond"] = (len(beyond), int(np.count_nonzero(looked_up != expected)))
+
+    seen = []
+    for episode in range(episodes):
+        env = IntersectionEnv(engine="arrays", arrivals=uniform_arrivals(rate), sim_duration=duration)
+        obs, _ = env.reset(seed=seed + episode)
+        done = False
+        while not done:
+            seen.append(obs)
+            action, _ = model.predict(obs, deterministic=True)
+            obs, _, done, _, _ = env.step(int(action))
+    seen = np.array(seen)
+    expected, _ = model.predict(seen, deterministic=True)
+    looked_up = table.lookup(seen[:, 0].astype(np.int64), seen[:, 1].astype(np.int64),
+                             seen[:, 2].astype(np.int64))
+    report["rollouts"] = (len(seen), int(np.count_nonzero(looked_up != expected)))
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compile the trained policy into a lookup table.")
+    parser.add_argument("--model", default="traffic_rl_model",
+                        help="agent path; the .npz export is used when present")
+    parser.add_argument("--output", default=POLICY_TABLE)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--episodes", type=int, default=3,
+                        help="open-boundary episodes driven by the model for the validation")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    model = load_policy(args.model)
+    start = time.perf_counter()
+    table = compile_policy(model, args.max_queue)
+    print(f"Compiled {table.actions.size} observations in {time.perf_counter() - start:.2f}s")
+    table.save(args.output)
+    print(f"Policy table saved as {args.output}")
+
+    print("=== Agreement with the live model ===")
+    for name, (count, mismatches) in validate_table(table, model, args.episodes).items():
+        print(f"{name:10s} | {count:7d} observations, {mismatches:5d} mismatches "
+              f"({100 * (1 - mismatches / max(count, 1)):.2f}% agreement)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+import argparse
+import math
+import time
+import numpy as np
+from vehicle import STOP_LINE_DISTANCE, APPROACH_DISTANCE
+from vector_engine import LIGHT_STATE_CODES
+from open_boundary import ENTRY_GAP, LANES, uniform_arrivals
+from collision import VEHICLE_WIDTH
+
+# Longest stretch of ticks planned in one jump
+MAX_WINDOW = 2048
+
+# No event within the window
+NO_EVENT = 1 << 62
+
+# Longest transient / cycle of the vehicle state followed by _cycle (ticks)
+MAX_TRANSIENT = 64
+MAX_PERIOD = 8
+
+# After a tick that could not be skipped (or a jump shorter than MIN_JUMP
+# ticks), wait this many ticks at most (doubling from 1) before planning again
+MAX_BACKOFF = 16
+MIN_JUMP = 8
+
+# Half-width of the area where X and Y lanes cross (m around the light)
+CONFLICT_HALF_WIDTH = max(abs(lane) for lane in LANES) + VEHICLE_WIDTH / 2
+
+
+def _ticks_below(value, threshold, dt):
+    """
+    Number of coming ticks after which value + ticks * dt is still below
+    the threshold, less one tick of margin for rounding.
+    """
+    return max(0, math.ceil((threshold - value) / dt) - 2)
+
+
+def light_horizon(light, dt, rl_action=None):
+    """
+    Number of coming light.update(dt, rl_action) calls that certainly
+    leave the light in its current state, from its timers: yellow_duration
+    in yellow, cycle_time (fixed), min_green_time (adaptive with a queue
+    difference to serve, rl switch requests) and max_red_time (rl hold).
+    The queues an adaptive light sees are assumed not to change; rl_table
+    and mpc lights can act on any change of the traffic, so they get no horizon.
+    """
+    if light.state in ("yellow_x", "yellow_y"):
+        return _ticks_below(light.yellow_timer, light.yellow_duration, dt)
+    if light.mode == "fixed":
+        return _ticks_below(light.timer, light.cycle_time, dt)
+    if light.mode == "adaptive":
+        if light.bus is not None:
+            return 0
+        if light.state == "green_x":
+            wants_switch = light.queue_y - light.queue_x >= 2
+        else:
+            wants_switch = light.queue_x - light.queue_y >= 2
+        return _ticks_below(light.green_timer, light.min_green_time, dt) if wants_switch else NO_EVENT
+    if light.mode in ("rl_table", "mpc"):
+        return 0
+    if light.mode == "rl" and rl_action is not None:
+        if rl_action == 1:
+            return _ticks_below(light.green_timer, light.min_green_time, dt)
+        return _ticks_below(light.red_timer, light.max_red_time, dt)
+    return NO_EVENT
+
+
+class FastForward:
+    """
+    Event-driven scheduler for an open-boundary IntersectionEnv
+    (engine="arrays" with arrivals).
+
+    run(ticks, rl_action) returns the per-tick outputs of `ticks` calls of
+    the env tick with a constant action and leaves the env in the same
+    state, but covers quiet stretches in one jump. A stretch is quiet
+    while every vehicle keeps the must-stop decision it has now (free
+    flow, coasting towards red, a queue held at the stop line) and nothing
+    else happens. It ends one tick before the first event:
+
+        - the light changes state (light_horizon)
+        - an arrival is due, or a waiting arrival finds its lane free
+        - a vehicle coasting towards red reaches APPROACH_DISTANCE
+        - a gap to a leader crosses the safe gap
+        - vehicles of both directions are in the conflict area, or
+          vehicles of one lane overlap
+        - a vehicle leaves past the exit
+
+    With fixed decisions each vehicle follows its own recurrence, which
+    reaches max_speed or a short cycle (a held queue creeps forward when
+    reaction_delay > dt) within a few ticks. Positions are running sums of
+    speed * dt, evaluated with the same floating-point operations as the
+    tick loop, so the results are identical, not approximate.
+    Troublemakers before the stop line draw a random number every tick,
+    so stretches only start when there are none.
+
+    Event ticks are run with the normal tick; after a tick that could not
+    be skipped or a short jump, planning waits for up to MAX_BACKOFF ticks
+    so that busy traffic pays little for it. Queues, passed vehicles,
+    crashes, rewards and light states are still reported for every tick.
+    """
+
+    def __init__(self, env, max_window=MAX_WINDOW):
+        if env.traffic is None:
+            raise ValueError("FastForward needs an IntersectionEnv with arrivals (after reset)")
+        self.env = env
+        self.max_window = max_window
+        self.skipped = 0   # ticks covered by jumps
+        self.jumps = 0
+        self._backoff = 0
+        self._wait = 0
+
+    def run(self, ticks, rl_action=0):
+        """
+        Advance `ticks` ticks with a constant action.
+        Returns per-tick arrays: queue_x, queue_y, passed, crashes, reward
+        and light_state (LIGHT_STATE_CODES).
+        """
+        trace = {name: np.zeros(ticks, dtype=np.int64)
+                 for name in ("queue_x", "queue_y", "passed", "crashes", "light_state")}
+        trace["reward"] = np.zeros(ticks)
+        t = 0
+        while t < ticks:
+            if self._wait:
+                self._wait -= 1
+            else:
+                jumped = self._jump(ticks - t, rl_action, trace, t)
+                if jumped >= MIN_JUMP:
+                    self._backoff = 0
+                else:
+                    self._backoff = min(2 * self._backoff or 1, MAX_BACKOFF)
+                    self._wait = self._backoff - 1
+                if jumped:
+                    t += jumped
+                    continue
+            queue_x, queue_y, passed, crashes, reward, _ = self.env._tick(rl_action)
+            trace["queue_x"][t] = queue_x
+            trace["queue_y"][t] = queue_y
+            trace["passed"][t] = passed
+            trace["crashes"][t] = crashes
+            trace["reward"][t] = reward
+            trace["light_state"][t] = LIGHT_STATE_CODES[self.env.light.state]
+            t += 1
+        return trace
+
+    def _jump(self, limit, rl_action, trace, offset):
+        """
+        Cover the quiet ticks ahead (at most `limit`) and record them in
+        trace[offset:]. Returns the number of ticks covered (0 if the next
+        tick is an event).
+        """
+        env = self.env
+        traffic = env.traffic
+        light = env.light
+        dt = env.dt
+        if env.collisions:
+            return 0
+        horizon = min(limit, self.max_window, light_horizon(light, dt, rl_action))
+        if horizon < 1:
+            return 0
+
+        # Arrivals: `time` after tick j is times[j]
+        times = np.add.accumulate(np.concatenate(([traffic.time], np.full(horizon, dt))))
+        if traffic.next_arrival:
+            horizon = min(horizon, int(np.searchsorted(times[1:], min(traffic.next_arrival))))
+        if horizon < 1:
+            return 0
+
+        plan = self._plan(traffic, light, dt, horizon)
+        if plan is None:
+            return 0
+        ticks, positions, speeds, stopped, delay = plan
+
+        # Outputs of the skipped ticks
+        fleet = traffic.fleet
+        queue_x = np.count_nonzero(stopped[1:] & (fleet.direction == 0), axis=1)
+        queue_y = np.count_nonzero(stopped[1:] & (fleet.direction == 1), axis=1)
+        passed = np.count_nonzero((positions[:-1] < 0) & (positions[1:] >= 0), axis=1)
+        rows = slice(offset, offset + ticks)
+        trace["queue_x"][rows] = queue_x
+        trace["queue_y"][rows] = queue_y
+        trace["passed"][rows] = passed
+        trace["reward"][rows] = [env._reward(int(qx), int(qy), int(p), 0, rl_action)
+                                 for qx, qy, p in zip(queue_x, queue_y, passed)]
+        trace["light_state"][rows] = LIGHT_STATE_CODES[light.state]
+
+        # State after the last skipped tick
+        fleet.pos[:] = positions[ticks]
+        fleet.speed[:] = speeds[ticks]
+        fleet.stopped[:] = stopped[ticks]
+        fleet.delay_timer[:] = delay
+        for _ in range(ticks):
+            light.update(dt, rl_action=rl_action)
+        traffic.time = float(times[ticks])
+        env_times = np.add.accumulate(np.concatenate(([env.time], np.full(ticks, dt))))
+        env.time = float(env_times[ticks])
+        env.step_counter += ticks
+        env.fleet = traffic.fleet
+        self.skipped += ticks
+        self.jumps += 1
+        return ticks
+
+    def _plan(self, traffic, light, dt, horizon):
+        """
+        Trajectories of the vehicles over the next `horizon` ticks if every
+        vehicle keeps the must-stop decision it has in the next tick.
+        Returns (ticks, positions, speeds, stopped, delay): the number of
+        quiet ticks, positions, speeds and stopped flags after each tick
+        (row 0 = now) and the final delay timers; None if the next tick is
+        not quiet.
+        """
+        fleet = traffic.fleet
+        pos = fleet.pos
+        stop_line = -STOP_LINE_DISTANCE
+        before = pos < stop_line
+        if np.any(fleet.is_troublemaker & before):
+            return None
+
+        # The decisions of the next tick, as in VehicleArrays.step (leaders at
+        # their start-of-tick state at first)
+        blocked = before & ~fleet.can_go(light)
+        near = blocked & (stop_line - pos <= APPROACH_DISTANCE)
+        far = blocked & ~near
+        held = blocked & (fleet.strict_stop | near)
+        half_braking = fleet.deceleration * dt * 0.5
+        half_max = fleet.max_speed * 0.5
+        leader = fleet.leaders()
+        followers = np.flatnonzero(leader >= 0)
+        leaders = leader[followers]
+        length = fleet.length[followers]
+        moves_first = fleet.id[leaders] < fleet.id[followers]
+        gap_speed = np.where(far, np.maximum(fleet.speed - half_braking, half_max), fleet.speed)
+        gap = pos[leaders] - pos[followers] - length
+        safe_gap = 7 + gap_speed[followers] * 0.3
+        must_stop = held.copy()
+        must_stop[followers] |= (gap < safe_gap) | (fleet.stopped[leaders] & (gap < safe_gap + 2))
+
+        # With fixed decisions every vehicle follows its own recurrence; run
+        # it until each vehicle's (speed, stopped, delay) repeats. Followers
+        # of leaders that move first see them after the tick, so if that
+        # changes a decision of the first tick, plan again with it
+        for attempt in range(2):
+            speeds, stopped, delays = self._cycle(fleet, dt, far, must_stop, half_braking, half_max, horizon)
+            steps = len(speeds) - 1
+            gap_speeds = np.where(far, np.maximum(speeds[:-1] - half_braking, half_max), speeds[:-1])
+            positions = np.add.accumulate(np.vstack((pos, speeds[1:] * dt)))
+            start, after = positions[:-1], positions[1:]
+            if not followers.size:
+                break
+            lead_pos = np.where(moves_first, after[:, leaders], start[:, leaders])
+            lead_stopped = np.where(moves_first, stopped[1:, leaders], stopped[:-1, leaders])
+            gaps = lead_pos - start[:, followers] - length
+            safe = 7 + gap_speeds[:, followers] * 0.3
+            decision = held[followers] | (gaps < safe) | (lead_stopped & (gaps < safe + 2))
+            if attempt or np.array_equal(decision[0], must_stop[followers]):
+                break
+            must_stop[followers] = decision[0]
+
+        # Events; bad[j - 1] if tick j is not quiet
+        horizon = steps
+        bad = np.zeros(horizon, dtype=bool)
+        if blocked.any():
+            ahead = start[:, blocked]
+            bad |= np.any((ahead >= stop_line) | ((stop_line - ahead <= APPROACH_DISTANCE) != near[blocked]),
+                          axis=1)
+        if followers.size:
+            bad |= np.any(decision != must_stop[followers], axis=1)
+            bad |= np.any(after[:, leaders] - after[:, followers] - length < 0, axis=1)
+        in_conflict = (after < CONFLICT_HALF_WIDTH) & (after + fleet.length > -CONFLICT_HALF_WIDTH)
+        bad |= (np.any(in_conflict[:, fleet.direction == 0], axis=1) &
+                np.any(in_conflict[:, fleet.direction == 1], axis=1))
+        bad |= np.any(after > traffic.exit_pos, axis=1)
+        for k, (direction, lane, _) in enumerate(traffic.streams):
+            if traffic.waiting[k]:
+                in_lane = (fleet.direction == direction) & (fleet.lane == lane)
+                bad |= ~np.any(start[:, in_lane] < traffic.spawn_pos + ENTRY_GAP, axis=1)
+
+        ticks = int(np.argmax(bad)) if bad.any() else horizon
+        if ticks == 0:
+            return None
+        return ticks, positions[:ticks + 1], speeds[:ticks + 1], stopped[:ticks + 1], delays[ticks]
+
+    @staticmethod
+    def _cycle(fleet, dt, far, must_stop, half_braking, half_max, horizon):
+        """
+        Speeds, stopped flags and delay timers after each of the next
+        `horizon` ticks (row 0 = now) under fixed must-stop decisions.
+
+        Vehicles that neither must stop nor coast towards red only
+        accelerate: their speed is min(max_speed, running sum of
+        acceleration * dt). For the others the update is iterated until the
+        state of every vehicle repeats (the delay timer only counts for
+        vehicles that must stop; a queue creeping forward repeats after a
+        few ticks) and later rows are filled in from the cycle. If that
+        takes more than MAX_TRANSIENT ticks, fewer rows are returned.
+        """
+        n = len(fleet)
+        speed_up = fleet.acceleration * dt
+        ticks = np.arange(horizon + 1)[:, None]
+
+        # Iterated vehicles
+        sub = np.flatnonzero(far | must_stop)
+        max_speed, reaction_delay = fleet.max_speed[sub], fleet.reaction_delay[sub]
+        braking, sub_far, sub_stop = fleet.deceleration[sub] * dt, far[sub], must_stop[sub]
+        sub_half_braking, sub_half_max, sub_speed_up = half_braking[sub], half_max[sub], speed_up[sub]
+        speed, stopped, delay = fleet.speed[sub], fleet.stopped[sub], fleet.delay_timer[sub]
+        rows = [(speed, stopped, delay)]
+        settled = np.zeros(len(sub), dtype=bool)
+        first = np.zeros(len(sub), dtype=np.int64)    # first row of the cycle
+        period = np.ones(len(sub), dtype=np.int64)
+        while not settled.all() and len(rows) <= horizon:
+            if len(rows) > MAX_TRANSIENT:
+                horizon = len(rows) - 1
+                ticks = ticks[:horizon + 1]
+                break
+            delay = delay + dt
+            gap_speed = np.where(sub_far, np.maximum(speed - sub_half_braking, sub_half_max), speed)
+            brake = sub_stop & (delay >= reaction_delay)
+            speed = np.where(brake, np.maximum(0, gap_speed - braking),
+                             np.minimum(max_speed, gap_speed + sub_speed_up))
+            stopped = brake & (speed < 0.1)
+            delay = np.where(stopped, 0.0, delay)
+
+            # Compare with the last MAX_PERIOD rows, most recent first
+            recent = rows[:-MAX_PERIOD - 1:-1]
+            repeats = ((np.array([row[0] for row in recent]) == speed) &
+                       (np.array([row[1] for row in recent]) == stopped) &
+                       (~sub_stop | (np.array([row[2] for row in recent]) == delay)))
+            rows.append((speed, stopped, delay))
+            new = ~settled & repeats.any(axis=0)
+            period[new] = np.argmax(repeats[:, new], axis=0) + 1
+            first[new] = len(rows) - 1 - period[new]
+            settled |= new
+
+        index = np.where(settled & (ticks >= first), first + (ticks - first) % period, ticks)
+        speeds = np.empty((horizon + 1, n))
+        stopped_rows = np.zeros((horizon + 1, n), dtype=bool)
+        delays = np.add.accumulate(np.vstack((fleet.delay_timer, np.full((horizon, n), dt))))
+        speeds[:, sub] = np.take_along_axis(np.vstack([row[0] for row in rows]), index, axis=0)
+        stopped_rows[:, sub] = np.take_along_axis(np.vstack([row[1] for row in rows]), index, axis=0)
+        # Vehicles that need not stop never reset their delay timer
+        sub_delays = np.take_along_axis(np.vstack([row[2] for row in rows]), index, axis=0)
+        delays[:, sub] = np.where(sub_stop, sub_delays, delays[:, sub])
+
+        # Accelerating vehicles
+        free = np.flatnonzero(~(far | must_stop))
+        sums = np.add.accumulate(np.vstack((fleet.speed[free], np.full((horizon, len(free)), speed_up[free]))))
+        speeds[:, free] = np.minimum(fleet.max_speed[free], sums)
+        return speeds, stopped_rows, delays
+
+
+def run_scenario(rate, ticks, dt, mode, seed, fast_forward, rl_action=0):
+    """
+    Run an open-boundary IntersectionEnv for `ticks` ticks.
+    Returns (trace, env, seconds, skipped ticks).
+    """
+    from intersection_env import IntersectionEnv
+    env = IntersectionEnv(engine="arrays", arrivals=uniform_arrivals(rate), dt=dt,
+                          sim_duration=ticks * dt)
+    env.reset(seed=seed)
+    env.light.mode = mode
+    runner = FastForward(env, max_window=MAX_WINDOW if fast_forward else 0)
+    start = time.perf_counter()
+    trace = runner.run(ticks, rl_action)
+    return trace, env, time.perf_counter() - start, runner.skipped
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Event-driven fast-forward of open-boundary traffic.")
+    parser.add_argument("--rate", type=float, default=60, help="arrivals per lane (vehicles/hour)")
+    parser.add_argument("--hours", type=float, default=1.0, help="simulated time")
+    parser.add_argument("--dt", type=float, default=0.25)
+    parser.add_argument("--mode", choices=["fixed", "rl"], default="fixed",
+                        help="light mode (rl holds the current phase)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true",
+                        help="also run tick by tick and compare the results")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ticks = int(round(args.hours * 3600 / args.dt))
+    trace, env, seconds, skipped = run_scenario(args.rate, ticks, args.dt, args.mode, args.seed, True)
+    print(f"{ticks} ticks ({args.hours:g} h) in {seconds:.2f} s, "
+          f"{ticks * args.dt / seconds:.0f}x real time, {skipped / ticks:.0%} of the ticks skipped")
+    if args.check:
+        reference, reference_env, reference_seconds, _ = run_scenario(args.rate, ticks, args.dt, args.mode,
+                                                                      args.seed, False)
+        fleet, reference_fleet = env.traffic.fleet, reference_env.traffic.fleet
+        same = (all(np.array_equal(trace[name], reference[name]) for name in trace) and
+                all(np.array_equal(getattr(fleet, name), getattr(reference_fleet, name))
+                    for name in fleet.FIELDS))
+        print(f"tick by tick: {reference_seconds:.2f} s, {ticks * args.dt / reference_seconds:.0f}x real time, "
+              f"results {'identical' if same else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
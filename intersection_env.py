@@ -4,6 +4,10 @@ import numpy as np
 import random
 from vehicle import Vehicle, STOP_LINE_DISTANCE
 from traffic_light import TrafficLight
+from vector_engine import VehicleArrays
+from leader_index import LeaderIndex
+from collision import vehicle_collisions, fleet_collisions
+from open_boundary import OpenBoundaryTraffic
 
 
 class IntersectionEnv(gym.Env):
@@ -20,23 +24,63 @@ class IntersectionEnv(gym.Env):
         - 1: request switch (may trigger yellow and then switch)
 
     Reward:
-        - Negative for queues and crashes
+        - Negative for queues and crashes (every pair of overlapping vehicles)
         - Positive for vehicles successfully passing the intersection
         - Small penalty for switching too often
+
+    Engines:
+        - objects: one Vehicle.move call per vehicle (default)
+        - arrays: VehicleArrays, all vehicles advanced with NumPy per tick;
+          self.vehicles is then only the initial platoon, the live state is self.fleet
+        - jit: like arrays, stepped by the numba-compiled kernels of jit_kernels
+          (same trajectories); the NumPy engine is used when numba is not installed
+
+    frame_skip: if True, the policy is only queried at decision points and
+    one step() advances `action_interval` ticks.
+
+    timer: optional profiling.PhaseTimer; each tick is then split into the
+    light_update, leader_search, move, collision and reward phases.
+
+    arrivals: optional {(direction, lane): arrival process} (see
+    open_boundary) for open-boundary traffic with the arrays or jit engine:
+    vehicles enter continuously, leave past the exit and their slots in a
+    pool of `capacity` vehicles are reused, so episodes can be hours long.
+    `passed` then counts the vehicles that crossed the light during the
+    tick, so each arrival is rewarded once.
+
+    Seeding: reset(seed) seeds the episode; once seeded, later resets
+    without a seed take the next seed from the environment's own random
+    stream, so a run of auto-reset episodes is reproducible.
     """
 
     metadata = {"render.modes": ["human"]}
 
-    def __init__(self, num_vehicles_x=8, num_vehicles_y=8, sim_duration=120, dt=0.25):
+    def __init__(self, num_vehicles_x=8, num_vehicles_y=8, sim_duration=120, dt=0.25,
+                 engine="objects", frame_skip=False, timer=None, arrivals=None, capacity=512):
         super(IntersectionEnv, self).__init__()
+        if engine not in ("objects", "arrays", "jit"):
+            raise ValueError(f"Unknown engine: {engine}")
+        if arrivals is not None and engine == "objects":
+            raise ValueError("Open-boundary traffic needs engine='arrays' or 'jit'")
         self.num_vehicles_x = num_vehicles_x
         self.num_vehicles_y = num_vehicles_y
         self.sim_duration = sim_duration
         self.dt = dt
+        self.engine = engine
+        self.frame_skip = frame_skip
+        self.timer = timer
+        self.arrivals = arrivals
+        self.capacity = capacity
         self.time = 0
+        self.rng = random.Random()  # seeds of the episodes after a seeded reset
+        self.seeded = False
 
         self.light = TrafficLight(position=0, mode="rl")
         self.vehicles = []
+        self.fleet = None
+        self.leader_index = None
+        self.traffic = None
+        self.collisions = []  # (id, id) pairs of vehicles overlapping after the last tick
         self.last_action = 0
         self.action_interval = 8  # agent can act every 8 steps (~2 seconds)
         self.step_counter = 0
@@ -54,47 +98,131 @@ class IntersectionEnv(gym.Env):
         Reset the environment to the initial state.
         """
         super().reset(seed=seed)
+        # After a seeded reset, resets without a seed (auto-resets of a
+        # VecEnv) draw their seed from this environment's own stream
+        if seed is not None:
+            self.rng.seed(seed)
+            self.seeded = True
+        elif self.seeded:
+            seed = self.rng.getrandbits(32)
         random.seed(seed)
         self.time = 0
         self.step_counter = 0
         self.light = TrafficLight(position=0, mode="rl")
+        self.collisions = []
+        if self.arrivals is not None:
+            self.vehicles = []
+            self.traffic = OpenBoundaryTraffic(self.arrivals, self.capacity, seed=seed,
+                                               vehicle_cls=self._vehicle_cls())
+            self.fleet = self.traffic.fleet
+            return self._get_obs(), {}
         self.vehicles = self._generate_vehicles()
+        if self.engine in ("arrays", "jit"):
+            self.fleet = self._vehicle_cls().from_vehicles(self.vehicles)
+        else:
+            self.leader_index = LeaderIndex(self.vehicles)
         return self._get_obs(), {}
 
     def step(self, action):
         """
         Perform one simulation step.
+
+        With frame_skip, one step covers `action_interval` ticks: the action
+        is applied to all of them, the rewards and crashes are summed, the
+        collisions of every tick are collected and the info dict carries
+        per-tick queue traces.
         """
-        self.time += self.dt
-        self.step_counter += 1
-        done = self.time >= self.sim_duration
+        if self.frame_skip:
+            return self._step_frames(action)
 
         # Apply action only every `action_interval` steps
         rl_action = self.last_action
-        if self.step_counter % self.action_interval == 0:
+        if (self.step_counter + 1) % self.action_interval == 0:
             rl_action = action
             self.last_action = action
 
+        queue_x, queue_y, passed, crashes, reward, done = self._tick(rl_action)
+
+        obs = self._get_obs(queue_x, queue_y)
+        info = {"queue_x": queue_x, "queue_y": queue_y, "crashes": crashes, "passed": passed,
+                "collisions": self.collisions}
+        return obs, reward, done, False, info
+
+    def _step_frames(self, action):
+        """
+        Advance `action_interval` ticks with one decision (frame-skip mode).
+        """
+        self.last_action = action
+        total_reward, trace_x, trace_y, collisions = 0, [], [], []
+        crashes = passed = 0
+        for _ in range(self.action_interval):
+            queue_x, queue_y, passed, tick_crashes, reward, done = self._tick(action)
+            total_reward += reward
+            crashes += tick_crashes
+            collisions.extend(self.collisions)
+            trace_x.append(queue_x)
+            trace_y.append(queue_y)
+            if done:
+                break
+
+        obs = self._get_obs(queue_x, queue_y)
+        info = {"queue_x": queue_x, "queue_y": queue_y, "crashes": crashes, "passed": passed,
+                "collisions": collisions, "queue_x_trace": trace_x, "queue_y_trace": trace_y}
+        return obs, total_reward, done, False, info
+
+    def _tick(self, rl_action):
+        """
+        Advance the simulation by one dt with the given light action.
+        Returns queue_x, queue_y, passed, crashes, reward, done.
+        """
+        timer = self.timer
+        if timer is not None:
+            timer.start()
+        self.time += self.dt
+        self.step_counter += 1
+        done = self.time >= self.sim_duration
+
         self.light.update(self.dt, rl_action=rl_action)
+        if timer is not None:
+            timer.mark("light_update")
 
-        crashes, queue_x, queue_y, passed = 0, 0, 0, 0
+        if self.traffic is not None:
+            queue_x, queue_y, passed, crashes = self._step_open(timer)
+        elif self.fleet is not None:
+            queue_x, queue_y, passed, crashes = self._step_arrays(timer)
+        else:
+            queue_x, queue_y, passed, crashes = self._step_objects(timer)
 
-        for v in self.vehicles:
-            if v.direction == "x":
-                front = min(
-                    [ov for ov in self.vehicles if ov.direction == "x" and ov.x > v.x],
-                    key=lambda x: x.x,
-                    default=None,
-                )
-            else:
-                front = min(
-                    [ov for ov in self.vehicles if ov.direction == "y" and ov.y > v.y],
-                    key=lambda x: x.y,
-                    default=None,
-                )
+        reward = self._reward(queue_x, queue_y, passed, crashes, rl_action)
+        if timer is not None:
+            timer.mark("reward")
+
+        return queue_x, queue_y, passed, crashes, reward, done
 
+    @staticmethod
+    def _reward(queue_x, queue_y, passed, crashes, rl_action):
+        """
+        Reward of one tick.
+        """
+        reward = - (queue_x + queue_y) - 10 * crashes + 3 * passed
+        if rl_action == 1:
+            reward -= 2  # penalty for frequent switching
+        return reward
+
+    def _step_objects(self, timer=None):
+        """
+        Move every Vehicle object once and collect queue, pass and crash counts.
+        """
+        queue_x, queue_y, passed = 0, 0, 0
+        self.leader_index.refresh()
+        fronts = [self.leader_index.leader(v) for v in self.vehicles]
+        if timer is not None:
+            timer.mark("leader_search")
+
+        for v, front in zip(self.vehicles, fronts):
             v.move(self.dt, front_vehicle=front, light=self.light, light_pos=0)
 
+        for v in self.vehicles:
             if v.stopped:
                 if v.direction == "x":
                     queue_x += 1
@@ -103,53 +231,106 @@ class IntersectionEnv(gym.Env):
 
             if (v.direction == "x" and v.x >= 0) or (v.direction == "y" and v.y >= 0):
                 passed += 1
+        if timer is not None:
+            timer.mark("move")
 
-        # Detect collisions (two vehicles in the same position)
-        positions = [(round(v.x, 1), round(v.y, 1)) for v in self.vehicles]
-        if len(positions) != len(set(positions)):
-            crashes += 1
+        # Detect collisions (overlapping vehicle footprints)
+        self.collisions = vehicle_collisions(self.vehicles)
+        crashes = len(self.collisions)
+        if timer is not None:
+            timer.mark("collision")
 
-        # Reward function
-        reward = - (queue_x + queue_y) - 10 * crashes + 3 * passed
-        if rl_action == 1:
-            reward -= 2  # penalty for frequent switching
+        return queue_x, queue_y, passed, crashes
 
-        obs = self._get_obs(queue_x, queue_y)
-        info = {"queue_x": queue_x, "queue_y": queue_y, "crashes": crashes, "passed": passed}
-        return obs, reward, done, False, info
+    def _step_arrays(self, timer=None):
+        """
+        Advance the VehicleArrays fleet and collect the same counts as _step_objects.
+        """
+        fleet = self.fleet
+        leader = fleet.leaders()
+        if timer is not None:
+            timer.mark("leader_search")
+        fleet.step(self.dt, light=self.light, light_pos=0, leader=leader)
+        queue_x, queue_y = fleet.queue_counts()
+        passed = int(np.count_nonzero(fleet.pos >= 0))
+        if timer is not None:
+            timer.mark("move")
 
-    def _generate_vehicles(self):
+        # Detect collisions (overlapping vehicle footprints)
+        i, j = fleet_collisions(fleet)
+        self.collisions = list(zip(fleet.id[i].tolist(), fleet.id[j].tolist()))
+        crashes = len(self.collisions)
+        if timer is not None:
+            timer.mark("collision")
+
+        return queue_x, queue_y, passed, crashes
+
+    def _step_open(self, timer=None):
         """
-        Generate initial vehicles for both X and Y directions.
-        Includes one random "troublemaker" vehicle.
+        Advance the open-boundary traffic and collect the same counts as _step_arrays.
         """
-        vehicles, vid = [], 0
-        troublemaker_id = random.randint(0, self.num_vehicles_x + self.num_vehicles_y - 1)
+        passed = self.traffic.step(self.dt, self.light, light_pos=0, timer=timer)
+        fleet = self.fleet = self.traffic.fleet
+        queue_x, queue_y = fleet.queue_counts()
+
+        i, j = fleet_collisions(fleet)
+        self.collisions = list(zip(fleet.id[i].tolist(), fleet.id[j].tolist()))
+        crashes = len(self.collisions)
+        if timer is not None:
+            timer.mark("collision")
 
-        for lane in [-3, +3]:
-            pos = -60
-            for _ in range(self.num_vehicles_x // 2):
-                v = Vehicle(vid, "x", pos, lane, vid == troublemaker_id)
-                vehicles.append(v)
-                pos -= random.randint(15, 25)
-                vid += 1
+        return queue_x, queue_y, passed, crashes
 
-        for lane in [-3, +3]:
-            pos = -60
-            for _ in range(self.num_vehicles_y // 2):
-                v = Vehicle(vid, "y", pos, lane, vid == troublemaker_id)
-                vehicles.append(v)
-                pos -= random.randint(15, 25)
-                vid += 1
+    def _vehicle_cls(self):
+        """
+        Fleet class of the arrays and jit engines.
+        """
+        if self.engine == "jit":
+            from jit_kernels import engine_classes
+            return engine_classes()[0]
+        return VehicleArrays
 
-        return vehicles
+    def _generate_vehicles(self):
+        """
+        Generate initial vehicles for both X and Y directions.
+        """
+        return generate_vehicles(self.num_vehicles_x, self.num_vehicles_y)
 
     def _get_obs(self, queue_x=None, queue_y=None):
         """
         Construct the observation vector: [queue_x, queue_y, light_state].
         """
-        if queue_x is None or queue_y is None:
+        if (queue_x is None or queue_y is None) and self.fleet is not None:
+            queue_x, queue_y = self.fleet.queue_counts()
+        elif queue_x is None or queue_y is None:
             queue_x = sum(1 for v in self.vehicles if v.direction == "x" and v.stopped)
             queue_y = sum(1 for v in self.vehicles if v.direction == "y" and v.stopped)
         state_num = 0 if self.light.state.startswith("green_x") else 1
         return np.array([queue_x, queue_y, state_num], dtype=np.float32)
+
+
+def generate_vehicles(num_vehicles_x, num_vehicles_y):
+    """
+    Generate the initial platoons for both X and Y directions.
+    Includes one random "troublemaker" vehicle.
+    """
+    vehicles, vid = [], 0
+    troublemaker_id = random.randint(0, num_vehicles_x + num_vehicles_y - 1)
+
+    for lane in [-3, +3]:
+        pos = -60
+        for _ in range(num_vehicles_x // 2):
+            v = Vehicle(vid, "x", pos, lane, vid == troublemaker_id)
+            vehicles.append(v)
+            pos -= random.randint(15, 25)
+            vid += 1
+
+    for lane in [-3, +3]:
+        pos = -60
+        for _ in range(num_vehicles_y // 2):
+            v = Vehicle(vid, "y", pos, lane, vid == troublemaker_id)
+            vehicles.append(v)
+            pos -= random.randint(15, 25)
+            vid += 1
+
+    return vehicles
@@ -0,0 +1,423 @@
+import argparse
+import contextlib
+import random
+import time
+import numpy as np
+from vehicle import STOP_LINE_DISTANCE, APPROACH_DISTANCE
+from vector_engine import VehicleArrays, LightArrays, LIGHT_MODES
+
+try:
+    from numba import njit
+except ImportError:   # optional dependency: the NumPy engine is used instead
+    njit = None
+
+# True when the kernels are compiled (numba installed)
+AVAILABLE = njit is not None
+
+
+def _jit(func):
+    """
+    Compile a kernel with numba in nopython mode; without numba the
+    function stays plain Python (slow, only used by the --check run).
+    """
+    return njit(cache=True, nogil=True)(func) if AVAILABLE else func
+
+
+# --- Kernels ---
+
+@_jit
+def _step_kernel(dt, order, pos, speed, max_speed, length, acceleration, deceleration, reaction_delay,
+                 delay_timer, stopped, strict_stop, stop_line, use_light, can_go, leader, draws,
+                 known, known_pos, known_speed, known_stopped):
+    """
+    VehicleArrays.step as one loop over the fleet in id order, so a
+    leader with a lower id has already moved when its follower looks at
+    it, like in the object loop. Vehicles with known[i] >= 0 take the
+    end-of-tick state known_*[known[i]] instead of moving.
+    """
+    for i in order:
+        delay_timer[i] += dt
+        k = known[i]
+        if k >= 0:
+            pos[i] = known_pos[k]
+            speed[i] = known_speed[k]
+            stopped[i] = known_stopped[k]
+            if stopped[i]:
+                delay_timer[i] = 0.0
+            continue
+        must_stop = False
+
+        # --- Traffic light check ---
+        if use_light and pos[i] < stop_line[i] and not can_go[i]:
+            if strict_stop[i]:
+                must_stop = True
+            if stop_line[i] - pos[i] <= APPROACH_DISTANCE:
+                must_stop = True
+            else:
+                speed[i] = max(speed[i] - deceleration[i] * dt * 0.5, max_speed[i] * 0.5)
+
+        # --- Leading vehicle check ---
+        front = leader[i]
+        if front >= 0:
+            gap = pos[front] - pos[i] - length[i]
+            safe_gap = 7 + speed[i] * 0.3
+            if gap < safe_gap or (stopped[front] and gap < safe_gap + 2):
+                must_stop = True
+
+        # --- Reaction delay ---
+        if must_stop and delay_timer[i] >= reaction_delay[i]:
+            speed[i] = max(0.0, speed[i] - deceleration[i] * dt)
+            stopped[i] = speed[i] < 0.1
+        else:
+            speed[i] = min(max_speed[i], speed[i] + acceleration[i] * dt)
+            stopped[i] = False
+
+        # --- Random braking for troublemaker vehicles ---
+        if draws[i] < 0.01:
+            speed[i] = max(0.0, speed[i] - deceleration[i] * dt)
+
+        # --- Position update ---
+        pos[i] += speed[i] * dt
+        if stopped[i]:
+            delay_timer[i] = 0.0
+
+
+@_jit
+def _after(a, b, instance, direction, lane, pos):
+    """
+    True if vehicle a comes after vehicle b in lane order (instance,
+    direction, lane, position, then fleet index).
+    """
+    if instance[a] != instance[b]:
+        return instance[a] > instance[b]
+    if direction[a] != direction[b]:
+        return direction[a] > direction[b]
+    if lane[a] != lane[b]:
+        return lane[a] > lane[b]
+    if pos[a] != pos[b]:
+        return pos[a] > pos[b]
+    return a > b
+
+
+@_jit
+def _sort_kernel(order, instance, direction, lane, pos):
+    """
+    Insertion sort of the fleet indices in lane order; linear time when
+    the order of the previous tick is still almost right.
+    """
+    for i in range(1, len(order)):
+        v = order[i]
+        j = i - 1
+        while j >= 0 and _after(order[j], v, instance, direction, lane, pos):
+            order[j + 1] = order[j]
+            j -= 1
+        order[j + 1] = v
+
+
+@_jit
+def _leaders_kernel(order, instance, direction, lane, pos, leader):
+    """
+    Leaders from the sorted order: walking from the front of every lane,
+    each run of vehicles at one position is led by the first vehicle of
+    the run ahead of it.
+    """
+    following = -1   # sorted index where the run ahead starts
+    i = len(order) - 1
+    while i >= 0:
+        v = order[i]
+        start = i
+        while start > 0:
+            w = order[start - 1]
+            if (instance[w] != instance[v] or direction[w] != direction[v] or lane[w] != lane[v]
+                    or pos[w] != pos[v]):
+                break
+            start -= 1
+        ahead = -1
+        if following >= 0:
+            f = order[following]
+            if instance[f] == instance[v] and direction[f] == direction[v] and lane[f] == lane[v]:
+                ahead = f
+        for k in range(start, i + 1):
+            leader[order[k]] = ahead
+        following = start
+        i = start - 1
+
+
+@_jit
+def _light_kernel(dt, mode, state, timer, green_timer, yellow_timer, red_timer, queue_x, queue_y,
+                  action, has_action, cycle_time, min_green_time, yellow_duration, max_red_time):
+    """
+    LightArrays.update (TrafficLight.update rules) one light at a time.
+    """
+    for k in range(len(state)):
+        timer[k] += dt
+        green_timer[k] += dt
+
+        # Handle yellow phase transition
+        s = state[k]
+        if s == 1 or s == 3:
+            yellow_timer[k] += dt
+            if yellow_timer[k] >= yellow_duration:
+                state[k] = (s + 1) % 4
+                green_timer[k] = 0.0
+            continue
+
+        switch = False
+        if mode[k] == 0:
+            if timer[k] >= cycle_time:
+                switch = True
+                timer[k] = 0.0
+        elif mode[k] == 1:
+            if green_timer[k] >= min_green_time:
+                if s == 0 and queue_y[k] - queue_x[k] >= 2:
+                    switch = True
+                elif s == 2 and queue_x[k] - queue_y[k] >= 2:
+                    switch = True
+        elif has_action[k]:
+            if action[k] == 0:
+                red_timer[k] += dt
+            else:
+                red_timer[k] = 0.0
+            if action[k] == 1 and green_timer[k] >= min_green_time:
+                switch = True
+            elif red_timer[k] >= max_red_time:
+                switch = True
+                red_timer[k] = 0.0
+
+        # Start the yellow phase before switching directions
+        if switch:
+            yellow_timer[k] = 0.0
+            state[k] = s + 1
+
+
+KERNELS = ("_step_kernel", "_after", "_sort_kernel", "_leaders_kernel", "_light_kernel")
+
+
+@contextlib.contextmanager
+def python_kernels():
+    """
+    Run the kernels as plain Python (numba's py_func) inside the block,
+    to check the compiled code against its source.
+    """
+    compiled = {name: globals()[name] for name in KERNELS}
+    globals().update({name: getattr(kernel, "py_func", kernel) for name, kernel in compiled.items()})
+    try:
+        yield
+    finally:
+        globals().update(compiled)
+
+
+# --- Engines ---
+
+class JitVehicleArrays(VehicleArrays):
+    """
+    VehicleArrays stepped by the compiled kernels: one loop over the
+    fleet instead of a series of masked array operations, and a leader
+    search that keeps the lane order of the previous tick (see
+    LeaderIndex) instead of sorting the fleet again.
+
+    Same rules, same random draws and the same floating-point operations
+    as VehicleArrays, so both engines give identical trajectories (see
+    `python jit_kernels.py --check`).
+    """
+
+    def __init__(self, n=0):
+        super().__init__(n)
+        # Fleet indices in lane order at the last leaders() call and in id
+        # order; sorted again only when the number of vehicles changed.
+        # VehiclePool keeps both for the pooled fleets of open-boundary traffic.
+        self.lane_order = None
+        self.id_order = None
+
+    def leaders(self):
+        n = len(self.pos)
+        if self.lane_order is None or len(self.lane_order) != n:
+            self.lane_order = np.lexsort([self.pos, self.lane, self.direction, self.instance])
+        else:
+            _sort_kernel(self.lane_order, self.instance, self.direction, self.lane, self.pos)
+        leader = np.empty(n, dtype=np.int64)
+        _leaders_kernel(self.lane_order, self.instance, self.direction, self.lane, self.pos, leader)
+        return leader
+
+    def step(self, dt, light=None, light_pos=0, can_go=None, rngs=None, leader=None, uniforms=None,
+             known=None):
+        n = len(self.pos)
+        if n == 0:
+            return
+        if self.id_order is None or len(self.id_order) != n:
+            self.id_order = np.argsort(self.id, kind="stable")
+        stop_line = np.asarray(light_pos, dtype=np.float64) - STOP_LINE_DISTANCE
+        stop_line = np.ascontiguousarray(np.broadcast_to(stop_line, n))
+        if light is not None:
+            can_go = self.can_go(light)
+        use_light = can_go is not None
+        can_go = np.ascontiguousarray(np.broadcast_to(can_go if use_light else True, n))
+        if leader is None:
+            leader = self.leaders()
+
+        # Troublemaker draws in the order VehicleArrays.step takes them
+        draws = np.ones(n)
+        candidates = np.flatnonzero(self.is_troublemaker & (self.pos < stop_line))
+        if candidates.size:
+            if uniforms is not None:
+                draws[candidates] = uniforms[candidates]
+            elif rngs is None:
+                draws[candidates] = [random.random() for _ in range(candidates.size)]
+            else:
+                draws[candidates] = [rngs[i].random() for i in self.instance[candidates]]
+
+        # Vehicles moved elsewhere (see VehicleArrays.step)
+        fixed = np.full(n, -1, dtype=np.int64)
+        if known is None:
+            known_pos = known_speed = np.zeros(0)
+            known_stopped = np.zeros(0, dtype=np.bool_)
+        else:
+            indices, known_pos, known_speed, known_stopped = known
+            fixed[indices] = np.arange(len(indices))
+            known_pos = np.asarray(known_pos, dtype=np.float64)
+            known_speed = np.asarray(known_speed, dtype=np.float64)
+            known_stopped = np.asarray(known_stopped, dtype=np.bool_)
+
+        _step_kernel(float(dt), self.id_order, self.pos, self.speed, self.max_speed,
+                     self.length, self.acceleration, self.deceleration, self.reaction_delay,
+                     self.delay_timer, self.stopped, self.strict_stop, stop_line, use_light, can_go, leader,
+                     draws, fixed, known_pos, known_speed, known_stopped)
+
+
+class JitLightArrays(LightArrays):
+    """
+    LightArrays updated by the compiled kernel. rl_table actions are
+    looked up with NumPy before the kernel runs.
+    """
+
+    def update(self, dt, rl_action=None):
+        n = len(self.state)
+        action = np.zeros(n, dtype=np.int64)
+        has_action = np.zeros(n, dtype=np.bool_)
+        if rl_action is not None:
+            action[:] = rl_action
+            has_action |= self.mode == 2
+        table = self.mode == 3
+        if table.any():
+            action[table] = self.policy_table.lookup(self.queue_x[table], self.queue_y[table],
+                                                     self.light_state_numbers()[table])
+            has_action |= table
+        _light_kernel(float(dt), self.mode, self.state, self.timer, self.green_timer, self.yellow_timer,
+                      self.red_timer, self.queue_x, self.queue_y, action, has_action,
+                      float(self.cycle_time), float(self.min_green_time), float(self.yellow_duration),
+                      float(self.max_red_time))
+
+
+def engine_classes():
+    """
+    (vehicle arrays, light arrays) classes to use: the compiled engine
+    when numba is installed, the NumPy one otherwise.
+    """
+    if AVAILABLE:
+        return JitVehicleArrays, JitLightArrays
+    return VehicleArrays, LightArrays
+
+
+# --- Equivalence check and benchmark ---
+
+def run_engine(vehicle_cls, light_cls, num_vehicles, instances, ticks, dt=0.5, seed=0, table=None):
+    """
+    Simulate `instances` copies of the closed scenario (one light per
+    instance, modes cycling through fixed, adaptive, rl with random
+    actions and, given a PolicyTable, rl_table) and yield the state after
+    every tick.
+    """
+    from intersection_env import generate_vehicles
+
+    random.seed(seed)
+    base = VehicleArrays.from_vehicles(generate_vehicles(num_vehicles // 2, num_vehicles - num_vehicles // 2))
+    fleet = vehicle_cls(0)
+    for name in VehicleArrays.FIELDS:
+        setattr(fleet, name, np.tile(getattr(base, name), instances))
+    fleet.instance = np.repeat(np.arange(instances), len(base))
+    lights = light_cls(instances)
+    lights.mode[:] = np.arange(instances) % (3 if table is None else 4)
+    lights.policy_table = table
+
+    rng = np.random.default_rng(seed)
+    rngs = [random.Random(seed + i) for i in range(instances)]
+    for tick in range(ticks):
+        lights.receive_counts(*fleet.queue_counts_by_instance(instances))
+        lights.update(dt, rl_action=rng.integers(0, 2, instances))
+        can_go = lights.can_go(fleet.instance, fleet.direction)
+        uniforms = rng.random(len(fleet)) if tick % 2 else None   # both draw paths
+        fleet.step(dt, can_go=can_go, rngs=rngs, uniforms=uniforms)
+        yield fleet, lights
+
+
+def check_engines(num_vehicles=64, instances=8, ticks=400, table=None, compiled=True):
+    """
+    Compare the NumPy and the JIT engine tick by tick; returns the first
+    tick where the leaders, a vehicle or a light state differ, or None.
+    With compiled=False the kernels run as plain Python.
+    """
+    states = ("pos", "speed", "stopped", "delay_timer")
+    lights = ("state", "timer", "green_timer", "yellow_timer", "red_timer")
+    with contextlib.nullcontext() if compiled else python_kernels():
+        for tick, ((a, la), (b, lb)) in enumerate(zip(
+                run_engine(VehicleArrays, LightArrays, num_vehicles, instances, ticks, table=table),
+                run_engine(JitVehicleArrays, JitLightArrays, num_vehicles, instances, ticks, table=table))):
+            if not np.array_equal(a.leaders(), b.leaders()):
+                return tick
+            if not all(np.array_equal(getattr(a, n), getattr(b, n)) for n in states):
+                return tick
+            if not all(np.array_equal(getattr(la, n), getattr(lb, n)) for n in lights):
+                return tick
+    return None
+
+
+def bench_engine(vehicle_cls, light_cls, num_vehicles, ticks):
+    """
+    Seconds per tick (leader search, vehicles and lights) on one instance.
+    """
+    steps = run_engine(vehicle_cls, light_cls, num_vehicles, 1, ticks + 1)
+    next(steps)   # compilation and setup
+    start = time.perf_counter()
+    for _ in steps:
+        pass
+    return (time.perf_counter() - start) / ticks
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="JIT-compiled vehicle and light kernels.")
+    parser.add_argument("--check", action="store_true", help="compare trajectories with the NumPy engine")
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[256, 4096, 65536])
+    parser.add_argument("--ticks", type=int, default=100)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not AVAILABLE:
+        print("numba is not installed: the kernels run as plain Python "
+              "(engine_classes() returns the NumPy engine).")
+
+    if args.check:
+        from compile_policy import PolicyTable
+        try:
+            table = PolicyTable.load()
+        except OSError:
+            table = None
+        modes = LIGHT_MODES[:3 if table is None else 4]
+        # Without numba both runs would be the same plain Python code
+        for compiled in ((True, False) if AVAILABLE else (False,)):
+            tick = check_engines(table=table, compiled=compiled)
+            kernels = "compiled" if compiled else "plain Python"
+            print(f"Modes {', '.join(modes)}, {kernels} kernels: " +
+                  ("identical trajectories" if tick is None else f"engines differ at tick {tick}"))
+        return
+
+    for n in args.vehicles:
+        numpy_time = bench_engine(VehicleArrays, LightArrays, n, args.ticks)
+        jit_time = bench_engine(JitVehicleArrays, JitLightArrays, n, args.ticks)
+        print(f"{n:6d} vehicles: numpy {numpy_time * 1e3:8.3f} ms/tick, jit {jit_time * 1e3:8.3f} ms/tick "
+              f"({numpy_time / jit_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from bisect import bisect_right
+
+
+def longitudinal_position(vehicle):
+    """
+    Position of a vehicle along its direction of travel.
+    """
+    return vehicle.x if vehicle.direction == "x" else vehicle.y
+
+
+class LeaderIndex:
+    """
+    Leader lookup for Vehicle objects, keyed by (direction, lane).
+
+    Every lane keeps its vehicles sorted by longitudinal position (back to
+    front). Since vehicles in a lane almost never change order between ticks,
+    refresh() restores the order with an insertion sort, which is O(n) when
+    nothing overtook, and then stores each vehicle's leader so that leader()
+    is a single dict lookup.
+
+    The leader is the closest vehicle in the same lane that is strictly ahead,
+    like the old list search but without following cars in the other lane.
+    """
+
+    def __init__(self, vehicles=()):
+        self.lanes = {}    # (direction, lane) -> vehicles sorted back to front
+        self._front = {}   # vehicle id -> leading vehicle (or None)
+        for v in vehicles:
+            self.add(v)
+        self.refresh()
+
+    def add(self, vehicle):
+        """
+        Insert a vehicle into its lane at the right position.
+        """
+        lane = self.lanes.setdefault((vehicle.direction, vehicle.lane), [])
+        pos = longitudinal_position(vehicle)
+        lane.insert(bisect_right(lane, pos, key=longitudinal_position), vehicle)
+
+    def remove(self, vehicle):
+        """
+        Remove a vehicle (e.g. one that left the simulation) from its lane.
+        """
+        self.lanes[(vehicle.direction, vehicle.lane)].remove(vehicle)
+        self._front.pop(vehicle.id, None)
+
+    def refresh(self):
+        """
+        Restore the order after the vehicles moved and rebuild the leader pointers.
+        """
+        for lane in self.lanes.values():
+            _insertion_sort(lane)
+
+            # Walk from the front; vehicles at the same position do not lead each other
+            ahead, group_front, group_pos = None, None, None
+            for v in reversed(lane):
+                pos = longitudinal_position(v)
+                if pos != group_pos:
+                    ahead = group_front
+                    group_front, group_pos = v, pos
+                self._front[v.id] = ahead
+
+    def leader(self, vehicle):
+        """
+        Leading vehicle in the same lane, or None if the lane ahead is empty.
+        """
+        return self._front.get(vehicle.id)
+
+
+def _insertion_sort(lane):
+    """
+    Sort a lane in place by position; linear time for an almost sorted lane.
+    """
+    for i in range(1, len(lane)):
+        v = lane[i]
+        pos = longitudinal_position(v)
+        j = i - 1
+        while j >= 0 and longitudinal_position(lane[j]) > pos:
+            lane[j + 1] = lane[j]
+            j -= 1
+        lane[j + 1] = v
@@ -0,0 +1,311 @@
+import numpy as np
+
+
+def format_summary(label, avg_queue, avg_speed, avg_speed_x, avg_speed_y):
+    """
+    One line of the performance summary printed by analyze_log.
+    """
+    return (f"{label:<15}| Avg Queue: {avg_queue:.2f}, Avg Speed Total: {avg_speed:.2f} m/s "
+            f"(X: {avg_speed_x:.2f}, Y: {avg_speed_y:.2f})")
+
+
+def _add_counts(hist, bins):
+    """
+    Add one count per bin index to a histogram, growing it when needed.
+    """
+    top = max(bins)
+    if top >= len(hist):
+        hist = np.concatenate([hist, np.zeros(max(top + 1, 2 * len(hist)) - len(hist), dtype=np.int64)])
+    np.add.at(hist, bins, 1)
+    return hist
+
+
+class OnlineMetrics:
+    """
+    Performance metrics accumulated while the simulation runs.
+
+    record_tick() takes the per-tick aggregates (queue lengths, speed sums
+    and vehicle counts per direction) and does O(1) work, so the summary of
+    analyze_log is available without writing a trajectory log:
+        - running means of the total queue and of the per-tick mean speeds
+          (overall and per direction), averaged over ticks like compute_metrics
+        - a time series averaged over buckets of `resolution` seconds
+        - histograms of the queue length per direction (ticks per length)
+        - vehicle delays: time lost against driving at max speed until the
+          vehicle passes the light, as a total and a histogram (vehicles per
+          whole second)
+    observe() and observe_fleet() compute the aggregates from Vehicle
+    objects or a VehicleArrays fleet (vehicle ids must be unique). A
+    vehicle's delay is only kept while it is before the light; once it has
+    passed or is gone from the vehicles, it moves into the totals. The
+    running delays live in arrays indexed by vehicle id (grown by
+    doubling), so a tick does no sorting or searching.
+
+    With a V2IBus, attach(bus) before the first tick and observe_bus()
+    afterwards: the queues, speed sums and counts come from the bus
+    counters in O(lanes), and the bus tells the metrics when a vehicle
+    enters, passes the light or leaves, so a delay is computed once per
+    vehicle from its ticks and distance driven (the same sum of
+    dt * (1 - speed / max_speed) over its ticks).
+    """
+
+    def __init__(self, dt, resolution=1.0, light_pos=0):
+        self.dt = dt
+        self.resolution = resolution
+        self.light_pos = light_pos
+        self.ticks = 0
+
+        # Running sums for the means
+        self.queue_total_sum = 0
+        self.speed_mean_sums = {"total": 0.0, "x": 0.0, "y": 0.0}
+        self.speed_ticks = {"total": 0, "x": 0, "y": 0}
+
+        # Queue length histograms per direction
+        self.queue_hist = {"x": np.zeros(16, dtype=np.int64), "y": np.zeros(16, dtype=np.int64)}
+
+        # Delays (seconds), indexed by vehicle id: running totals of the
+        # vehicles before the light (observe) or the tick and position they
+        # started from (observe_bus), and the aggregate of the finished ones
+        self._delays = np.zeros(64)
+        self._start_tick = np.zeros(64, dtype=np.int64)
+        self._tracked = np.zeros(64, dtype=bool)
+        self._last_seen = np.full(64, -1, dtype=np.int64)
+        self._tracked_ids = np.zeros(0, dtype=np.int64)
+        self._bus = None
+        self.delay_sum = 0.0
+        self.delay_count = 0
+        self.delay_hist = np.zeros(16, dtype=np.int64)
+
+        # Time series buckets
+        self.series = {"time": [], "queue_x": [], "queue_y": [], "speed": []}
+        self._bucket = None
+        self._bucket_sums = [0.0, 0.0, 0.0, 0]   # queue_x, queue_y, mean speed, ticks
+
+    def record_tick(self, t, queue_x, queue_y, speed_sum_x, count_x, speed_sum_y, count_y):
+        """
+        Add one tick given its aggregates.
+        """
+        self.ticks += 1
+        self.queue_total_sum += queue_x + queue_y
+        self._add_speed("x", speed_sum_x, count_x)
+        self._add_speed("y", speed_sum_y, count_y)
+        mean_speed = self._add_speed("total", speed_sum_x + speed_sum_y, count_x + count_y)
+
+        for direction, queue in (("x", queue_x), ("y", queue_y)):
+            self.queue_hist[direction] = _add_counts(self.queue_hist[direction], [queue])
+
+        bucket = int(round(t / self.resolution, 9) // 1)
+        if bucket != self._bucket:
+            self._flush_bucket()
+            self._bucket = bucket
+        sums = self._bucket_sums
+        sums[0] += queue_x
+        sums[1] += queue_y
+        sums[2] += mean_speed if mean_speed is not None else 0.0
+        sums[3] += 1
+
+    def observe(self, t, vehicles):
+        """
+        Aggregate a list of Vehicle objects for time t and record the tick.
+        """
+        queue = {"x": 0, "y": 0}
+        speed_sum = {"x": 0.0, "y": 0.0}
+        count = {"x": 0, "y": 0}
+        ids, pos, speed, max_speed = [], [], [], []
+        for v in vehicles:
+            count[v.direction] += 1
+            speed_sum[v.direction] += v.speed
+            if v.stopped:
+                queue[v.direction] += 1
+            ids.append(v.id)
+            pos.append(v.x if v.direction == "x" else v.y)
+            speed.append(v.speed)
+            max_speed.append(v.max_speed)
+        self._add_delays(np.array(ids, dtype=np.int64), np.array(pos),
+                         np.array(speed) / np.array(max_speed))
+        self.record_tick(t, queue["x"], queue["y"], speed_sum["x"], count["x"],
+                         speed_sum["y"], count["y"])
+
+    def observe_fleet(self, t, fleet):
+        """
+        Aggregate a VehicleArrays fleet for time t and record the tick.
+        """
+        is_x = fleet.direction == 0
+        queue_x, queue_y = fleet.queue_counts()
+        self._add_delays(fleet.id.astype(np.int64), fleet.pos, fleet.speed / fleet.max_speed)
+        count_x = int(np.count_nonzero(is_x))
+        self.record_tick(t, queue_x, queue_y, float(fleet.speed[is_x].sum()), count_x,
+                         float(fleet.speed[~is_x].sum()), len(fleet) - count_x)
+
+    def attach(self, bus):
+        """
+        Take the delays of the vehicles on a V2IBus from its events; call
+        before the first tick (the registered vehicles start now).
+        """
+        self._bus = bus
+        bus.listener = self
+        for v in bus.vehicles.values():
+            self.vehicle_added(v)
+
+    def observe_bus(self, t, bus):
+        """
+        Record the tick for time t from the counters of the attached V2IBus.
+        """
+        self.record_tick(t, bus.queue("x"), bus.queue("y"), bus.speed_sum("x"), bus.vehicle_count("x"),
+                         bus.speed_sum("y"), bus.vehicle_count("y"))
+
+    def vehicle_added(self, v):
+        """
+        Bus event: start the delay of a vehicle before the light.
+        """
+        pos = v.x if v.direction == "x" else v.y
+        if pos < self.light_pos:
+            self._grow(v.id + 1)
+            self._tracked[v.id] = True
+            self._start_tick[v.id] = self.ticks
+            self._delays[v.id] = pos / v.max_speed
+
+    def vehicle_passed(self, v):
+        """
+        Bus event: a vehicle passed the light during the current tick.
+        """
+        # Like observe(), a vehicle that passes on its first tick is not counted
+        if self._untrack(v.id) and self._start_tick[v.id] < self.ticks:
+            self._finish(np.array([self._bus_delay(v, self.ticks + 1)]))
+
+    def vehicle_removed(self, v):
+        """
+        Bus event: a vehicle left after its move, before the tick is recorded;
+        like observe(), its delay ends with the last recorded tick.
+        """
+        if self._untrack(v.id) and self._start_tick[v.id] < self.ticks:
+            self._finish(np.array([self._bus_delay(v, self.ticks, v.speed * self.dt)]))
+
+    def summary(self):
+        """
+        The numbers of the analyze_log summary.
+        """
+        return {
+            "avg_queue": self.queue_total_sum / self.ticks if self.ticks else float("nan"),
+            "avg_speed_total": self._mean_speed("total"),
+            "avg_speed_x": self._mean_speed("x"),
+            "avg_speed_y": self._mean_speed("y"),
+            "avg_delay": self.delay_sum / self.delay_count if self.delay_count else float("nan"),
+        }
+
+    def pending_delays(self):
+        """
+        Delay so far of every vehicle that has not passed the light yet: {id: seconds}.
+        """
+        ids = np.flatnonzero(self._tracked)
+        if self._bus is not None:
+            return {vid: self._bus_delay(self._bus.vehicles[vid], self.ticks) for vid in ids.tolist()}
+        return dict(zip(ids.tolist(), self._delays[ids].tolist()))
+
+    def summary_line(self, label):
+        s = self.summary()
+        return format_summary(label, s["avg_queue"], s["avg_speed_total"], s["avg_speed_x"], s["avg_speed_y"])
+
+    def time_series(self):
+        """
+        Bucketed time series as arrays: time (bucket start), queue_x, queue_y, speed.
+        The bucket in progress is included.
+        """
+        series = {name: list(values) for name, values in self.series.items()}
+        sums = self._bucket_sums
+        if self._bucket is not None and sums[3]:
+            series["time"].append(self._bucket * self.resolution)
+            series["queue_x"].append(sums[0] / sums[3])
+            series["queue_y"].append(sums[1] / sums[3])
+            series["speed"].append(sums[2] / sums[3])
+        return {name: np.asarray(values) for name, values in series.items()}
+
+    def _add_speed(self, key, speed_sum, count):
+        """
+        Add a per-tick mean speed to the running sum; ticks without vehicles are skipped.
+        """
+        if count == 0:
+            return None
+        mean = speed_sum / count
+        self.speed_mean_sums[key] += mean
+        self.speed_ticks[key] += 1
+        return mean
+
+    def _add_delays(self, ids, pos, relative_speed):
+        """
+        Add the time lost this tick by each vehicle. Vehicles are tracked from
+        their first tick before the light; the ones past it after this tick,
+        or missing from ids, are finished.
+        """
+        if len(ids):
+            self._grow(int(ids.max()) + 1)
+        self._last_seen[ids] = self.ticks
+        gone = self._tracked_ids[self._last_seen[self._tracked_ids] != self.ticks]
+        self._finish(self._delays[gone])
+        self._tracked[gone] = False
+
+        known = self._tracked[ids]
+        before = pos < self.light_pos
+        lost = self.dt * (1 - relative_speed)
+        lost[known] += self._delays[ids[known]]
+        self._finish(lost[known & ~before])
+        self._tracked[ids[known & ~before]] = False
+        self._tracked[ids[before]] = True
+        self._delays[ids[before]] = lost[before]
+        self._tracked_ids = ids[before]
+
+    def _grow(self, size):
+        """
+        Make the per-id arrays hold at least `size` ids.
+        """
+        if size > len(self._tracked):
+            size = max(size, 2 * len(self._tracked))
+            for name, fill in (("_delays", 0.0), ("_start_tick", 0), ("_tracked", False),
+                               ("_last_seen", -1)):
+                old = getattr(self, name)
+                new = np.full(size, fill, dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, name, new)
+
+    def _untrack(self, vid):
+        """
+        Stop tracking a vehicle; returns whether it was tracked.
+        """
+        if vid < len(self._tracked) and self._tracked[vid]:
+            self._tracked[vid] = False
+            return True
+        return False
+
+    def _bus_delay(self, v, ticks, back=0.0):
+        """
+        Delay of a vehicle tracked through the bus after `ticks` ticks (at
+        `back` meters before its position): the time driven minus the time
+        driving its distance at max speed.
+        """
+        pos = (v.x if v.direction == "x" else v.y) - back
+        return (ticks - self._start_tick[v.id]) * self.dt - pos / v.max_speed + self._delays[v.id]
+
+    def _finish(self, delays):
+        """
+        Move the delays of finished vehicles into the totals.
+        """
+        if len(delays):
+            self.delay_sum += float(delays.sum())
+            self.delay_count += len(delays)
+            self.delay_hist = _add_counts(self.delay_hist, delays.astype(np.int64))
+
+    def _mean_speed(self, key):
+        ticks = self.speed_ticks[key]
+        return self.speed_mean_sums[key] / ticks if ticks else float("nan")
+
+    def _flush_bucket(self):
+        """
+        Close the current time series bucket.
+        """
+        sums = self._bucket_sums
+        if self._bucket is not None and sums[3]:
+            self.series["time"].append(self._bucket * self.resolution)
+            self.series["queue_x"].append(sums[0] / sums[3])
+            self.series["queue_y"].append(sums[1] / sums[3])
+            self.series["speed"].append(sums[2] / sums[3])
+        self._bucket_sums = [0.0, 0.0, 0.0, 0]
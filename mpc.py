@@ -0,0 +1,202 @@
+import argparse
+import itertools
+import random
+import time
+import numpy as np
+from vector_engine import VehicleArrays, LightArrays, LIGHT_STATE_CODES
+
+# Prediction horizon and the interval between decisions of a schedule (seconds)
+HORIZON = 24
+DECISION_INTERVAL = 2.0
+
+# Wall-clock time one decision may take (seconds)
+BUDGET = 0.05
+
+# Schedules simulated together in one batched rollout
+ROLLOUT_BATCH = 32
+
+
+def candidate_schedules(num_decisions, max_switches=2):
+    """
+    Switch/hold schedules as a (candidates, num_decisions) action array
+    (1 = request a switch during that interval, 0 = hold): holding
+    throughout first, then one switch request at every decision, then
+    pairs of requests, so a tight budget still covers the simple plans.
+    """
+    schedules = [np.zeros(num_decisions, dtype=np.int64)]
+    for switches in range(1, max_switches + 1):
+        for when in itertools.combinations(range(num_decisions), switches):
+            schedule = np.zeros(num_decisions, dtype=np.int64)
+            schedule[list(when)] = 1
+            schedules.append(schedule)
+    return np.array(schedules)
+
+
+class MPCPlanner:
+    """
+    Model-predictive control for a TrafficLight in mpc mode.
+
+    Every `decision_interval` the planner copies the current state of its
+    vehicles and light, simulates the candidate schedules over `horizon`
+    seconds with the vectorized engine (one VehicleArrays/LightArrays
+    instance per schedule, ROLLOUT_BATCH schedules per batch) and keeps
+    the first action of the schedule with the lowest predicted delay
+    (stopped vehicle-seconds). A batch is only started if, at the pace
+    of the previous one, it ends within `budget` seconds of wall-clock
+    time; the first batch always runs.
+    The light applies the action with the rl rules (minimum green,
+    maximum red).
+
+    Rollouts move all vehicles at once (see VehicleArrays), so they are a
+    prediction of the object loop, not a replay. Troublemaker braking
+    uses the planner's own generator, with the same draws for every
+    schedule, and leaves the global RNG alone.
+
+    vehicles: the list the light's vehicles live in (read at every decision).
+    """
+
+    def __init__(self, vehicles, horizon=HORIZON, decision_interval=DECISION_INTERVAL,
+                 budget=BUDGET, batch_size=ROLLOUT_BATCH, max_switches=2, seed=0):
+        self.vehicles = vehicles
+        self.horizon = horizon
+        self.decision_interval = decision_interval
+        self.budget = budget
+        self.batch_size = batch_size
+        self.schedules = candidate_schedules(int(round(horizon / decision_interval)), max_switches)
+        self.rng = np.random.default_rng(seed)
+        self.current = 0
+        self.elapsed = 0.0
+
+        # Totals since the start
+        self.decisions = 0
+        self.evaluated = 0
+        self.planning_time = 0.0
+
+    def action(self, light, dt):
+        """
+        Action for this tick; replans once per decision interval. Called by
+        TrafficLight.update after it advanced its timers by dt.
+        """
+        if self.elapsed <= 0:
+            start = time.perf_counter()
+            costs = self.evaluate(light, dt)
+            self.current = int(self.schedules[np.argmin(costs), 0])
+            self.planning_time += time.perf_counter() - start
+            self.decisions += 1
+            self.elapsed = self.decision_interval
+        self.elapsed -= dt
+        return self.current
+
+    def evaluate(self, light, dt):
+        """
+        Predicted cost of every schedule (inf for the ones the budget did not reach).
+        """
+        deadline = time.perf_counter() + self.budget
+        fleet = VehicleArrays.from_vehicles(self.vehicles)
+        costs = np.full(len(self.schedules), np.inf)
+        for start in range(0, len(self.schedules), self.batch_size):
+            batch_start = time.perf_counter()
+            batch = slice(start, start + self.batch_size)
+            costs[batch] = self.rollout(fleet, light, self.schedules[batch], dt)
+            self.evaluated += len(costs[batch])
+            now = time.perf_counter()
+            if now + (now - batch_start) > deadline:
+                break   # the next batch would not finish in time
+        return costs
+
+    def rollout(self, fleet, light, schedules, dt):
+        """
+        Stopped vehicle-seconds over the horizon for each schedule, all
+        schedules simulated together.
+        """
+        k, n = len(schedules), len(fleet)
+        fleets = VehicleArrays(0)
+        for name in VehicleArrays.FIELDS:
+            setattr(fleets, name, np.tile(getattr(fleet, name), k))
+        fleets.instance = np.repeat(np.arange(k), n)
+
+        # The light already advanced its timers for this tick; start from before
+        lights = LightArrays(k, mode="rl")
+        lights.state[:] = LIGHT_STATE_CODES[light.state]
+        lights.timer[:] = light.timer - dt
+        lights.green_timer[:] = light.green_timer - dt
+        lights.yellow_timer[:] = light.yellow_timer
+        lights.red_timer[:] = light.red_timer
+        for name in ("cycle_time", "min_green_time", "yellow_duration", "max_red_time"):
+            setattr(lights, name, getattr(light, name))
+
+        ticks_per_decision = max(1, int(round(self.decision_interval / dt)))
+        cost = np.zeros(k)
+        for tick in range(int(round(self.horizon / dt))):
+            decision = min(tick // ticks_per_decision, schedules.shape[1] - 1)
+            lights.update(dt, rl_action=schedules[:, decision])
+            can_go = lights.can_go(fleets.instance, fleets.direction)
+            fleets.step(dt, can_go=can_go, light_pos=light.position,
+                        uniforms=np.tile(self.rng.random(n), k))
+            cost += np.bincount(fleets.instance[fleets.stopped], minlength=k) * dt
+        return cost
+
+
+def run_mode(mode, start, duration, dt, seed, model=None, planner_kwargs=None):
+    """
+    Run the comparison scenario from a Snapshot headless with one light
+    mode; returns (OnlineMetrics, light).
+    """
+    from animated_compare import sim_step
+    from leader_index import LeaderIndex
+    from metrics import OnlineMetrics
+    from traffic_light import TrafficLight
+    from v2i import V2IBus
+
+    vehicles = start.restore(rng=None)[0]
+    light = TrafficLight(position=0, mode=mode)
+    light.bus = V2IBus(0)
+    light.bus.register(vehicles)
+    if mode == "mpc":
+        light.planner = MPCPlanner(vehicles, **(planner_kwargs or {}))
+    index = LeaderIndex(vehicles)
+    metrics = OnlineMetrics(dt)
+    metrics.attach(light.bus)
+    random.seed(seed)
+    for k in range(int(duration / dt)):
+        sim_step(k * dt, vehicles, light, index, model=model, metrics=metrics, dt=dt)
+    return metrics, light
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MPC light against the other modes on one scenario.")
+    parser.add_argument("--vehicles", type=int, default=16, help="vehicles per direction")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--dt", type=float, default=0.5)
+    parser.add_argument("--horizon", type=float, default=HORIZON)
+    parser.add_argument("--budget", type=float, default=BUDGET, help="seconds per decision")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def main():
+    from animated_compare import generate_vehicles, load_rl_model
+    from snapshot import Snapshot
+
+    args = parse_args()
+    random.seed(args.seed)
+    start = Snapshot.capture(generate_vehicles(args.vehicles, args.vehicles), rng=None)
+    model = load_rl_model()
+    modes = [("fixed", "Fixed Timer"), ("adaptive", "Adaptive V2I")]
+    if model is not None:
+        modes.append(("rl", "RL Agent"))
+    modes.append(("mpc", "MPC"))
+
+    print("=== Performance Summary ===")
+    for mode, label in modes:
+        metrics, light = run_mode(mode, start, args.duration, args.dt, args.seed, model,
+                                  {"horizon": args.horizon, "budget": args.budget})
+        print(metrics.summary_line(label))
+    planner = light.planner
+    print(f"MPC: {planner.decisions} decisions, {planner.evaluated / planner.decisions:.0f} schedules "
+          f"and {planner.planning_time / planner.decisions * 1e3:.1f} ms per decision "
+          f"(budget {args.budget * 1e3:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
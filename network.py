@@ -0,0 +1,330 @@
+import random
+import numpy as np
+from vector_engine import LightArrays, LIGHT_MODE_CODES
+from open_boundary import VehiclePool, PoissonArrivals, spawn_vehicle, SPAWN_POSITION, EXIT_POSITION, \
+    ENTRY_GAP, LANES
+from collision import vehicle_boxes, find_collisions
+
+# Distance between neighbouring intersections (m)
+LINK_LENGTH = 200
+
+# Vehicle fields that VehicleArrays.step changes
+MOVE_FIELDS = ("pos", "speed", "stopped", "delay_timer")
+
+_MASK64 = (1 << 64) - 1
+
+
+def hash_uniforms(seed, ids, tick):
+    """
+    Random numbers in [0, 1) that depend only on (seed, vehicle id, tick).
+
+    A counter-based generator (splitmix64 finalizer): the draw of a vehicle
+    does not depend on where it sits in the arrays, so any split of the
+    vehicles over processes gives the same numbers.
+    """
+    key = (seed * 0x9E3779B97F4A7C15 + (tick + 1) * 0xD1B54A32D192ED03) & _MASK64
+    z = ids.astype(np.uint64) * np.uint64(0xBF58476D1CE4E5B9) ^ np.uint64(key)
+    z ^= z >> np.uint64(30)
+    z *= np.uint64(0xBF58476D1CE4E5B9)
+    z ^= z >> np.uint64(27)
+    z *= np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def green_wave_offsets(rows, cols, link_length=LINK_LENGTH, speed=10.0, cycle_time=15):
+    """
+    Offsets (seconds) that delay the fixed cycle of each node by the travel
+    time from the first column at `speed`, for a green wave along x.
+    The steady-state fixed cycle lasts 2 * cycle_time.
+    """
+    period = 2 * cycle_time
+    delay = np.tile(np.arange(cols) * link_length / speed, rows)
+    return (period - delay % period) % period
+
+
+class RoadNetwork:
+    """
+    A rows x cols grid of signalized intersections in flat arrays.
+
+    Roads are one-way like the single intersection: every row is an X road
+    (travel +x) and every column a Y road (travel +y), with lanes -3/+3.
+    Node (r, c) sits at (c * link_length, r * link_length), where X road r
+    crosses Y road c. A vehicle keeps its position along its road, so it
+    drives from one link into the next without being moved between lists,
+    and the light it obeys is the next node ahead. rows=1 is a corridor.
+
+    All vehicles are in one VehicleArrays pool (instance = road id, so
+    leaders stay on their road) and all controllers in one LightArrays;
+    every node has its own mode (fixed, adaptive or rl) and adaptive nodes
+    see the stopped vehicles approaching them. A tick is a fixed number
+    of array operations, whatever the size of the grid.
+
+    Vehicles enter at SPAWN_POSITION on every road and lane (an arrival
+    process per entry) and leave EXIT_POSITION past the last node.
+    Arrivals and vehicle attributes come from one random.Random per entry,
+    troublemaker braking from hash_uniforms, so results depend only on the
+    seed.
+
+    columns: (first, stop) to simulate only the partition of the grid
+    holding node columns [first, stop): its Y roads, and the X road
+    stretches whose next node lies in those columns (used by
+    parallel_network). The default is the whole grid.
+    """
+
+    def __init__(self, rows, cols, link_length=LINK_LENGTH, dt=0.5, modes="fixed",
+                 arrival_rate=300, process=PoissonArrivals, offsets=None, capacity=None,
+                 seed=0, troublemaker_rate=0.02, columns=None):
+        self.rows = rows
+        self.cols = cols
+        self.num_nodes = rows * cols
+        self.link_length = link_length
+        self.dt = dt
+        self.seed = seed
+        self.troublemaker_rate = troublemaker_rate
+        self.time = 0.0
+        self.tick = 0
+
+        # Roads: X roads 0..rows-1, Y roads rows..rows+cols-1
+        self.num_roads = rows + cols
+        self.road_nodes = np.array([cols] * rows + [rows] * cols)
+        self.road_exit = (self.road_nodes - 1) * link_length + EXIT_POSITION
+
+        # Controllers
+        self.lights = LightArrays(self.num_nodes)
+        if isinstance(modes, str):
+            modes = [modes] * self.num_nodes
+        self.lights.mode[:] = [LIGHT_MODE_CODES[m] for m in modes]
+        if offsets is not None:
+            _advance_lights(self.lights, np.asarray(offsets, dtype=float), dt)
+
+        # Vehicles
+        if capacity is None:
+            road_length = self.road_exit - SPAWN_POSITION
+            capacity = int(len(LANES) * road_length.sum() / ENTRY_GAP)
+        self.pool = VehiclePool(capacity)
+
+        # Entries: one arrival stream per (road, lane)
+        self.streams = [(road, lane) for road in range(self.num_roads) for lane in LANES]
+        self.columns = (0, cols) if columns is None else tuple(columns)
+        first, stop = self.columns
+        self.own_streams = [k for k, (road, _) in enumerate(self.streams)
+                            if (road < rows and first == 0) or first <= road - rows < stop]
+        self.rngs = [random.Random(seed * 1_000_003 + k) for k in range(len(self.streams))]
+        self.processes = [process(arrival_rate) for _ in self.streams]
+        self.next_arrival = [p.headway(rng) for p, rng in zip(self.processes, self.rngs)]
+        self.waiting = np.zeros(len(self.streams), dtype=np.int64)
+        self.spawned = np.zeros(len(self.streams), dtype=np.int64)
+
+        # Totals since the start
+        self.passed = np.zeros(self.num_nodes, dtype=np.int64)
+        self.exited = 0
+
+    @classmethod
+    def corridor(cls, length, **kwargs):
+        """
+        A single X road through `length` intersections.
+        """
+        return cls(1, length, **kwargs)
+
+    @property
+    def fleet(self):
+        return self.pool.active
+
+    def node_index(self, row, col):
+        return row * self.cols + col
+
+    def node_positions(self):
+        """
+        (x, y) coordinates of every node.
+        """
+        rows, cols = np.divmod(np.arange(self.num_nodes), self.cols)
+        return cols * self.link_length, rows * self.link_length
+
+    def positions(self):
+        """
+        (x, y) coordinates of every active vehicle.
+        """
+        fleet = self.fleet
+        cross = self._cross_offset(fleet)
+        is_x = fleet.direction == 0
+        return np.where(is_x, fleet.pos, cross), np.where(is_x, cross, fleet.pos)
+
+    def step(self, rl_action=None, timer=None, ghosts=None):
+        """
+        Advance the network by one dt.
+
+        rl_action: optional array with one action per node (read by rl nodes).
+        ghosts: optional VehicleArrays of vehicles simulated elsewhere that
+        can lead vehicles of this network (partition halo); they are moved
+        along but not kept.
+        Returns per-node arrays: queue_x, queue_y (stopped vehicles
+        approaching the node) and passed (vehicles that crossed it this tick).
+        """
+        tick = self.begin_step(rl_action, timer, ghosts)
+        self.move(tick)
+        return self.end_step(tick)
+
+    # --- Tick phases (step runs all three; parallel_network repeats move) ---
+
+    def begin_step(self, rl_action=None, timer=None, ghosts=None):
+        """
+        Admit arrivals, add the ghosts and update the lights. Returns the
+        state of the tick for move and end_step.
+        """
+        if timer is not None:
+            timer.start()
+        self.time += self.dt
+        self.tick += 1
+        self._admit()
+        n = self.pool.count
+        if ghosts is not None and len(ghosts):
+            self._add_ghosts(ghosts)
+            fleet = self.pool.arrays.select(slice(0, n + len(ghosts)))
+        else:
+            fleet = self.pool.active
+        if timer is not None:
+            timer.mark("boundary")
+
+        node, light_pos, on_network = self._locate(fleet)
+        own = slice(0, n)
+        stopped = fleet.stopped[own] & on_network[own]
+        is_x = fleet.direction[own] == 0
+        queue_x = np.bincount(node[own][stopped & is_x], minlength=self.num_nodes)
+        queue_y = np.bincount(node[own][stopped & ~is_x], minlength=self.num_nodes)
+        self.lights.receive_counts(queue_x, queue_y)
+        if timer is not None:
+            timer.mark("v2i")
+        self.lights.update(self.dt, rl_action=rl_action)
+        if timer is not None:
+            timer.mark("light_update")
+
+        leader = fleet.leaders()
+        if timer is not None:
+            timer.mark("leader_search")
+        tick = {"fleet": fleet, "own": own, "node": node, "light_pos": light_pos,
+                "on_network": on_network, "leader": leader, "timer": timer,
+                "queue_x": queue_x, "queue_y": queue_y}
+        if ghosts is not None:
+            tick["start"] = {name: getattr(fleet, name).copy() for name in MOVE_FIELDS}
+        return tick
+
+    def move(self, tick, known=None):
+        """
+        Move the vehicles (and ghosts) by one dt. With ghosts, calling it
+        again redoes the move from the start of the tick, e.g. with the
+        `known` end-of-tick ghost states (see VehicleArrays.step).
+        """
+        fleet = tick["fleet"]
+        if "start" in tick:
+            for name, values in tick["start"].items():
+                getattr(fleet, name)[:] = values
+        can_go = self.lights.can_go(tick["node"], fleet.direction) | ~tick["on_network"]
+        fleet.step(self.dt, light_pos=tick["light_pos"], can_go=can_go, leader=tick["leader"],
+                   uniforms=hash_uniforms(self.seed, fleet.id, self.tick), known=known)
+        if tick["timer"] is not None:
+            tick["timer"].mark("move")
+
+    def end_step(self, tick):
+        """
+        Count the vehicles that passed a node and remove the ones that left.
+        """
+        own, node = tick["own"], tick["node"]
+        fleet = self.pool.active
+        crossed = tick["on_network"][own] & (fleet.pos >= tick["light_pos"][own])
+        passed = np.bincount(node[own][crossed], minlength=self.num_nodes)
+        self.passed += passed
+        gone = np.flatnonzero(fleet.pos > self.road_exit[fleet.instance])
+        if gone.size:
+            self.pool.release(gone.tolist())
+            self.exited += gone.size
+        if tick["timer"] is not None:
+            tick["timer"].mark("boundary")
+        return tick["queue_x"], tick["queue_y"], passed
+
+    def collisions(self):
+        """
+        Colliding vehicle pairs (ids) anywhere in the network.
+        """
+        fleet = self.fleet
+        boxes = vehicle_boxes(fleet.direction, fleet.pos, self._cross_offset(fleet), fleet.length)
+        i, j = find_collisions(*boxes)
+        return list(zip(fleet.id[i].tolist(), fleet.id[j].tolist()))
+
+    def _locate(self, fleet):
+        """
+        Per vehicle: the node ahead, its position along the road and whether
+        there is one (False once the vehicle has passed the last node of its road).
+        """
+        road = fleet.instance
+        ahead = np.maximum(np.floor(fleet.pos / self.link_length).astype(np.int64) + 1, 0)
+        on_network = ahead < self.road_nodes[road]
+        k = np.minimum(ahead, self.road_nodes[road] - 1)
+        is_x = fleet.direction == 0
+        node = np.where(is_x, road * self.cols + k, k * self.cols + (road - self.rows))
+        light_pos = np.where(on_network, ahead * self.link_length, -np.inf)
+        return node, light_pos, on_network
+
+    def _cross_offset(self, fleet):
+        """
+        Coordinate across the direction of travel: road position + lane.
+        """
+        road = fleet.instance
+        road_coord = np.where(road < self.rows, road, road - self.rows) * self.link_length
+        return road_coord + fleet.lane
+
+    def _admit(self):
+        """
+        Queue the arrivals due by now and let one vehicle per free entry in.
+        The id of a vehicle is (arrivals so far at its entry) * entries + entry,
+        so it does not depend on the other entries.
+        """
+        fleet = self.pool.active
+        near = fleet.pos < SPAWN_POSITION + ENTRY_GAP
+        blocked = np.zeros(len(self.streams), dtype=bool)
+        blocked[fleet.instance[near] * len(LANES) + (fleet.lane[near] > 0)] = True
+
+        num_streams = len(self.streams)
+        for k in self.own_streams:
+            road, lane = self.streams[k]
+            rng = self.rngs[k]
+            while self.next_arrival[k] <= self.time:
+                self.waiting[k] += 1
+                self.next_arrival[k] += self.processes[k].headway(rng)
+            if not self.waiting[k] or blocked[k]:
+                continue
+            slot = self.pool.acquire()
+            if slot is None:
+                continue
+            vid = int(self.spawned[k]) * num_streams + k
+            direction = 0 if road < self.rows else 1
+            spawn_vehicle(self.pool.arrays, slot, vid, direction, lane, SPAWN_POSITION, rng,
+                          self.troublemaker_rate, instance=road)
+            self.spawned[k] += 1
+            self.waiting[k] -= 1
+
+    def _add_ghosts(self, ghosts):
+        """
+        Copy halo vehicles into the free slots right after the active ones.
+        """
+        start = self.pool.count
+        if start + len(ghosts) > self.pool.capacity:
+            raise RuntimeError("Vehicle pool too small for the partition halo")
+        for name in ghosts.FIELDS:
+            getattr(self.pool.arrays, name)[start:start + len(ghosts)] = getattr(ghosts, name)
+
+
+def _advance_lights(lights, offsets, dt):
+    """
+    Run every light alone for its offset (in steps of dt), as if it had
+    started that much earlier.
+    """
+    steps = np.round(offsets / dt).astype(np.int64)
+    for step in range(int(steps.max(initial=0))):
+        active = np.flatnonzero(steps > step)
+        sub = LightArrays(len(active))
+        for name in ("mode", "state", "timer", "green_timer", "yellow_timer", "red_timer"):
+            getattr(sub, name)[:] = getattr(lights, name)[active]
+        sub.update(dt)
+        for name in ("state", "timer", "green_timer", "yellow_timer", "red_timer"):
+            getattr(lights, name)[active] = getattr(sub, name)
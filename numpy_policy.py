@@ -0,0 +1,193 @@
+import argparse
+import hashlib
+import os
+import time
+import numpy as np
+
+# Activations SB3 policies are built with, by torch class name
+ACTIVATIONS = {
+    "Tanh": np.tanh,
+    "ReLU": lambda x: np.maximum(x, 0),
+}
+
+
+def file_hash(path):
+    """
+    SHA-256 of a file's contents (hex digest).
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_policy(model_path, output=None):
+    """
+    Write the actor of a saved SB3 PPO agent (traffic_rl_model.zip) to a
+    .npz file: the Linear layers of the policy MLP, the action head, the
+    name of the activation and the hash of the .zip it came from. Needs
+    stable_baselines3 and torch; the exported file does not. Returns the
+    path of the .npz.
+    """
+    from stable_baselines3 import PPO
+
+    model = PPO.load(model_path, device="cpu")
+    policy = model.policy
+    if type(policy.features_extractor).__name__ != "FlattenExtractor":
+        raise ValueError("Only MLP policies on flat observations can be exported")
+    linears = [layer for layer in policy.mlp_extractor.policy_net if hasattr(layer, "weight")]
+    layers = linears + [policy.action_net]
+
+    zip_path = str(model_path).removesuffix(".zip") + ".zip"
+    arrays = {"activation": np.array(policy.activation_fn.__name__),
+              "source_hash": np.array(file_hash(zip_path))}
+    for k, layer in enumerate(layers):
+        arrays[f"weight_{k}"] = layer.weight.detach().cpu().numpy().astype(np.float32)
+        arrays[f"bias_{k}"] = layer.bias.detach().cpu().numpy().astype(np.float32)
+
+    if output is None:
+        output = str(model_path).removesuffix(".zip") + ".npz"
+    np.savez(output, **arrays)
+    return output
+
+
+class NumpyPolicy:
+    """
+    Deterministic PPO actor evaluated with NumPy only.
+
+    Same forward pass as the SB3 MlpPolicy (hidden Linear layers with the
+    activation, then the action head, all in float32) and the same argmax
+    over the action logits, so actions match
+    model.predict(..., deterministic=True). Loading takes milliseconds and
+    needs neither torch nor stable_baselines3, so evaluation workers and
+    the comparison simulation can use it instead of the PPO object;
+    predict() has the same signature and return values.
+    """
+
+    def __init__(self, weights, biases, activation="Tanh", seed=None):
+        self.weights = [np.ascontiguousarray(w.T, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.activation = ACTIVATIONS[activation]
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def load(cls, path, seed=None):
+        """
+        Load a policy written by export_policy (the .npz suffix is optional).
+        """
+        if not str(path).endswith(".npz"):
+            path = str(path) + ".npz"
+        with np.load(path) as data:
+            num_layers = sum(1 for name in data.files if name.startswith("weight_"))
+            weights = [data[f"weight_{k}"] for k in range(num_layers)]
+            biases = [data[f"bias_{k}"] for k in range(num_layers)]
+            activation = str(data["activation"])
+        return cls(weights, biases, activation, seed)
+
+    def logits(self, observations):
+        """
+        Action logits for an (n, obs_dim) observation array.
+        """
+        x = np.asarray(observations, dtype=np.float32)
+        for w, b in zip(self.weights[:-1], self.biases[:-1]):
+            x = self.activation(x @ w + b)
+        return x @ self.weights[-1] + self.biases[-1]
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        """
+        Action(s) for one observation or a batch, like SB3's predict:
+        returns (actions, None). With deterministic=False the action is
+        drawn from the softmax of the logits with this policy's own RNG
+        (same distribution as SB3, not the same draws).
+        """
+        observation = np.asarray(observation, dtype=np.float32)
+        single = observation.ndim == 1
+        logits = self.logits(observation.reshape(-1, self.weights[0].shape[0]))
+        if deterministic:
+            actions = logits.argmax(axis=1)
+        else:
+            p = np.exp(logits - logits.max(axis=1, keepdims=True))
+            cumulative = np.cumsum(p / p.sum(axis=1, keepdims=True), axis=1)
+            draws = self.rng.random((len(logits), 1))
+            actions = np.minimum((cumulative < draws).sum(axis=1), logits.shape[1] - 1)
+        if single:
+            return actions[0], state
+        return actions, state
+
+
+def load_policy(path):
+    """
+    The NumPy policy exported next to `path` (path + ".npz") if there is
+    one, otherwise the SB3 PPO agent at `path`. The export is stale when
+    the hash of the .zip stored at export time does not match the current
+    .zip (the agent was retrained since, or the export predates the hash);
+    the agent is loaded then.
+    """
+    base = str(path).removesuffix(".zip").removesuffix(".npz")
+    npz, zip_path = base + ".npz", base + ".zip"
+    if os.path.exists(npz):
+        if not os.path.exists(zip_path):
+            return NumpyPolicy.load(npz)
+        with np.load(npz) as data:
+            source_hash = str(data["source_hash"]) if "source_hash" in data.files else None
+        if source_hash == file_hash(zip_path):
+            return NumpyPolicy.load(npz)
+        print(f"⚠️ {npz} was not exported from the current {zip_path}, loading the PPO agent; "
+              f"re-export it with python numpy_policy.py")
+    from stable_baselines3 import PPO
+    return PPO.load(zip_path)
+
+
+def check_policy(model_path, policy_path, max_queue=200, samples=100_000, seed=0):
+    """
+    Compare the exported policy with model.predict on every integer
+    observation with queues up to `max_queue` and on random float ones.
+    Returns (observations compared, action mismatches, largest logit difference).
+    """
+    import torch
+    from stable_baselines3 import PPO
+
+    model = PPO.load(model_path, device="cpu")
+    policy = NumpyPolicy.load(policy_path)
+    queue = np.arange(max_queue + 1)
+    grid = np.stack(np.meshgrid(queue, queue, [0, 1], indexing="ij"), axis=-1).reshape(-1, 3)
+    rng = np.random.default_rng(seed)
+    floats = rng.uniform(0, 100, (samples, 3))
+    observations = np.concatenate([grid, floats]).astype(np.float32)
+
+    expected, _ = model.predict(observations, deterministic=True)
+    with torch.no_grad():
+        features = model.policy.extract_features(torch.as_tensor(observations))
+        torch_logits = model.policy.action_net(model.policy.mlp_extractor.forward_actor(features)).numpy()
+    actions, _ = policy.predict(observations)
+    mismatches = int(np.count_nonzero(actions != expected))
+    return len(observations), mismatches, float(np.abs(policy.logits(observations) - torch_logits).max())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the PPO actor to a torch-free .npz policy.")
+    parser.add_argument("--model", default="traffic_rl_model", help="saved SB3 agent (.zip)")
+    parser.add_argument("--output", default=None, help="default: the model path with .npz")
+    parser.add_argument("--check", action="store_true",
+                        help="compare the exported actions with model.predict")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = export_policy(args.model, args.output)
+    print(f"Policy exported to {output}")
+
+    start = time.perf_counter()
+    NumpyPolicy.load(output)
+    print(f"Load time: {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+    if args.check:
+        compared, mismatches, logit_diff = check_policy(args.model, output)
+        print(f"{compared} observations: {mismatches} action mismatches, "
+              f"largest logit difference {logit_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import random
+import numpy as np
+from vector_engine import VehicleArrays, DIRECTION_CODES
+
+# Where arriving vehicles enter and where they leave (m along their direction)
+SPAWN_POSITION = -100
+EXIT_POSITION = 100
+
+# A new vehicle enters only if the last one in its lane is this far past the entry
+ENTRY_GAP = 10
+
+LANES = (-3, 3)
+
+
+class PoissonArrivals:
+    """
+    Poisson arrivals: exponential headways, `rate` vehicles per hour.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+
+    def headway(self, rng):
+        return rng.expovariate(self.rate / 3600)
+
+
+class PeriodicArrivals:
+    """
+    Evenly spaced arrivals, `rate` vehicles per hour.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+
+    def headway(self, rng):
+        return 3600 / self.rate
+
+
+def uniform_arrivals(rate, process=PoissonArrivals):
+    """
+    The same arrival process (rate per lane, vehicles/hour) for every (direction, lane).
+    """
+    return {(direction, lane): process(rate) for direction in DIRECTION_CODES for lane in LANES}
+
+
+class VehiclePool:
+    """
+    Preallocated VehicleArrays (or `vehicle_cls`, e.g. JitVehicleArrays)
+    with a fixed number of slots.
+
+    Active vehicles always occupy slots [0, count): a released slot is
+    filled with the last active vehicle, and acquire() hands out the first
+    free slot. Nothing is allocated after construction.
+
+    For fleet classes that reuse orders across ticks (JitVehicleArrays has
+    id_order and lane_order), the pool keeps the active slots in id order
+    and in the last lane order: released slots are dropped and renamed,
+    new ones are inserted, so no tick sorts the whole fleet again.
+    """
+
+    def __init__(self, capacity, vehicle_cls=VehicleArrays):
+        self.capacity = capacity
+        self.arrays = vehicle_cls(capacity)
+        self.count = 0
+        self.keeps_orders = hasattr(self.arrays, "id_order")
+        if self.keeps_orders:
+            self.id_order = np.zeros(capacity, dtype=np.int64)
+            self.lane_order = np.zeros(capacity, dtype=np.int64)
+            self.ordered = 0   # slots [0, ordered) are in both orders
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def active(self):
+        """
+        VehicleArrays of views onto the active slots (changes write through).
+        """
+        fleet = self.arrays.select(slice(0, self.count))
+        if self.keeps_orders:
+            self._order_new_slots()
+            fleet.id_order = self.id_order[:self.count]
+            fleet.lane_order = self.lane_order[:self.count]
+        return fleet
+
+    def acquire(self):
+        """
+        Index of a free slot, or None if the pool is full.
+        """
+        if self.count == self.capacity:
+            return None
+        self.count += 1
+        return self.count - 1
+
+    def release(self, slots):
+        """
+        Free the given active slots.
+        """
+        if self.keeps_orders:
+            self._order_new_slots()
+        count = self.count
+        holder = np.arange(count)   # slot each vehicle was in before the release
+        for slot in sorted(slots, reverse=True):
+            last = self.count - 1
+            if slot != last:
+                for name in VehicleArrays.FIELDS:
+                    column = getattr(self.arrays, name)
+                    column[slot] = column[last]
+                holder[slot] = holder[last]
+            self.count = last
+        if self.keeps_orders:
+            new_slot = np.full(count, -1)
+            new_slot[holder[:self.count]] = np.arange(self.count)
+            for order in (self.id_order, self.lane_order):
+                kept = new_slot[order[:count]]
+                order[:self.count] = kept[kept >= 0]
+            self.ordered = self.count
+
+    def _order_new_slots(self):
+        """
+        Add the slots filled since the orders were last updated (by
+        acquire or by writing past count directly) to both orders.
+        """
+        if self.ordered == self.count:
+            return
+        ids = self.arrays.id
+        new = np.arange(self.ordered, self.count)
+        new = new[np.argsort(ids[new], kind="stable")]
+        order = self.id_order[:self.ordered]
+        at = np.searchsorted(ids[order], ids[new])
+        self.id_order[:self.count] = np.insert(order, at, new)
+        # Any order will do for the lane order: leaders() sorts it again
+        self.lane_order[self.ordered:self.count] = np.arange(self.ordered, self.count)
+        self.ordered = self.count
+
+
+class OpenBoundaryTraffic:
+    """
+    Continuous traffic with sources and sinks instead of a fixed platoon.
+
+    Every (direction, lane) has its own arrival process. Arrivals wait at
+    the entry until the lane has room (ENTRY_GAP) and a pool slot is free,
+    then enter at SPAWN_POSITION with attributes drawn like Vehicle's.
+    Vehicles past EXIT_POSITION leave and free their slot, so memory and
+    the cost of a tick depend on the traffic in the domain, not on how
+    long the simulation has been running.
+
+    All random draws (arrivals, vehicle attributes, troublemaker braking)
+    come from one random.Random(seed). vehicle_cls is the fleet class
+    (VehicleArrays, or JitVehicleArrays for the compiled kernels).
+    """
+
+    def __init__(self, arrivals, capacity=512, seed=None, troublemaker_rate=0.02,
+                 spawn_pos=SPAWN_POSITION, exit_pos=EXIT_POSITION, vehicle_cls=VehicleArrays):
+        self.rng = random.Random(seed)
+        self.pool = VehiclePool(capacity, vehicle_cls)
+        self.troublemaker_rate = troublemaker_rate
+        self.spawn_pos = spawn_pos
+        self.exit_pos = exit_pos
+        self.time = 0.0
+        self.next_id = 0
+
+        self.streams = [(DIRECTION_CODES[direction], lane, process)
+                        for (direction, lane), process in arrivals.items()]
+        self.next_arrival = [process.headway(self.rng) for _, _, process in self.streams]
+        self.waiting = [0] * len(self.streams)   # arrivals held at the entry
+
+        # Totals since the start
+        self.entered = 0
+        self.exited = 0
+
+    @property
+    def fleet(self):
+        return self.pool.active
+
+    def step(self, dt, light, light_pos=0, timer=None):
+        """
+        Admit arrivals, advance the vehicles in the domain and remove the
+        ones that left. Returns the number of vehicles that crossed the
+        light during this tick.
+        """
+        self.time += dt
+        self._admit()
+        fleet = self.pool.active
+        if timer is not None:
+            timer.mark("boundary")
+
+        leader = fleet.leaders()
+        if timer is not None:
+            timer.mark("leader_search")
+        before = fleet.pos < light_pos
+        fleet.step(dt, light=light, light_pos=light_pos, rngs=[self.rng], leader=leader)
+        passed = int(np.count_nonzero(before & (fleet.pos >= light_pos)))
+        if timer is not None:
+            timer.mark("move")
+
+        gone = np.flatnonzero(fleet.pos > self.exit_pos)
+        if gone.size:
+            self.pool.release(gone.tolist())
+            self.exited += gone.size
+        if timer is not None:
+            timer.mark("boundary")
+        return passed
+
+    def _admit(self):
+        """
+        Queue the arrivals due by now and let one vehicle per free entry in.
+        """
+        fleet = self.pool.active
+        for k, (direction, lane, process) in enumerate(self.streams):
+            while self.next_arrival[k] <= self.time:
+                self.waiting[k] += 1
+                self.next_arrival[k] += process.headway(self.rng)
+            if not self.waiting[k]:
+                continue
+            in_lane = (fleet.direction == direction) & (fleet.lane == lane)
+            if in_lane.any() and fleet.pos[in_lane].min() < self.spawn_pos + ENTRY_GAP:
+                continue
+            slot = self.pool.acquire()
+            if slot is None:
+                return
+            self._spawn(slot, direction, lane)
+            self.waiting[k] -= 1
+            fleet = self.pool.active
+
+    def _spawn(self, slot, direction, lane):
+        """
+        Write a new vehicle into a free slot.
+        """
+        spawn_vehicle(self.pool.arrays, slot, self.next_id, direction, lane, self.spawn_pos,
+                      self.rng, self.troublemaker_rate)
+        self.next_id += 1
+        self.entered += 1
+
+
+def spawn_vehicle(arrays, slot, vid, direction, lane, pos, rng, troublemaker_rate, instance=0):
+    """
+    Write a new vehicle into slot `slot` of a VehicleArrays, drawing its
+    attributes from `rng` with the same distributions as Vehicle.
+    """
+    max_speed = rng.uniform(6, 12)
+    arrays.id[slot] = vid
+    arrays.instance[slot] = instance
+    arrays.direction[slot] = direction
+    arrays.lane[slot] = lane
+    arrays.pos[slot] = pos
+    arrays.length[slot] = rng.choice([4.5, 6.0])
+    arrays.max_speed[slot] = max_speed
+    arrays.speed[slot] = rng.uniform(5, max_speed)
+    arrays.acceleration[slot] = 1.5
+    arrays.deceleration[slot] = 3.0
+    arrays.reaction_delay[slot] = rng.uniform(0.3, 0.8)
+    arrays.delay_timer[slot] = 0.0
+    arrays.stopped[slot] = False
+    arrays.is_troublemaker[slot] = rng.random() < troublemaker_rate
+    arrays.strict_stop[slot] = False
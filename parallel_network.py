@@ -0,0 +1,388 @@
+import argparse
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import traceback
+from threading import BrokenBarrierError
+import numpy as np
+from vector_engine import VehicleArrays
+from network import RoadNetwork
+
+# Vehicles this close past a partition boundary are copied to the
+# partition before it as possible leaders. A leader farther away than
+# (halo - longest vehicle) never changes a follower's decision: the
+# largest safe gap is 7 + 0.3 * 12 + 2 m.
+HALO = 25.0
+
+# Seconds between checks that the workers are still alive while waiting for them
+POLL_INTERVAL = 1.0
+
+# One vehicle as a record in the shared exchange buffers
+RECORD_DTYPE = np.dtype([(name, getattr(VehicleArrays(0), name).dtype) for name in VehicleArrays.FIELDS])
+
+
+def to_records(fleet, indices=slice(None)):
+    """
+    Vehicles of a VehicleArrays as a structured array.
+    """
+    selected = fleet.select(indices)
+    records = np.empty(len(selected), dtype=RECORD_DTYPE)
+    for name in VehicleArrays.FIELDS:
+        records[name] = getattr(selected, name)
+    return records
+
+
+def from_records(records):
+    fleet = VehicleArrays(0)
+    for name in VehicleArrays.FIELDS:
+        setattr(fleet, name, records[name].copy())
+    return fleet
+
+
+def _shared_views(buffers, num_workers, buffer_capacity, num_nodes):
+    """
+    NumPy views onto the shared buffers.
+    """
+    records = np.frombuffer(buffers["records"], dtype=RECORD_DTYPE)
+    records = records.reshape(3, num_workers, buffer_capacity)
+    return {
+        "migrants": records[0],       # [w]: vehicles handed from worker w-1 to w
+        "halo": records[1],           # [w]: vehicles of w near its lower boundary
+        "halo_after": records[2],     # [w]: the same vehicles at the end of the tick
+        "counts": np.frombuffer(buffers["counts"], dtype=np.int64).reshape(3, num_workers),
+        "changed": np.frombuffer(buffers["changed"], dtype=np.int64).reshape(2, num_workers),
+        "actions": np.frombuffer(buffers["actions"], dtype=np.int64),
+        "queue_x": np.frombuffer(buffers["queue_x"], dtype=np.int64),
+        "queue_y": np.frombuffer(buffers["queue_y"], dtype=np.int64),
+        "passed": np.frombuffer(buffers["passed"], dtype=np.int64),
+    }
+
+
+def _partition_worker(remote, parent_remote, barrier, buffers, index, bounds, buffer_capacity,
+                      network_kwargs):
+    """
+    Worker process: steps the partition holding node columns
+    bounds[index]..bounds[index + 1] and exchanges boundary vehicles with
+    its neighbours through the shared buffers.
+    """
+    parent_remote.close()
+    num_workers = len(bounds) - 1
+    first, stop = bounds[index], bounds[index + 1]
+    net = RoadNetwork(columns=(first, stop), **network_kwargs)
+    views = _shared_views(buffers, num_workers, buffer_capacity, net.num_nodes)
+    cols = net.cols
+    own_nodes = np.flatnonzero((np.arange(net.num_nodes) % cols >= first) &
+                               (np.arange(net.num_nodes) % cols < stop))
+    lower = (first - 1) * net.link_length
+    upper = (stop - 1) * net.link_length
+    last = index == num_workers - 1
+
+    while True:
+        cmd, data = remote.recv()
+        if cmd == "close":
+            remote.close()
+            break
+        try:
+            if cmd == "run":
+                ticks, with_actions = data
+                for _ in range(ticks):
+                    _partition_tick(net, views, barrier, index, last, lower, upper, own_nodes,
+                                    with_actions, buffer_capacity)
+                reply = None
+            elif cmd == "gather":
+                reply = (to_records(net.fleet), net.passed[own_nodes], own_nodes, net.exited)
+        except Exception as error:
+            # Wake the workers waiting at a barrier and report to the main process
+            barrier.abort()
+            remote.send(("error", (isinstance(error, BrokenBarrierError), traceback.format_exc())))
+            remote.close()
+            break
+        remote.send(("ok", reply))
+
+
+def _partition_tick(net, views, barrier, index, last, lower, upper, own_nodes, with_actions,
+                    buffer_capacity):
+    """
+    One tick of a partition worker.
+    """
+    # Publish the vehicles the previous partition may follow
+    if index > 0:
+        fleet = net.fleet
+        near = np.flatnonzero((fleet.direction == 0) & (fleet.pos < lower + HALO))
+        _write(views, 1, index, to_records(fleet, near), buffer_capacity)
+    barrier.wait()
+
+    ghosts = None
+    if not last:
+        ghosts = from_records(views["halo"][index + 1, :views["counts"][1, index + 1]])
+    rl_action = views["actions"] if with_actions else None
+    tick = net.begin_step(rl_action=rl_action, ghosts=ghosts)
+    net.move(tick)
+    _settle(net, tick, views, barrier, index, near if index > 0 else None,
+            0 if last else len(ghosts), buffer_capacity)
+    queue_x, queue_y, passed = net.end_step(tick)
+    views["queue_x"][own_nodes] = queue_x[own_nodes]
+    views["queue_y"][own_nodes] = queue_y[own_nodes]
+    views["passed"][own_nodes] = passed[own_nodes]
+
+    # Hand vehicles past the upper boundary to the next partition
+    if not last:
+        fleet = net.fleet
+        leaving = np.flatnonzero((fleet.direction == 0) & (fleet.pos >= upper))
+        records = to_records(fleet, leaving)
+        _write(views, 0, index + 1, records[np.argsort(records["id"])], buffer_capacity)
+        net.pool.release(leaving.tolist())
+    barrier.wait()
+
+    # Take over the vehicles that crossed into this partition
+    if index > 0:
+        migrants = views["migrants"][index, :views["counts"][0, index]]
+        start = net.pool.count
+        if start + len(migrants) > net.pool.capacity:
+            raise RuntimeError("Vehicle pool of the partition is full")
+        for name in VehicleArrays.FIELDS:
+            getattr(net.pool.arrays, name)[start:start + len(migrants)] = migrants[name]
+        net.pool.count += len(migrants)
+
+
+def _settle(net, tick, views, barrier, index, near, num_ghosts, buffer_capacity):
+    """
+    Correction rounds after the first move of a tick. The ghosts were moved
+    from their start-of-tick state without their own leaders, but a follower
+    reacts to where its leader ended up (see VehicleArrays.step). Each round
+    every worker publishes the end-of-tick state of its halo, and a worker
+    whose ghosts ended up elsewhere moves again with the published states.
+    Vehicles only depend on the ones ahead, so the rounds stop after at most
+    one per worker.
+    """
+    fleet = tick["fleet"]
+    ghosts = np.arange(tick["own"].stop, tick["own"].stop + num_ghosts)
+    published = None
+    round_index = 0
+    while True:
+        changed = False
+        if near is not None:
+            after = to_records(fleet, near)
+            if published is None or not _same_state(after, published):
+                _write(views, 2, index, after, buffer_capacity)
+                published = after
+                changed = True
+        flags = views["changed"][round_index % 2]
+        flags[index] = changed
+        barrier.wait()
+        if not flags.any():
+            return
+        if num_ghosts:
+            states = views["halo_after"][index + 1, :num_ghosts]
+            if not _same_state(to_records(fleet, ghosts), states):
+                net.move(tick, known=(ghosts, states["pos"], states["speed"], states["stopped"]))
+        barrier.wait()
+        round_index += 1
+
+
+def _same_state(a, b):
+    return all(np.array_equal(a[name], b[name]) for name in ("pos", "speed", "stopped"))
+
+
+def _write(views, kind, index, records, buffer_capacity):
+    if len(records) > buffer_capacity:
+        raise RuntimeError("Partition exchange buffer too small")
+    target = (views["migrants"], views["halo"], views["halo_after"])[kind]
+    target[index, :len(records)] = records
+    views["counts"][kind, index] = len(records)
+
+
+class PartitionedNetwork:
+    """
+    RoadNetwork split into vertical strips of node columns, one worker
+    process per strip.
+
+    A worker owns the lights of its columns, its Y roads and the X road
+    vehicles whose next node lies in its columns. Each tick it publishes
+    the vehicles just past its lower boundary as a halo for the previous
+    strip, steps its RoadNetwork with the halo of the next strip as ghost
+    leaders, hands vehicles past its upper boundary on and takes in the
+    ones that crossed into its strip. Followers react to the end-of-tick
+    state of their ghost leaders, which the workers exchange in correction
+    rounds (see _settle). Vehicles and halos go through fixed shared-memory
+    buffers; barriers keep the workers in lockstep. Arrivals and troublemaker draws depend only on
+    the seed (see RoadNetwork), so the result is the one of a single
+    RoadNetwork with the same arguments.
+    """
+
+    def __init__(self, rows, cols, num_workers, start_method=None, buffer_capacity=None,
+                 **network_kwargs):
+        self.rows = rows
+        self.cols = cols
+        self.num_nodes = rows * cols
+        self.num_workers = min(num_workers, cols)
+        network_kwargs = dict(network_kwargs, rows=rows, cols=cols)
+        if buffer_capacity is None:
+            buffer_capacity = rows * 64
+
+        if start_method is None:
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = mp.get_context(start_method)
+
+        n = self.num_workers
+        self.buffers = {
+            "records": ctx.RawArray("b", 3 * n * buffer_capacity * RECORD_DTYPE.itemsize),
+            "counts": ctx.RawArray("q", 3 * n),
+            "changed": ctx.RawArray("q", 2 * n),
+            "actions": ctx.RawArray("q", self.num_nodes),
+            "queue_x": ctx.RawArray("q", self.num_nodes),
+            "queue_y": ctx.RawArray("q", self.num_nodes),
+            "passed": ctx.RawArray("q", self.num_nodes),
+        }
+        self.views = _shared_views(self.buffers, n, buffer_capacity, self.num_nodes)
+        self.barrier = barrier = ctx.Barrier(n)
+
+        bounds = [int(b) for b in np.linspace(0, cols, n + 1).astype(int)]
+        self.remotes, self.processes = [], []
+        for index in range(n):
+            remote, work_remote = ctx.Pipe()
+            args = (work_remote, remote, barrier, self.buffers, index, bounds, buffer_capacity,
+                    network_kwargs)
+            process = ctx.Process(target=_partition_worker, args=args, daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.closed = False
+        self.failed = False
+
+    def step(self, rl_action=None):
+        """
+        Advance by one tick; same return values as RoadNetwork.step.
+        """
+        self.run(1, rl_action)
+        return self.views["queue_x"].copy(), self.views["queue_y"].copy(), self.views["passed"].copy()
+
+    def run(self, ticks, rl_action=None):
+        """
+        Advance by `ticks` ticks without returning to the main process in between.
+        """
+        if rl_action is not None:
+            self.views["actions"][:] = rl_action
+        self._command("run", (ticks, rl_action is not None))
+
+    def gather(self):
+        """
+        All vehicles (as records sorted by id), passed totals per node and
+        the number of vehicles that left the network.
+        """
+        records, passed, exited = [], np.zeros(self.num_nodes, dtype=np.int64), 0
+        for part, part_passed, nodes, part_exited in self._command("gather"):
+            records.append(part)
+            passed[nodes] = part_passed
+            exited += part_exited
+        records = np.concatenate(records)
+        return records[np.argsort(records["id"])], passed, exited
+
+    def close(self):
+        if self.closed:
+            return
+        for remote, process in zip(self.remotes, self.processes):
+            try:
+                remote.send(("close", None))
+            except OSError:
+                pass   # the worker already stopped after an error
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def _command(self, cmd, data=None):
+        """
+        Send a command to every worker and return their replies. A failing
+        worker releases the others from the barriers; if a worker dies, the
+        others are terminated. The error is raised here and the network can
+        then only be closed.
+        """
+        if self.failed:
+            raise RuntimeError("A partition worker failed earlier; close the network")
+        for remote in self.remotes:
+            remote.send((cmd, data))
+        replies, errors = [None] * len(self.remotes), []
+        pending = set(range(len(self.remotes)))
+        terminated = False
+        while pending:
+            for index in sorted(pending):
+                remote, process = self.remotes[index], self.processes[index]
+                if remote.poll():
+                    try:
+                        status, reply = remote.recv()
+                    except EOFError:
+                        status, reply = "died", f"worker {index} closed its pipe"
+                elif not process.is_alive():
+                    status, reply = "died", f"worker {index} exited with code {process.exitcode}"
+                else:
+                    continue
+                pending.discard(index)
+                if status == "died":
+                    errors.append((terminated, reply))
+                    if not terminated:
+                        # A dead worker may hold the barrier's lock, so the
+                        # barrier cannot be aborted: stop the others instead
+                        for other in pending:
+                            self.processes[other].terminate()
+                        terminated = True
+                elif status == "error":
+                    errors.append(reply)
+                replies[index] = reply
+            if pending:
+                wait([self.remotes[i] for i in pending] + [self.processes[i].sentinel for i in pending],
+                     POLL_INTERVAL)
+        if errors:
+            self.failed = True
+            # A worker that only saw the barrier break is not the cause
+            errors.sort(key=lambda error: error[0])
+            raise RuntimeError(f"Partition worker failed:\n{errors[0][1]}")
+        return replies
+
+
+def check(rows, cols, num_workers, ticks, modes, seed):
+    """
+    Run a RoadNetwork and a PartitionedNetwork with the same arguments and
+    tell whether the vehicles, passed totals and exit counts are identical.
+    """
+    single = RoadNetwork(rows, cols, modes=modes, seed=seed)
+    for _ in range(ticks):
+        single.step()
+    expected = to_records(single.fleet)
+    expected = expected[np.argsort(expected["id"])]
+
+    city = PartitionedNetwork(rows, cols, num_workers, modes=modes, seed=seed)
+    try:
+        city.run(ticks)
+        records, passed, exited = city.gather()
+    finally:
+        city.close()
+    same = len(records) == len(expected) and all(np.array_equal(records[name], expected[name])
+                                                  for name in RECORD_DTYPE.names)
+    return same and np.array_equal(passed, single.passed) and exited == single.exited
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the partitioned network with one RoadNetwork.")
+    parser.add_argument("--check", action="store_true", help="run the comparison")
+    parser.add_argument("--rows", type=int, default=4)
+    parser.add_argument("--cols", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--ticks", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.check:
+        print("Nothing to do; use --check to compare with RoadNetwork.")
+        return
+    for modes in ("fixed", "adaptive"):
+        same = check(args.rows, args.cols, args.workers, args.ticks, modes, args.seed)
+        print(f"{args.rows}x{args.cols} grid, {args.workers} workers, {args.ticks} ticks, {modes}: "
+              f"{'identical' if same else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import time
+import numpy as np
+from vector_engine import LIGHT_MODE_CODES
+
+# Observations evaluated per forward pass
+MICRO_BATCH = 4096
+
+
+def light_observations(lights, queue_x, queue_y):
+    """
+    Observations [queue_x, queue_y, light_state] of every light of a
+    LightArrays, as IntersectionEnv builds them for one light.
+    """
+    state_num = lights.light_state_numbers()
+    return np.stack([queue_x, queue_y, state_num], axis=1).astype(np.float32)
+
+
+class PolicyService:
+    """
+    Batched policy inference for all RL-controlled lights of a tick.
+
+    Instead of one model.predict per light, the tick loop submits the
+    observation of every RL light, then flush() evaluates them with one
+    model.predict per micro-batch of `batch_size` observations and hands
+    each light its action. predict() does the same for an observation
+    array, and network_actions() for the rl nodes of a RoadNetwork.
+
+    model: anything with predict(observations, deterministic=...) that
+    accepts a batch, e.g. a stable_baselines3 PPO or a numpy_policy.NumpyPolicy.
+    """
+
+    def __init__(self, model, batch_size=MICRO_BATCH, deterministic=True):
+        self.model = model
+        self.batch_size = batch_size
+        self.deterministic = deterministic
+        self.keys = []
+        self.observations = []
+        self.forward_passes = 0
+        self.evaluated = 0
+
+    def submit(self, key, observation):
+        """
+        Queue the observation of one light (key: the light or any hashable id).
+        """
+        self.keys.append(key)
+        self.observations.append(observation)
+
+    def flush(self):
+        """
+        Evaluate everything submitted since the last flush.
+        Returns {key: action}.
+        """
+        if not self.keys:
+            return {}
+        actions = self.predict(np.asarray(self.observations, dtype=np.float32))
+        decided = dict(zip(self.keys, actions.tolist()))
+        self.keys = []
+        self.observations = []
+        return decided
+
+    def predict(self, observations):
+        """
+        Actions for an (n, 3) observation array, one forward pass per micro-batch.
+        """
+        observations = np.asarray(observations, dtype=np.float32).reshape(-1, 3)
+        actions = np.zeros(len(observations), dtype=np.int64)
+        for start in range(0, len(observations), self.batch_size):
+            batch = observations[start:start + self.batch_size]
+            actions[start:start + len(batch)], _ = self.model.predict(batch, deterministic=self.deterministic)
+            self.forward_passes += 1
+        self.evaluated += len(observations)
+        return actions
+
+    def network_actions(self, network, queue_x, queue_y, actions=None):
+        """
+        Action of every node of a RoadNetwork for its next step, from the
+        queues its last step returned; only rl nodes are evaluated, the
+        others get 0.
+        """
+        if actions is None:
+            actions = np.zeros(network.num_nodes, dtype=np.int64)
+        rl_nodes = np.flatnonzero(network.lights.mode == LIGHT_MODE_CODES["rl"])
+        if rl_nodes.size:
+            observations = light_observations(network.lights, queue_x, queue_y)
+            actions[rl_nodes] = self.predict(observations[rl_nodes])
+        return actions
+
+
+def bench_lights(model, num_lights, ticks, batch_size):
+    """
+    Seconds per tick to decide `num_lights` lights with one predict per
+    light and with the service.
+    """
+    rng = np.random.default_rng(0)
+    observations = np.column_stack([rng.integers(0, 10, (num_lights, 2)),
+                                    rng.integers(0, 2, num_lights)]).astype(np.float32)
+    service = PolicyService(model, batch_size)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        single = [model.predict(obs, deterministic=True)[0] for obs in observations]
+    per_light = (time.perf_counter() - start) / ticks
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for i, obs in enumerate(observations):
+            service.submit(i, obs)
+        decided = service.flush()
+    batched = (time.perf_counter() - start) / ticks
+
+    same = all(int(decided[i]) == int(a) for i, a in enumerate(single))
+    return per_light, batched, same
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Per-light vs batched policy inference.")
+    parser.add_argument("--model", default="traffic_rl_model",
+                        help="agent path; the .npz export is used when present")
+    parser.add_argument("--lights", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=MICRO_BATCH)
+    return parser.parse_args()
+
+
+def main():
+    from numpy_policy import load_policy
+    args = parse_args()
+    model = load_policy(args.model)
+    for num_lights in args.lights:
+        per_light, batched, same = bench_lights(model, num_lights, args.ticks, args.batch_size)
+        print(f"{num_lights:6d} lights: per-light {per_light * 1e3:9.2f} ms/tick, "
+              f"batched {batched * 1e3:7.2f} ms/tick ({per_light / batched:5.1f}x), "
+              f"same actions: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import json
+import random
+import time
+
+# Phases of a simulation tick, in the order they run
+PHASES = ("policy", "light_update", "v2i", "boundary", "leader_search", "move", "collision",
+          "reward", "logging", "rendering")
+
+
+class PhaseTimer:
+    """
+    Wall time per phase of the simulation tick.
+
+    The tick loops call start() at the beginning of a tick and mark(phase)
+    right after each phase; the time since the previous mark is attributed
+    to that phase. Loops take the timer as an optional argument and skip
+    the calls entirely when it is None, so an unprofiled run pays one
+    `is not None` test per phase.
+
+    With trace=True every phase is also kept as an event, and
+    write_chrome_trace() saves them as a timeline that chrome://tracing or
+    Perfetto can open (keep traces to an episode or so).
+    """
+
+    def __init__(self, trace=False):
+        self.totals = {}
+        self.calls = {}
+        self.ticks = 0
+        self.events = [] if trace else None
+        self._origin = time.perf_counter()
+        self._last = self._origin
+
+    def start(self):
+        """
+        Begin a tick.
+        """
+        self.ticks += 1
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """
+        Attribute the time since the previous start()/mark() to `phase`.
+        """
+        now = time.perf_counter()
+        self.totals[phase] = self.totals.get(phase, 0.0) + (now - self._last)
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        if self.events is not None:
+            self.events.append((phase, self._last, now))
+        self._last = now
+
+    def summary(self):
+        """
+        Per-phase totals: {phase: {"seconds", "calls", "share"}} in tick order.
+        """
+        total = sum(self.totals.values())
+        order = [p for p in PHASES if p in self.totals] + [p for p in self.totals if p not in PHASES]
+        return {p: {"seconds": self.totals[p], "calls": self.calls[p],
+                    "share": self.totals[p] / total if total else 0.0} for p in order}
+
+    def report(self, label="Phase timing"):
+        """
+        Aggregated counters as a printable table.
+        """
+        lines = [f"=== {label} ({self.ticks} ticks) ==="]
+        for phase, s in self.summary().items():
+            per_tick = s["seconds"] / self.ticks * 1e6 if self.ticks else 0.0
+            lines.append(f"{phase:<14}{s['seconds']:>10.4f}s {per_tick:>10.1f} us/tick {s['share']:>7.1%}")
+        return "\n".join(lines)
+
+    def chrome_trace(self, pid=0, tid=0, name=None):
+        """
+        Recorded events in the Chrome trace event format (complete events, microseconds).
+        """
+        if self.events is None:
+            raise ValueError("PhaseTimer was created without trace=True")
+        events = [{"name": phase, "ph": "X", "pid": pid, "tid": tid,
+                   "ts": (begin - self._origin) * 1e6, "dur": (end - begin) * 1e6}
+                  for phase, begin, end in self.events]
+        if name is not None:
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": name}})
+        return events
+
+    def write_chrome_trace(self, path, name=None):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.chrome_trace(name=name), "displayTimeUnit": "ms"}, f)
+
+
+def profile_env(num_vehicles, dt, engine, ticks, trace=False):
+    """
+    Run IntersectionEnv with a PhaseTimer for `ticks` steps (alternating actions).
+    """
+    from intersection_env import IntersectionEnv
+    timer = PhaseTimer(trace)
+    env = IntersectionEnv(num_vehicles_x=num_vehicles // 2, num_vehicles_y=num_vehicles - num_vehicles // 2,
+                          sim_duration=ticks * dt, dt=dt, engine=engine)
+    env.timer = timer
+    env.reset(seed=0)
+    for k in range(ticks):
+        env.step(k % 2)
+    return timer
+
+
+def profile_sim_step(num_vehicles, dt, mode, ticks, trace=False):
+    """
+    Run animated_compare.sim_step headless with a PhaseTimer.
+    """
+    from animated_compare import sim_step, load_rl_model
+    from intersection_env import generate_vehicles
+    from traffic_light import TrafficLight
+    from leader_index import LeaderIndex
+    model = load_rl_model() if mode == "rl" else None
+    random.seed(0)
+    vehicles = generate_vehicles(num_vehicles // 2, num_vehicles - num_vehicles // 2)
+    light = TrafficLight(position=0, mode=mode)
+    index = LeaderIndex(vehicles)
+    timer = PhaseTimer(trace)
+    for k in range(ticks):
+        sim_step(k * dt, vehicles, light, index, model=model, dt=dt, timer=timer)
+    return timer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Per-phase timing of the simulation tick.")
+    parser.add_argument("--target", choices=["env", "sim_step"], default="env")
+    parser.add_argument("--engine", choices=["objects", "arrays", "jit"], default="objects",
+                        help="IntersectionEnv engine (target env)")
+    parser.add_argument("--mode", choices=["fixed", "adaptive", "rl"], default="adaptive",
+                        help="light mode (target sim_step)")
+    parser.add_argument("--vehicles", type=int, default=1024)
+    parser.add_argument("--dt", type=float, default=0.25)
+    parser.add_argument("--ticks", type=int, default=480, help="ticks to run (480 = one 120 s episode)")
+    parser.add_argument("--trace", help="write a Chrome trace JSON timeline to this path")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    trace = args.trace is not None
+    if args.target == "env":
+        timer = profile_env(args.vehicles, args.dt, args.engine, args.ticks, trace)
+        label = f"IntersectionEnv.step ({args.engine}, {args.vehicles} vehicles)"
+    else:
+        timer = profile_sim_step(args.vehicles, args.dt, args.mode, args.ticks, trace)
+        label = f"sim_step ({args.mode}, {args.vehicles} vehicles)"
+    print(timer.report(label))
+    if trace:
+        timer.write_chrome_trace(args.trace, name=label)
+        print(f"Trace written to {args.trace}")
+
+
+if __name__ == "__main__":
+    main()
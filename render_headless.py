@@ -0,0 +1,365 @@
+import argparse
+import io
+import multiprocessing as mp
+import random
+import struct
+import subprocess
+import time
+from collections import deque
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+import numpy as np
+from PIL import Image
+from animated_compare import generate_vehicles, setup_scene, sim_step, load_rl_model, \
+    LIGHT_POSITION, DT, NUM_VEHICLES_X, NUM_VEHICLES_Y
+from traffic_light import TrafficLight
+from leader_index import LeaderIndex
+from v2i import V2IBus
+from snapshot import Snapshot
+from vector_engine import LIGHT_STATE_CODES
+
+# Vehicle colors of animated_compare.sim_step, by color code
+VEHICLE_COLORS = ("blue", "orange", "red", "purple")
+
+# Colors of the X and Y light circles (animated_compare.update_lights), by light state code
+LIGHT_COLORS = (("green", "red"), ("yellow", "yellow"), ("red", "green"), ("yellow", "yellow"))
+
+PANEL_TITLES = {"fixed": "Fixed Timer", "adaptive": "Adaptive (V2I)", "rl": "Reinforcement Learning",
+                "rl_table": "RL (policy table)", "mpc": "MPC"}
+
+# Colors per GIF frame
+GIF_COLORS = 64
+
+# Frames rendered per worker task
+CHUNK_FRAMES = 16
+
+
+class FrameRecorder:
+    """
+    Vehicle positions, colors and the light state of every tick of one
+    run, for rendering afterwards. Has the recorder interface of
+    trajectory_log, so sim_step fills it.
+    """
+
+    def __init__(self):
+        self.times = []
+        self.x = []
+        self.y = []
+        self.colors = []
+        self.light_states = []
+
+    def record(self, t, vehicles, light_state):
+        self.times.append(t)
+        self.x.append([v.x for v in vehicles])
+        self.y.append([v.y for v in vehicles])
+        self.colors.append([3 if v.is_troublemaker else 2 if v.stopped else 0 if v.type == "car" else 1
+                            for v in vehicles])
+        self.light_states.append(LIGHT_STATE_CODES[light_state])
+
+    def close(self):
+        pass
+
+
+def record_comparison(modes, duration, dt=DT, seed=42, num_vehicles=(NUM_VEHICLES_X, NUM_VEHICLES_Y),
+                      model=None):
+    """
+    Run the animated_compare scenario headless for the given light modes
+    and return its frames: {"time": (frames,), "x", "y": (panels, frames,
+    vehicles), "colors", "light_states"}. Modes are stepped in turn every
+    tick like in animated_compare, so fixed/adaptive/rl give the same
+    frames as the animation.
+    """
+    from compile_policy import PolicyTable
+    from mpc import MPCPlanner
+
+    random.seed(seed)
+    start = Snapshot.capture(generate_vehicles(*num_vehicles), rng=None)
+    runs = []
+    for mode in modes:
+        vehicles = start.restore(rng=None)[0]
+        light = TrafficLight(position=LIGHT_POSITION, mode=mode)
+        light.bus = V2IBus(LIGHT_POSITION)
+        light.bus.register(vehicles)
+        if mode == "rl_table":
+            light.policy_table = PolicyTable.load()
+        elif mode == "mpc":
+            light.planner = MPCPlanner(vehicles)
+        runs.append((vehicles, light, LeaderIndex(vehicles), FrameRecorder()))
+
+    for frame in range(int(duration / dt)):
+        t = frame * dt
+        for vehicles, light, index, recorder in runs:
+            sim_step(t, vehicles, light, index, model=model, recorder=recorder, dt=dt)
+
+    recorders = [run[3] for run in runs]
+    return {
+        "time": np.array(recorders[0].times),
+        "x": np.array([r.x for r in recorders], dtype=np.float32),
+        "y": np.array([r.y for r in recorders], dtype=np.float32),
+        "colors": np.array([r.colors for r in recorders], dtype=np.int8),
+        "light_states": np.array([r.light_states for r in recorders], dtype=np.int8),
+    }
+
+
+class FrameRenderer:
+    """
+    Draws recorded frames off-screen.
+
+    The scene of every panel (roads, stop lines, titles) is drawn once
+    with setup_scene and kept as a background; a frame restores it and
+    draws one PolyCollection with all vehicles per panel, the light
+    circles and the time on top.
+
+    frames: recorded frames for render() (see record_comparison), None
+    when only draw() is used.
+    figure: draw into this (e.g. pyplot) figure instead of an off-screen
+    one; only set_panels() is used then, the caller redraws.
+    """
+
+    def __init__(self, frames, titles, dpi=72, figure=None):
+        self.frames = frames
+        panels = len(titles)
+        offscreen = figure is None
+        if offscreen:
+            figure = Figure(figsize=(6 * panels, 6), dpi=dpi)
+            FigureCanvasAgg(figure)
+        self.fig = figure
+        self.axes = figure.subplots(1, panels, squeeze=False)[0]
+        self.lights = []
+        self.vehicles = []
+        for ax, title in zip(self.axes, titles):
+            self.lights.append(setup_scene(ax, title))
+            collection = PolyCollection([], linewidths=0)
+            ax.add_collection(collection)
+            self.vehicles.append(collection)
+        self.clock = self.fig.text(0.5, 0.015, "", ha="center")
+        self.fig.subplots_adjust(left=0.01, right=0.99, bottom=0.06, top=0.93, wspace=0.05)
+
+        # Corners of the 4 x 4 m vehicle squares around their position
+        self.corners = np.array([[-2, -2], [2, -2], [2, 2], [-2, 2]], dtype=np.float32)
+
+        self.background = None
+        if offscreen:
+            dynamic = [self.clock] + self.vehicles + [c for pair in self.lights for c in pair]
+            for artist in dynamic:
+                artist.set_visible(False)
+            self.fig.canvas.draw()
+            self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+            for artist in dynamic:
+                artist.set_visible(True)
+
+    def set_panels(self, panels, t):
+        """
+        Update the vehicles and lights of every panel from
+        (x, y, colors, light_state) tuples (colors as VEHICLE_COLORS codes,
+        light_state as a code, None to keep the lights) and the clock to t.
+        """
+        for (x, y, colors, light_state), collection, (light_x, light_y) in zip(
+                panels, self.vehicles, self.lights):
+            collection.set_verts(np.stack([x, y], axis=1)[:, None, :] + self.corners)
+            collection.set_facecolor([VEHICLE_COLORS[c] for c in colors])
+            if light_state is not None:
+                color_x, color_y = LIGHT_COLORS[light_state]
+                light_x.set_color(color_x)
+                light_y.set_color(color_y)
+        self.clock.set_text(f"t = {t:.1f} s")
+
+    def render(self, index):
+        """
+        RGB array of frame `index`.
+        """
+        frames = self.frames
+        return self.draw([(frames["x"][panel, index], frames["y"][panel, index],
+                           frames["colors"][panel, index], frames["light_states"][panel, index])
+                          for panel in range(len(self.axes))], frames["time"][index])
+
+    def draw(self, panels, t):
+        """
+        RGB array of the given panels (see set_panels) at time t.
+        """
+        self.set_panels(panels, t)
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        for ax, collection, lights in zip(self.axes, self.vehicles, self.lights):
+            ax.draw_artist(collection)
+            ax.draw_artist(lights[0])
+            ax.draw_artist(lights[1])
+        self.fig.draw_artist(self.clock)
+        return np.asarray(canvas.buffer_rgba())[..., :3].copy()
+
+
+def gif_frame(rgb, delay, colors=GIF_COLORS):
+    """
+    One frame for GifWriter: (screen descriptor and color table, frame
+    block with its own color table and a delay of `delay` 1/100 s).
+    """
+    image = Image.fromarray(rgb).quantize(colors, method=Image.Quantize.FASTOCTREE,
+                                          dither=Image.Dither.NONE)
+    buffer = io.BytesIO()
+    image.save(buffer, "GIF", interlace=False)
+    data = buffer.getvalue()
+
+    flags = data[10]
+    table_end = 13 + (3 << ((flags & 7) + 1) if flags & 0x80 else 0)
+    screen = data[6:table_end]
+    pos = table_end
+    while data[pos] == 0x21:   # skip extension blocks
+        pos += 2
+        while data[pos]:
+            pos += data[pos] + 1
+        pos += 1
+
+    # Move the global color table into the image descriptor
+    descriptor = bytearray(data[pos:pos + 10])
+    descriptor[9] = (descriptor[9] & 0x40) | 0x80 | (flags & 7)
+    control = b"!\xf9\x04\x00" + struct.pack("<H", delay) + b"\x00\x00"
+    return screen, control + bytes(descriptor) + data[13:table_end] + data[pos + 10:-1]
+
+
+class GifWriter:
+    """
+    Streams frames from gif_frame to a looping GIF file: each block is
+    written when it arrives, so only the frames in flight are in memory.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.started = False
+
+    def write(self, frame):
+        screen, block = frame
+        if not self.started:
+            self.file.write(b"GIF89a" + screen + b"!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+            self.started = True
+        self.file.write(block)
+
+    def close(self):
+        self.file.write(b";")
+        self.file.close()
+
+
+class FFmpegWriter:
+    """
+    Streams raw RGB frames into an ffmpeg process (H.264 video); needs
+    ffmpeg on the PATH.
+    """
+
+    def __init__(self, path, fps):
+        self.path = path
+        self.fps = fps
+        self.process = None
+
+    def write(self, rgb):
+        if self.process is None:
+            height, width, _ = rgb.shape
+            command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                       "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "-",
+                       "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+                       "-vcodec", "libx264", self.path]
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.process.stdin.write(rgb.tobytes())
+
+    def close(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        if self.process.wait():
+            raise RuntimeError(f"ffmpeg failed writing {self.path}")
+
+
+# --- Worker processes ---
+
+_renderer = None
+_encode = None
+
+
+def _init_worker(frames, titles, dpi, gif_delay):
+    global _renderer, _encode
+    _renderer = FrameRenderer(frames, titles, dpi)
+    _encode = (lambda rgb: gif_frame(rgb, gif_delay)) if gif_delay else (lambda rgb: rgb)
+
+
+def _render_chunk(bounds):
+    return [_encode(_renderer.render(i)) for i in range(*bounds)]
+
+
+def render_video(frames, titles, output, fps=8, every=1, workers=None, dpi=72,
+                 chunk=CHUNK_FRAMES, start_method=None):
+    """
+    Render every `every`-th recorded frame to `output` (.gif, or any
+    video format ffmpeg writes) with `workers` processes. Chunks of
+    frames are rendered (and GIF-encoded) in the workers and written in
+    order as they finish; at most two chunks per worker are in flight.
+    Returns the number of frames written.
+    """
+    workers = workers or mp.cpu_count()
+    indices = np.arange(0, len(frames["time"]), every)
+    if every > 1:
+        frames = dict(frames, time=frames["time"][indices],
+                      **{name: frames[name][:, indices] for name in ("x", "y", "colors", "light_states")})
+    num_frames = len(indices)
+    gif = output.lower().endswith(".gif")
+    gif_delay = max(1, round(100 / fps)) if gif else 0
+    writer = GifWriter(output) if gif else FFmpegWriter(output, fps)
+    chunks = [(start, min(start + chunk, num_frames)) for start in range(0, num_frames, chunk)]
+
+    try:
+        if workers == 1:
+            _init_worker(frames, titles, dpi, gif_delay)
+            for bounds in chunks:
+                for frame in _render_chunk(bounds):
+                    writer.write(frame)
+            return num_frames
+
+        ctx = mp.get_context(start_method)
+        with ctx.Pool(workers, _init_worker, (frames, titles, dpi, gif_delay)) as pool:
+            pending = deque()
+            for bounds in chunks:
+                pending.append(pool.apply_async(_render_chunk, (bounds,)))
+                if len(pending) >= 2 * workers:
+                    for frame in pending.popleft().get():
+                        writer.write(frame)
+            while pending:
+                for frame in pending.popleft().get():
+                    writer.write(frame)
+    finally:
+        writer.close()
+    return num_frames
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render the controller comparison headless to a GIF or video.")
+    parser.add_argument("--output", default="visuals/simulation_comparison.gif",
+                        help=".gif, or a video file written by ffmpeg (e.g. .mp4)")
+    parser.add_argument("--modes", nargs="+", default=["fixed", "adaptive", "rl"],
+                        choices=list(PANEL_TITLES))
+    parser.add_argument("--duration", type=float, default=60, help="simulated seconds")
+    parser.add_argument("--vehicles", type=int, nargs=2, default=[NUM_VEHICLES_X, NUM_VEHICLES_Y],
+                        metavar=("X", "Y"))
+    parser.add_argument("--fps", type=float, default=8)
+    parser.add_argument("--every", type=int, default=1, help="render every n-th tick")
+    parser.add_argument("--workers", type=int, default=None, help="default: one per CPU")
+    parser.add_argument("--dpi", type=int, default=72)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    model = load_rl_model() if "rl" in args.modes else None
+    modes = [m for m in args.modes if m != "rl" or model is not None]
+
+    start = time.perf_counter()
+    frames = record_comparison(modes, args.duration, num_vehicles=args.vehicles, model=model)
+    recorded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    count = render_video(frames, [PANEL_TITLES[m] for m in modes], args.output, args.fps, args.every,
+                         args.workers, args.dpi)
+    rendered = time.perf_counter() - start
+    print(f"Simulated {len(frames['time'])} ticks in {recorded:.1f}s, rendered {count} frames "
+          f"in {rendered:.1f}s ({count / rendered:.1f} frames/s) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import argparse
+import io
+import os
+import time
+import numpy as np
+import pandas as pd
+from trajectory_log import LOG_COLUMNS, open_columns
+from vector_engine import DIRECTION_CODES, LIGHT_STATE_CODES
+
+# Rows scanned at once while building an index
+SCAN_ROWS = 1 << 20
+
+INDEX_FILE = "time_index.npz"
+
+
+class TimeIndex:
+    """
+    The ticks of a trajectory log: the time of every tick, where its rows
+    start (row number, byte offset for CSV; one extra entry for the end
+    of the log) and its light state. About 13 bytes per tick, whatever
+    the number of vehicles.
+    """
+
+    __slots__ = ("times", "offsets", "light_states")
+
+    def __init__(self, times, offsets, light_states):
+        self.times = np.asarray(times, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.light_states = np.asarray(light_states, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.times)
+
+    def tick(self, t):
+        """
+        Last tick at or before time t (-1 before the first one).
+        """
+        return int(np.searchsorted(self.times, np.float32(t), side="right")) - 1
+
+    def step(self):
+        """
+        Time between ticks (median; 1 s for a log of one tick).
+        """
+        return float(np.median(np.diff(self.times))) if len(self.times) > 1 else 1.0
+
+    def save(self, path, source):
+        np.savez(path, times=self.times, offsets=self.offsets, light_states=self.light_states,
+                 source=_signature(source))
+
+    @classmethod
+    def load(cls, path, source):
+        """
+        Index saved for `source`, None if there is none or the log changed since.
+        """
+        try:
+            with np.load(path) as data:
+                if not np.array_equal(data["source"], _signature(source)):
+                    return None
+                return cls(data["times"], data["offsets"], data["light_states"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def _signature(source):
+    """
+    Size and modification time of a log file, to detect stale indexes.
+    """
+    stat = os.stat(source)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def _tick_starts(blocks):
+    """
+    (first rows, times, light states) of the ticks in consecutive blocks
+    of the time and light_state columns, given as (times, light_states)
+    pairs, so only one block is in memory at a time.
+    """
+    starts, tick_times, states = [], [], []
+    previous, row = None, 0
+    for times, light_states in blocks:
+        block = np.asarray(times)
+        if not len(block):
+            continue
+        changes = np.flatnonzero(block[1:] != block[:-1]) + 1
+        if previous is None or block[0] != previous:
+            changes = np.concatenate([[0], changes])
+        starts.append(changes + row)
+        tick_times.append(block[changes])
+        states.append(np.asarray(light_states)[changes])
+        previous = block[-1]
+        row += len(block)
+    if not starts:
+        return np.zeros(0, np.int64), np.zeros(0, np.float32), np.zeros(0, np.int8)
+    return np.concatenate(starts), np.concatenate(tick_times), np.concatenate(states)
+
+
+class LogReader:
+    """
+    Random access to the ticks of one trajectory log (.npy directory,
+    Parquet or CSV file, see trajectory_log) through a TimeIndex.
+
+    The index is built with one pass over the time column (for CSV over
+    the lines) and saved next to the log (time_index.npz in an .npy
+    directory, <log>.index.npz otherwise); it is rebuilt when the log
+    changes. read(tick) then loads only the rows of that tick: a
+    memory-mapped slice, one seek and read of the CSV file, or the row
+    group of a Parquet file, so memory use does not grow with the log.
+    """
+
+    def __init__(self, path, rebuild=False):
+        self.path = path
+        if os.path.isdir(path):
+            self.kind = "npy"
+            self.columns = open_columns(path)
+            source, index_path = os.path.join(path, "time.npy"), os.path.join(path, INDEX_FILE)
+        else:
+            self.kind = "parquet" if path.endswith(".parquet") else "csv"
+            source, index_path = path, path + ".index.npz"
+        if self.kind == "parquet":
+            import pyarrow.parquet
+            self.file = pyarrow.parquet.ParquetFile(path)
+            sizes = [self.file.metadata.row_group(g).num_rows for g in range(self.file.num_row_groups)]
+            self.group_starts = np.concatenate([[0], np.cumsum(sizes)])
+            self.group = None   # (first row, end row, columns) of the row groups read last
+        elif self.kind == "csv":
+            self.file = open(path, "rb")
+
+        self.index = None if rebuild else TimeIndex.load(index_path, source)
+        if self.index is None:
+            self.index = self.build_index()
+            try:
+                self.index.save(index_path, source)
+            except OSError:
+                pass   # read-only location: keep the index in memory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def build_index(self):
+        if self.kind == "npy":
+            times, states = self.columns["time"], self.columns["light_state"]
+            starts, times, states = _tick_starts(
+                (times[row:row + SCAN_ROWS], states[row:row + SCAN_ROWS])
+                for row in range(0, len(times), SCAN_ROWS))
+            total = len(self.columns["time"])
+        elif self.kind == "parquet":
+            batches = self.file.iter_batches(SCAN_ROWS, columns=["time", "light_state"])
+            starts, times, states = _tick_starts(
+                (batch.column("time").to_numpy(), batch.column("light_state").to_numpy())
+                for batch in batches)
+            total = int(self.group_starts[-1])
+        else:
+            starts, times, states = self._scan_csv()
+            total = os.path.getsize(self.path)
+        return TimeIndex(times, np.append(starts, total), states)
+
+    def _scan_csv(self):
+        """
+        Byte offsets, times and light states of the ticks of the CSV file.
+        """
+        starts, times, states = [], [], []
+        previous = None
+        with open(self.path, "rb") as f:
+            offset = len(f.readline())   # header
+            for line in f:
+                head = line[:line.find(b",")]
+                if head != previous:
+                    previous = head
+                    starts.append(offset)
+                    times.append(float(head))
+                    states.append(LIGHT_STATE_CODES[line.rstrip().rsplit(b",", 1)[1].decode()])
+                offset += len(line)
+        return np.array(starts, dtype=np.int64), times, states
+
+    def read(self, tick):
+        """
+        Columns of one tick, as in trajectory_log.open_columns (direction
+        and light_state as codes).
+        """
+        start, end = self.index.offsets[tick], self.index.offsets[tick + 1]
+        if self.kind == "npy":
+            return {name: np.asarray(column[start:end]) for name, column in self.columns.items()}
+        if self.kind == "parquet":
+            return self._read_rows(start, end)
+        self.file.seek(start)
+        frame = pd.read_csv(io.BytesIO(self.file.read(end - start)), header=None, names=list(LOG_COLUMNS))
+        columns = {name: frame[name].to_numpy(dtype) for name, dtype in LOG_COLUMNS.items()
+                   if name not in ("direction", "light_state")}
+        columns["direction"] = frame["direction"].map(DIRECTION_CODES).to_numpy(np.int8)
+        columns["light_state"] = frame["light_state"].map(LIGHT_STATE_CODES).to_numpy(np.int8)
+        return columns
+
+    def _read_rows(self, start, end):
+        """
+        Rows [start, end) of the Parquet file; the row groups read are
+        kept until a row outside them is asked for.
+        """
+        if self.group is None or not (self.group[0] <= start and end <= self.group[1]):
+            first = int(np.searchsorted(self.group_starts, start, side="right")) - 1
+            last = int(np.searchsorted(self.group_starts, end, side="left"))
+            table = self.file.read_row_groups(list(range(first, last)))
+            self.group = (self.group_starts[first], self.group_starts[last],
+                          {name: table.column(name).to_numpy() for name in LOG_COLUMNS})
+        offset = self.group[0]
+        return {name: column[start - offset:end - offset] for name, column in self.group[2].items()}
+
+    def panel(self, t):
+        """
+        (x, y, colors, light_state) of the last tick at or before t for
+        render_headless.FrameRenderer; no vehicles and no light state
+        before the first tick. The log has no vehicle types, so moving
+        vehicles are all drawn as cars.
+        """
+        tick = self.index.tick(t)
+        if tick < 0:
+            empty = np.zeros(0, np.float32)
+            return empty, empty, np.zeros(0, np.int8), None
+        columns = self.read(tick)
+        colors = np.where(columns["troublemaker"], 3, np.where(columns["stopped"], 2, 0))
+        return columns["position_x"], columns["position_y"], colors, int(self.index.light_states[tick])
+
+    def close(self):
+        if self.kind == "csv":
+            self.file.close()
+
+
+def replay_clock(readers, start=None, end=None, every=1):
+    """
+    Display times of a replay: every `every`-th tick time of the logs
+    (merged), from `start` (default: the first tick of any log) to `end`
+    (default: the last one). The times are those of the index, so every
+    frame shows a tick of its own whatever the rounding of the log times.
+    """
+    times = np.unique(np.concatenate([reader.index.times for reader in readers]))
+    if start is not None:
+        times = times[times >= np.float32(start)]
+    if end is not None:
+        times = times[times <= np.float32(end)]
+    return times[::every]
+
+
+def write_replay(readers, titles, clock, output, fps=8, dpi=72):
+    """
+    Render the logs side by side at the given times to `output` (.gif or
+    a video written by ffmpeg), one frame at a time. Returns the number
+    of frames written.
+    """
+    from render_headless import FrameRenderer, GifWriter, FFmpegWriter, gif_frame
+
+    renderer = FrameRenderer(None, titles, dpi)
+    gif = output.lower().endswith(".gif")
+    delay = max(1, round(100 / fps))
+    writer = GifWriter(output) if gif else FFmpegWriter(output, fps)
+    try:
+        for t in clock:
+            rgb = renderer.draw([reader.panel(t) for reader in readers], t)
+            writer.write(gif_frame(rgb, delay) if gif else rgb)
+    finally:
+        writer.close()
+    return len(clock)
+
+
+class ReplayViewer:
+    """
+    Interactive side-by-side replay of several logs.
+
+    Plays `clock` at `fps` frames per second; the slider seeks to any
+    time, space pauses/resumes, the arrow keys step one display frame
+    back or forward and home jumps to the start. Every frame reads only
+    the ticks it shows.
+    """
+
+    def __init__(self, readers, titles, clock, fps=8):
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation
+        from matplotlib.widgets import Slider
+        from render_headless import FrameRenderer
+
+        self.readers = readers
+        self.clock = clock
+        self.position = 0
+        self.playing = True
+        self.fig = plt.figure(figsize=(6 * len(readers), 6.6))
+        self.renderer = FrameRenderer(None, titles, figure=self.fig)
+        self.fig.subplots_adjust(bottom=0.13)
+        self.slider = Slider(self.fig.add_axes([0.2, 0.06, 0.6, 0.03]), "time (s)", clock[0], clock[-1],
+                             valinit=clock[0])
+        self.slider.on_changed(self.seek)
+        self.fig.canvas.mpl_connect("key_press_event", self.on_key)
+        self.show(0)
+        self.animation = FuncAnimation(self.fig, self.advance, interval=1000 / fps, cache_frame_data=False)
+
+    def show(self, position):
+        self.position = position
+        t = self.clock[position]
+        self.renderer.set_panels([reader.panel(t) for reader in self.readers], t)
+        self.fig.canvas.draw_idle()
+
+    def seek(self, t):
+        self.show(int(np.clip(np.searchsorted(self.clock, t, side="right") - 1, 0, len(self.clock) - 1)))
+
+    def move_to(self, position):
+        # The slider calls seek() for the new time
+        self.slider.set_val(self.clock[min(max(position, 0), len(self.clock) - 1)])
+
+    def advance(self, _):
+        if not self.playing:
+            return
+        if self.position + 1 >= len(self.clock):
+            self.playing = False
+            return
+        self.move_to(self.position + 1)
+
+    def on_key(self, event):
+        if event.key == " ":
+            self.playing = not self.playing
+        elif event.key in ("left", "right"):
+            self.playing = False
+            self.move_to(self.position + (1 if event.key == "right" else -1))
+        elif event.key == "home":
+            self.move_to(0)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay trajectory logs side by side.")
+    parser.add_argument("logs", nargs="+", help=".npy log directories, .parquet or .csv files")
+    parser.add_argument("--titles", nargs="+", help="panel titles (default: the log names)")
+    parser.add_argument("--start", type=float, help="seconds; default: the first tick")
+    parser.add_argument("--end", type=float, help="seconds; default: the last tick")
+    parser.add_argument("--every", type=int, default=1, help="show every n-th tick")
+    parser.add_argument("--fps", type=float, default=8)
+    parser.add_argument("--output", help="write a .gif (or a video via ffmpeg) instead of opening a window")
+    parser.add_argument("--dpi", type=int, default=72)
+    parser.add_argument("--rebuild-index", action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    titles = args.titles or [os.path.basename(os.path.normpath(log)) for log in args.logs]
+
+    start = time.perf_counter()
+    readers = [LogReader(log, args.rebuild_index) for log in args.logs]
+    for log, reader in zip(args.logs, readers):
+        print(f"{log}: {len(reader.index)} ticks")
+    print(f"Indexes ready in {time.perf_counter() - start:.2f}s")
+
+    clock = replay_clock(readers, args.start, args.end, args.every)
+    if not len(clock):
+        print("The logs are empty.")
+        return
+    if args.output:
+        start = time.perf_counter()
+        count = write_replay(readers, titles, clock, args.output, args.fps, args.dpi)
+        print(f"Rendered {count} frames in {time.perf_counter() - start:.1f}s to {args.output}")
+    else:
+        import matplotlib.pyplot as plt
+        viewer = ReplayViewer(readers, titles, clock, args.fps)
+        plt.show()
+    for reader in readers:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
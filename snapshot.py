@@ -0,0 +1,192 @@
+import argparse
+import copy
+import random
+import time
+import numpy as np
+from vehicle import Vehicle
+from traffic_light import TrafficLight
+from vector_engine import DIRECTION_CODES, DIRECTION_NAMES, LIGHT_STATES, LIGHT_STATE_CODES, \
+    LIGHT_MODES, LIGHT_MODE_CODES
+
+HEADER_DTYPE = np.dtype([("num_vehicles", "<i8"), ("has_light", "<i8"), ("has_rng", "<i8"),
+                         ("time", "<f8"), ("gauss_next", "<f8")])
+
+VEHICLE_DTYPE = np.dtype([("id", "<i8"), ("direction", "<i8"), ("lane", "<i8"), ("x", "<f8"),
+                          ("y", "<f8"), ("length", "<f8"), ("max_speed", "<f8"), ("speed", "<f8"),
+                          ("acceleration", "<f8"), ("deceleration", "<f8"),
+                          ("reaction_delay", "<f8"), ("delay_timer", "<f8"), ("stopped", "<i8"),
+                          ("is_troublemaker", "<i8")])
+
+LIGHT_DTYPE = np.dtype([("mode", "<i8"), ("state", "<i8"), ("position", "<f8"), ("timer", "<f8"),
+                        ("cycle_time", "<f8"), ("min_green_time", "<f8"), ("green_timer", "<f8"),
+                        ("queue_x", "<i8"), ("queue_y", "<i8"), ("yellow_timer", "<f8"),
+                        ("yellow_duration", "<f8"), ("red_timer", "<f8"), ("max_red_time", "<f8")])
+
+# Mersenne Twister state of random.Random: 624 words and the position
+RNG_WORDS = 625
+
+_LIGHT_NUMBERS = ("position", "timer", "cycle_time", "min_green_time", "green_timer", "queue_x",
+                  "queue_y", "yellow_timer", "yellow_duration", "red_timer", "max_red_time")
+
+
+class Snapshot:
+    """
+    The state of one intersection simulation (Vehicle objects, the
+    TrafficLight timers and state, the time and the RNG state) in a single
+    bytes buffer.
+
+    capture() packs it into fixed-size records, restore() builds new
+    Vehicle and TrafficLight objects from it, so a snapshot can be
+    restored any number of times (forks for what-if rollouts, A/B runs of
+    one scenario) and saved to disk as a checkpoint. V2I buses, leader
+    indexes and policy tables are not part of the state: attach them to
+    the restored objects again.
+    """
+
+    __slots__ = ("buffer",)
+
+    def __init__(self, buffer):
+        self.buffer = bytes(buffer)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    @classmethod
+    def capture(cls, vehicles, light=None, time=0.0, rng=random):
+        """
+        Snapshot of the given vehicles and light. rng: random.Random (or
+        the random module, which Vehicle draws from) whose state is kept,
+        None to leave it out.
+        """
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["num_vehicles"] = len(vehicles)
+        header["time"] = time
+        parts = [header]
+
+        if light is not None:
+            record = np.zeros(1, dtype=LIGHT_DTYPE)
+            record["mode"] = LIGHT_MODE_CODES[light.mode]
+            record["state"] = LIGHT_STATE_CODES[light.state]
+            for name in _LIGHT_NUMBERS:
+                record[name] = getattr(light, name)
+            header["has_light"] = 1
+            parts.append(record)
+
+        if rng is not None:
+            _, words, gauss_next = rng.getstate()
+            header["has_rng"] = 1
+            header["gauss_next"] = np.nan if gauss_next is None else gauss_next
+            parts.append(np.array(words, dtype="<u4"))
+
+        records = np.array([(v.id, DIRECTION_CODES[v.direction], v.lane, v.x, v.y, v.length,
+                             v.max_speed, v.speed, v.acceleration, v.deceleration,
+                             v.reaction_delay, v.delay_timer, v.stopped, v.is_troublemaker)
+                            for v in vehicles], dtype=VEHICLE_DTYPE)
+        parts.append(records)
+        return cls(b"".join(part.tobytes() for part in parts))
+
+    def restore(self, rng=random):
+        """
+        New objects in the captured state: (vehicles, light, time); light
+        is None if none was captured. rng: random.Random (or the random
+        module) that gets the captured RNG state, None to leave RNGs alone.
+        """
+        header = np.frombuffer(self.buffer, dtype=HEADER_DTYPE, count=1)[0]
+        offset = HEADER_DTYPE.itemsize
+
+        light = None
+        if header["has_light"]:
+            record = np.frombuffer(self.buffer, dtype=LIGHT_DTYPE, count=1, offset=offset)[0]
+            offset += LIGHT_DTYPE.itemsize
+            light = TrafficLight(mode=LIGHT_MODES[record["mode"]])
+            light.state = LIGHT_STATES[record["state"]]
+            for name in _LIGHT_NUMBERS:
+                setattr(light, name, record[name].item())
+
+        if header["has_rng"]:
+            words = np.frombuffer(self.buffer, dtype="<u4", count=RNG_WORDS, offset=offset)
+            offset += words.nbytes
+            if rng is not None:
+                gauss_next = None if np.isnan(header["gauss_next"]) else float(header["gauss_next"])
+                rng.setstate((3, tuple(words.tolist()), gauss_next))
+
+        records = np.frombuffer(self.buffer, dtype=VEHICLE_DTYPE, count=int(header["num_vehicles"]),
+                                offset=offset)
+        vehicles = []
+        new = Vehicle.__new__
+        for (vid, direction, lane, x, y, length, max_speed, speed, acceleration, deceleration,
+             reaction_delay, delay_timer, stopped, is_troublemaker) in records.tolist():
+            v = new(Vehicle)
+            v.id = vid
+            v.direction = DIRECTION_NAMES[direction]
+            v.lane = lane
+            v.x = x
+            v.y = y
+            v.length = length
+            v.type = "car" if length == 4.5 else "truck"
+            v.max_speed = max_speed
+            v.speed = speed
+            v.acceleration = acceleration
+            v.deceleration = deceleration
+            v.reaction_delay = reaction_delay
+            v.delay_timer = delay_timer
+            v.stopped = bool(stopped)
+            v.is_troublemaker = bool(is_troublemaker)
+            v.bus = None
+            vehicles.append(v)
+        return vehicles, light, float(header["time"])
+
+    def save(self, path):
+        """
+        Write the snapshot to disk (checkpoint).
+        """
+        with open(path, "wb") as f:
+            f.write(self.buffer)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+
+def bench_clone(num_vehicles, repeats):
+    """
+    Seconds per clone of a scenario with `num_vehicles` vehicles and a
+    light: copy.deepcopy of the objects, Snapshot.capture and
+    Snapshot.restore.
+    """
+    from animated_compare import generate_vehicles
+
+    random.seed(0)
+    vehicles = generate_vehicles(num_vehicles // 2, num_vehicles - num_vehicles // 2)
+    light = TrafficLight(mode="adaptive")
+    state = Snapshot.capture(vehicles, light)
+    timings = []
+    for clone in (lambda: copy.deepcopy((vehicles, light)),
+                  lambda: Snapshot.capture(vehicles, light),
+                  lambda: state.restore(rng=None)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            clone()
+        timings.append((time.perf_counter() - start) / repeats)
+    return timings, len(state)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="copy.deepcopy vs Snapshot for cloning a scenario.")
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[16, 256, 4096])
+    parser.add_argument("--repeats", type=int, default=200)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for num_vehicles in args.vehicles:
+        (deepcopy, capture, restore), size = bench_clone(num_vehicles, args.repeats)
+        print(f"{num_vehicles:6d} vehicles ({size} bytes): deepcopy {deepcopy * 1e6:9.1f} us, "
+              f"capture {capture * 1e6:8.1f} us, restore {restore * 1e6:8.1f} us "
+              f"({deepcopy / restore:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import jit_kernels
+from jit_kernels import JitVehicleArrays, check_engines
+from open_boundary import OpenBoundaryTraffic, uniform_arrivals
+from traffic_light import TrafficLight
+from vector_engine import VehicleArrays
+
+
+def test_python_kernels_match_numpy_engine():
+    # Fixed-seed closed scenario of `python jit_kernels.py --check`, all light modes but rl_table
+    assert check_engines(compiled=False) is None
+
+
+@pytest.mark.skipif(not jit_kernels.AVAILABLE, reason="numba is not installed")
+def test_compiled_kernels_match_numpy_engine():
+    assert check_engines(compiled=True) is None
+
+
+def test_open_boundary_matches_numpy_engine():
+    numpy_traffic = OpenBoundaryTraffic(uniform_arrivals(1500), 128, seed=4)
+    jit_traffic = OpenBoundaryTraffic(uniform_arrivals(1500), 128, seed=4, vehicle_cls=JitVehicleArrays)
+    numpy_light, jit_light = TrafficLight(position=0, mode="fixed"), TrafficLight(position=0, mode="fixed")
+    for _ in range(1000):
+        numpy_light.update(0.25)
+        jit_light.update(0.25)
+        assert numpy_traffic.step(0.25, numpy_light) == jit_traffic.step(0.25, jit_light)
+        expected, fleet = numpy_traffic.fleet, jit_traffic.fleet
+        for name in VehicleArrays.FIELDS:
+            assert np.array_equal(getattr(expected, name), getattr(fleet, name)), name
+        assert np.array_equal(fleet.id[fleet.id_order], np.sort(fleet.id))
+
+
+def test_known_states_match_numpy_engine():
+    rng = np.random.default_rng(0)
+    traffic = OpenBoundaryTraffic(uniform_arrivals(1500), 128, seed=1)
+    light = TrafficLight(position=0, mode="fixed")
+    for _ in range(200):
+        light.update(0.25)
+        traffic.step(0.25, light)
+    expected = VehicleArrays.concatenate([traffic.fleet])
+    fleet = JitVehicleArrays(0)
+    for name in VehicleArrays.FIELDS:
+        setattr(fleet, name, getattr(expected, name).copy())
+    n = len(fleet)
+    ghosts = rng.choice(n, n // 4, replace=False)
+    known = (ghosts, fleet.pos[ghosts] + 1.0, rng.uniform(0, 10, len(ghosts)), rng.random(len(ghosts)) < 0.3)
+    can_go = rng.random(n) < 0.5
+    uniforms = rng.random(n)
+    expected.step(0.25, can_go=can_go, uniforms=uniforms, known=known)
+    fleet.step(0.25, can_go=can_go, uniforms=uniforms, known=known)
+    for name in ("pos", "speed", "stopped", "delay_timer"):
+        assert np.array_equal(getattr(expected, name), getattr(fleet, name)), name
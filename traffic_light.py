@@ -6,8 +6,16 @@ class TrafficLight:
         - fixed: switches after a fixed cycle time
         - adaptive: adjusts based on queue lengths
         - rl: controlled by a reinforcement learning agent
+        - rl_table: like rl, with the action looked up in `policy_table`
+          (a compile_policy.PolicyTable) from the current queues and state
+        - mpc: like rl, with the action chosen by `planner` (an
+          mpc.MPCPlanner) from rollouts of candidate schedules
     """
 
+    __slots__ = ("position", "mode", "state", "timer", "cycle_time", "min_green_time",
+                 "green_timer", "queue_x", "queue_y", "yellow_timer", "yellow_duration",
+                 "red_timer", "max_red_time", "bus", "policy_table", "planner")
+
     def __init__(self, position=0, mode="fixed"):
         self.position = position
         self.mode = mode
@@ -29,13 +37,33 @@ class TrafficLight:
         self.red_timer = 0
         self.max_red_time = 10  # prevent starving a direction
 
+        # Optional V2IBus; when set, the queues are read from it on update
+        self.bus = None
+
+        # Compiled policy used in rl_table mode, planner used in mpc mode
+        self.policy_table = None
+        self.planner = None
+
     def receive_data(self, vehicle_data):
         """
         Receive V2I data from vehicles.
         Counts stopped vehicles in both directions.
         """
-        self.queue_x = sum(1 for v in vehicle_data if v["direction"] == "x" and v["stopped"])
-        self.queue_y = sum(1 for v in vehicle_data if v["direction"] == "y" and v["stopped"])
+        queue_x = queue_y = 0
+        for v in vehicle_data:
+            if v["stopped"]:
+                if v["direction"] == "x":
+                    queue_x += 1
+                elif v["direction"] == "y":
+                    queue_y += 1
+        self.receive_counts(queue_x, queue_y)
+
+    def receive_counts(self, queue_x, queue_y):
+        """
+        Receive V2I data already aggregated: stopped vehicles per direction.
+        """
+        self.queue_x = queue_x
+        self.queue_y = queue_y
 
     def update(self, dt, rl_action=None):
         """
@@ -43,6 +71,8 @@ class TrafficLight:
         dt: simulation timestep
         rl_action: optional action from RL agent (0=hold, 1=switch)
         """
+        if self.bus is not None:
+            self.receive_counts(self.bus.queue("x"), self.bus.queue("y"))
         self.timer += dt
         self.green_timer += dt
 
@@ -70,8 +100,17 @@ class TrafficLight:
             elif self.state == "green_y" and self.queue_x - self.queue_y >= 2:
                 self.start_yellow()
 
-        # Reinforcement Learning mode
-        elif self.mode == "rl" and rl_action is not None:
+        # Reinforcement Learning mode (rl_table: action from the compiled policy,
+        # mpc: action from the planner)
+        elif self.mode in ("rl", "rl_table", "mpc"):
+            if self.mode == "rl_table":
+                state_num = 0 if self.state == "green_x" else 1
+                rl_action = self.policy_table.action(self.queue_x, self.queue_y, state_num)
+            elif self.mode == "mpc":
+                rl_action = self.planner.action(self, dt)
+            if rl_action is None:
+                return
+
             # Count how long one direction has been red
             if (self.state == "green_x" and rl_action == 0) or \
                (self.state == "green_y" and rl_action == 0):
@@ -1,30 +1,151 @@
-import gymnasium as gym
+import argparse
+import time
+from functools import partial
 from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import DummyVecEnv
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
 from intersection_env import IntersectionEnv
+from batched_env import BatchedIntersectionEnv, ShardedIntersectionEnv
+from numpy_policy import export_policy
 
-def make_env():
+SIM_DURATION = 120
+DT = 0.25
+
+
+def make_env(frame_skip=False):
     """
     Factory function to create a new instance of the intersection environment.
     """
-    return IntersectionEnv(sim_duration=120, dt=0.25)
-
-# Vectorized environment for Stable Baselines
-env = DummyVecEnv([make_env])
-
-# Define PPO model
-model = PPO(
-    "MlpPolicy", 
-    env, 
-    verbose=1, 
-    n_steps=1024, 
-    batch_size=64, 
-    learning_rate=3e-4
-)
-
-print("Training RL agent... (this may take several minutes)")
-model.learn(total_timesteps=300_000)  # increased training steps for better performance
-
-# Save the trained model
-model.save("traffic_rl_model")
-print("Model saved as traffic_rl_model.zip")
+    return IntersectionEnv(sim_duration=SIM_DURATION, dt=DT, frame_skip=frame_skip)
+
+
+def make_vec_env(backend, num_envs, num_workers, seed, frame_skip=False):
+    """
+    Build the vectorized environment for training.
+
+    backend "gym": one IntersectionEnv per environment, stepped in this
+    process (DummyVecEnv) or one process per environment (SubprocVecEnv).
+    backend "batched": BatchedIntersectionEnv, split over worker processes
+    with ShardedIntersectionEnv when more than one worker is requested.
+    Environment i is seeded with seed + i. frame_skip (gym backend only)
+    queries the policy only at decision points.
+    """
+    if backend == "batched":
+        if num_workers > 1:
+            env = ShardedIntersectionEnv(num_envs, num_workers, sim_duration=SIM_DURATION, dt=DT)
+        else:
+            env = BatchedIntersectionEnv(num_envs, sim_duration=SIM_DURATION, dt=DT)
+    elif num_workers > 1:
+        env = SubprocVecEnv([partial(make_env, frame_skip) for _ in range(num_envs)])
+    else:
+        env = DummyVecEnv([partial(make_env, frame_skip) for _ in range(num_envs)])
+    env.seed(seed)
+    return env
+
+
+class ThroughputCallback(BaseCallback):
+    """
+    Reports env-steps/sec of every rollout and the time of the policy update after it.
+    """
+
+    def __init__(self, verbose=1):
+        super().__init__(verbose)
+        self.rollouts = []  # (env_steps, rollout_seconds, update_seconds)
+        self._rollout_start = None
+        self._rollout_end = None
+        self._steps_at_start = 0
+
+    def _on_training_start(self):
+        self._training_start = time.perf_counter()
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        if self._rollout_end is not None:
+            self._report(now - self._rollout_end)
+        self._rollout_start = now
+        self._steps_at_start = self.num_timesteps
+
+    def _on_rollout_end(self):
+        self._rollout_end = time.perf_counter()
+
+    def _on_step(self):
+        return True
+
+    def _on_training_end(self):
+        now = time.perf_counter()
+        if self._rollout_end is not None:
+            self._report(now - self._rollout_end)
+        total_steps = sum(r[0] for r in self.rollouts)
+        total_time = now - self._training_start
+        if self.verbose:
+            print(f"Training done: {total_steps} env-steps in {total_time:.1f}s "
+                  f"({total_steps / total_time:.0f} env-steps/s overall)")
+
+    def _report(self, update_seconds):
+        """
+        Record the finished rollout together with the update that followed it.
+        """
+        steps = self.num_timesteps - self._steps_at_start
+        rollout_seconds = self._rollout_end - self._rollout_start
+        self.rollouts.append((steps, rollout_seconds, update_seconds))
+        if self.verbose:
+            print(f"Rollout {len(self.rollouts)}: {steps / rollout_seconds:.0f} env-steps/s, "
+                  f"policy update {update_seconds:.2f}s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the PPO traffic light agent.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes used to step the environments")
+    parser.add_argument("--envs", type=int, default=None,
+                        help="number of parallel environments (default: one per worker)")
+    parser.add_argument("--backend", choices=["gym", "batched"], default="gym",
+                        help="gym: one IntersectionEnv per environment; batched: BatchedIntersectionEnv")
+    parser.add_argument("--frame-skip", action="store_true",
+                        help="one env step per decision point (8 simulation ticks)")
+    parser.add_argument("--seed", type=int, default=0, help="base seed; environment i uses seed + i")
+    parser.add_argument("--timesteps", type=int, default=300_000)
+    parser.add_argument("--n-steps", type=int, default=1024, help="rollout length per environment")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--output", default="traffic_rl_model")
+    args = parser.parse_args()
+
+    if args.envs is None:
+        args.envs = args.workers
+    if args.backend == "gym" and args.workers > 1 and args.envs != args.workers:
+        parser.error("SubprocVecEnv runs one environment per worker; "
+                     "use --backend batched to run several environments per worker")
+    if args.backend == "batched" and args.frame_skip:
+        parser.error("--frame-skip is only available with --backend gym")
+    return args
+
+
+def main():
+    args = parse_args()
+
+    # Vectorized environment for Stable Baselines
+    env = make_vec_env(args.backend, args.envs, args.workers, args.seed, args.frame_skip)
+
+    # Define PPO model
+    model = PPO(
+        "MlpPolicy",
+        env,
+        verbose=1,
+        n_steps=args.n_steps,
+        batch_size=args.batch_size,
+        learning_rate=3e-4,
+        seed=args.seed
+    )
+
+    print("Training RL agent... (this may take several minutes)")
+    model.learn(total_timesteps=args.timesteps, callback=ThroughputCallback())
+    env.close()
+
+    # Save the trained model
+    model.save(args.output)
+    print(f"Model saved as {args.output}.zip")
+    print(f"Policy exported to {export_policy(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
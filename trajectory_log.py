@@ -0,0 +1,277 @@
+import csv
+import json
+import os
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from vector_engine import DIRECTION_CODES, DIRECTION_NAMES, LIGHT_STATE_CODES, LIGHT_STATES
+
+# Columns of a trajectory log and their binary types
+LOG_COLUMNS = {
+    "time": np.float32,
+    "vehicle_id": np.int32,
+    "direction": np.int8,      # code from DIRECTION_CODES
+    "position_x": np.float32,
+    "position_y": np.float32,
+    "speed": np.float32,
+    "stopped": np.bool_,
+    "troublemaker": np.bool_,
+    "light_state": np.int8,    # code from LIGHT_STATE_CODES
+}
+
+META_FILE = "meta.json"
+
+
+class TrajectoryRecorder(ABC):
+    """
+    Buffered trajectory logger.
+
+    Rows are collected in preallocated typed arrays (one per column) and
+    handed to _write_chunk() once `chunk_rows` rows are buffered, instead of
+    formatting and writing text for every vehicle on every tick.
+    Subclasses decide the output format.
+    """
+
+    def __init__(self, path, chunk_rows=1 << 16):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.rows = 0           # rows in the buffer
+        self.total_rows = 0     # rows written so far
+        self.buffers = {name: np.empty(chunk_rows, dtype=dtype) for name, dtype in LOG_COLUMNS.items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, t, vehicles, light_state):
+        """
+        Append one row per Vehicle object at time t.
+        """
+        n = len(vehicles)
+        self.record_columns(
+            t,
+            np.fromiter((v.id for v in vehicles), np.int32, n),
+            np.fromiter((DIRECTION_CODES[v.direction] for v in vehicles), np.int8, n),
+            np.fromiter((v.x for v in vehicles), np.float32, n),
+            np.fromiter((v.y for v in vehicles), np.float32, n),
+            np.fromiter((v.speed for v in vehicles), np.float32, n),
+            np.fromiter((v.stopped for v in vehicles), np.bool_, n),
+            np.fromiter((v.is_troublemaker for v in vehicles), np.bool_, n),
+            light_state,
+        )
+
+    def record_fleet(self, t, fleet, light_state):
+        """
+        Append one row per vehicle of a VehicleArrays fleet at time t.
+        """
+        self.record_columns(t, fleet.id, fleet.direction, fleet.x, fleet.y, fleet.speed,
+                            fleet.stopped, fleet.is_troublemaker, light_state)
+
+    def record_columns(self, t, vehicle_id, direction, x, y, speed, stopped, troublemaker, light_state):
+        """
+        Append rows given as arrays (direction as codes, light_state as a name).
+        """
+        values = {
+            "vehicle_id": vehicle_id, "direction": direction, "position_x": x, "position_y": y,
+            "speed": speed, "stopped": stopped, "troublemaker": troublemaker,
+        }
+        n = len(vehicle_id)
+        start = 0
+        while start < n:
+            count = min(n - start, self.chunk_rows - self.rows)
+            rows = slice(self.rows, self.rows + count)
+            self.buffers["time"][rows] = t
+            self.buffers["light_state"][rows] = LIGHT_STATE_CODES[light_state]
+            for name, column in values.items():
+                self.buffers[name][rows] = column[start:start + count]
+            self.rows += count
+            start += count
+            if self.rows == self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows.
+        """
+        if self.rows:
+            self._write_chunk({name: buf[:self.rows] for name, buf in self.buffers.items()})
+            self.total_rows += self.rows
+            self.rows = 0
+
+    def close(self):
+        self.flush()
+
+    @abstractmethod
+    def _write_chunk(self, columns):
+        """
+        Write buffered rows given as {column name: array}.
+        """
+
+
+class NpyRecorder(TrajectoryRecorder):
+    """
+    Columnar binary log: a directory with one .npy file per column.
+
+    Chunks are appended to raw column files while recording; close() turns
+    them into .npy files that np.load(..., mmap_mode="r") can memory-map.
+    """
+
+    def __init__(self, path, chunk_rows=1 << 16):
+        super().__init__(path, chunk_rows)
+        os.makedirs(path, exist_ok=True)
+        self.files = {name: open(os.path.join(path, name + ".bin"), "wb") for name in LOG_COLUMNS}
+
+    def _write_chunk(self, columns):
+        for name, values in columns.items():
+            self.files[name].write(values.tobytes())
+
+    def close(self):
+        if self.files is None:
+            return
+        self.flush()
+        for name, dtype in LOG_COLUMNS.items():
+            self.files[name].close()
+            raw = os.path.join(self.path, name + ".bin")
+            with open(raw, "rb") as src, open(os.path.join(self.path, name + ".npy"), "wb") as dst:
+                header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                          "fortran_order": False, "shape": (self.total_rows,)}
+                np.lib.format.write_array_header_1_0(dst, header)
+                while True:
+                    block = src.read(1 << 24)
+                    if not block:
+                        break
+                    dst.write(block)
+            os.remove(raw)
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump({"rows": self.total_rows, "directions": DIRECTION_NAMES,
+                       "light_states": LIGHT_STATES}, f)
+        self.files = None
+
+
+class ParquetRecorder(TrajectoryRecorder):
+    """
+    Columnar Parquet log, one row group per chunk (needs pyarrow).
+    """
+
+    def __init__(self, path, chunk_rows=1 << 16):
+        import pyarrow
+        import pyarrow.parquet
+        super().__init__(path, chunk_rows)
+        self._pa = pyarrow
+        schema = pyarrow.schema([(name, pyarrow.from_numpy_dtype(dtype)) for name, dtype in LOG_COLUMNS.items()])
+        self.writer = pyarrow.parquet.ParquetWriter(path, schema)
+
+    def _write_chunk(self, columns):
+        self.writer.write_table(self._pa.table(columns))
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class CsvRecorder(TrajectoryRecorder):
+    """
+    CSV log in the original text format, written one chunk at a time.
+    """
+
+    def __init__(self, path, chunk_rows=1 << 16):
+        super().__init__(path, chunk_rows)
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(list(LOG_COLUMNS))
+
+    def _write_chunk(self, columns):
+        self.writer.writerows(_csv_rows(columns))
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+RECORDERS = {"npy": NpyRecorder, "parquet": ParquetRecorder, "csv": CsvRecorder}
+
+
+def open_recorder(path, fmt="npy", chunk_rows=1 << 16):
+    """
+    Create a recorder for the given format ("npy", "parquet" or "csv").
+    """
+    return RECORDERS[fmt](path, chunk_rows)
+
+
+def open_columns(path):
+    """
+    Memory-mapped columns of an .npy log directory (codes are not decoded).
+    """
+    return {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in LOG_COLUMNS}
+
+
+def decode_columns(columns):
+    """
+    DataFrame-ready dict with direction and light_state turned back into names.
+    """
+    decoded = dict(columns)
+    decoded["direction"] = np.asarray(DIRECTION_NAMES)[columns["direction"]]
+    decoded["light_state"] = np.asarray(LIGHT_STATES)[columns["light_state"]]
+    return decoded
+
+
+def load_log(path):
+    """
+    Load a whole log (CSV, Parquet or .npy directory) as a pandas DataFrame
+    with the same columns and values as the CSV format.
+    """
+    if os.path.isdir(path):
+        return pd.DataFrame(decode_columns({k: np.asarray(v) for k, v in open_columns(path).items()}))
+    if path.endswith(".parquet"):
+        return pd.DataFrame(decode_columns(pd.read_parquet(path).to_dict("series")))
+    return pd.read_csv(path)
+
+
+def iter_log_chunks(path, chunk_rows=1 << 20):
+    """
+    Yield a log as DataFrames of at most `chunk_rows` rows, in file order,
+    with the same columns and values as load_log(). Memory use is bounded
+    by the chunk size whatever the size of the log.
+    """
+    if os.path.isdir(path):
+        columns = open_columns(path)
+        total = len(columns["time"])
+        for start in range(0, total, chunk_rows):
+            chunk = {name: np.asarray(col[start:start + chunk_rows]) for name, col in columns.items()}
+            yield pd.DataFrame(decode_columns(chunk))
+    elif path.endswith(".parquet"):
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield pd.DataFrame(decode_columns(batch.to_pandas().to_dict("series")))
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def export_csv(path, csv_path, chunk_rows=1 << 16):
+    """
+    Convert an .npy log directory to CSV, chunk by chunk.
+    """
+    columns = open_columns(path)
+    total = len(columns["time"])
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(list(LOG_COLUMNS))
+        for start in range(0, total, chunk_rows):
+            chunk = {name: col[start:start + chunk_rows] for name, col in columns.items()}
+            writer.writerows(_csv_rows(chunk))
+
+
+def _csv_rows(columns):
+    """
+    Rows formatted like the original per-tick CSV writer.
+    """
+    directions = np.asarray(DIRECTION_NAMES)[columns["direction"]]
+    states = np.asarray(LIGHT_STATES)[columns["light_state"]]
+    return zip(np.round(columns["time"].astype(float), 1).tolist(),
+               columns["vehicle_id"].tolist(), directions.tolist(),
+               np.round(columns["position_x"].astype(float), 2).tolist(),
+               np.round(columns["position_y"].astype(float), 2).tolist(),
+               np.round(columns["speed"].astype(float), 2).tolist(),
+               columns["stopped"].tolist(), columns["troublemaker"].tolist(), states.tolist())
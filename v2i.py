@@ -0,0 +1,225 @@
+class V2IBatch:
+    """
+    The V2I reports of one tick as counters instead of one dict per vehicle.
+
+    collect() refills per-(direction, lane) counters in place (vehicles,
+    stopped vehicles, troublemakers); after the first tick no new objects
+    are created. The light receives the result with
+    light.receive_counts(batch.queue("x"), batch.queue("y")), which gives
+    the same queues as receive_data([v.send_data(...) for v in vehicles]).
+    """
+
+    __slots__ = ("vehicles", "stopped", "troublemakers")
+
+    def __init__(self):
+        self.vehicles = {}        # (direction, lane) -> vehicles reporting
+        self.stopped = {}         # (direction, lane) -> stopped vehicles
+        self.troublemakers = {}   # (direction, lane) -> troublemakers
+
+    def collect(self, vehicles):
+        """
+        Count the state of the given vehicles.
+        """
+        counts, stopped, troublemakers = self.vehicles, self.stopped, self.troublemakers
+        for key in counts:
+            counts[key] = stopped[key] = troublemakers[key] = 0
+        for v in vehicles:
+            key = (v.direction, v.lane)
+            if key not in counts:
+                counts[key] = stopped[key] = troublemakers[key] = 0
+            counts[key] += 1
+            if v.stopped:
+                stopped[key] += 1
+            if v.is_troublemaker:
+                troublemakers[key] += 1
+        return self
+
+    def queue(self, direction):
+        """
+        Stopped vehicles in one direction, all lanes.
+        """
+        total = 0
+        for (d, _), n in self.stopped.items():
+            if d == direction:
+                total += n
+        return total
+
+
+# Vehicles closer than this to the light (and not past it) are on the approach
+APPROACH_RANGE = 100
+
+
+class V2IBus:
+    """
+    Incremental V2I aggregation for one traffic light.
+
+    Registered vehicles publish their state from Vehicle.move only when it
+    changes in a way the bus counts: stopped/started, entered or left the
+    approach (also when it passes the light). Whoever changes a vehicle's
+    lane or direction publishes it as well. The light reads the aggregates
+    in O(1) instead of recounting every vehicle each tick, and the bus does
+    O(state changes) work per tick.
+
+    Kept per (direction, lane):
+        counts         registered vehicles
+        speed_sums     sum of their speeds (Vehicle.move adds its change)
+        stopped        stopped vehicles (what receive_data counts)
+        approaching    vehicles within `approach_range` before the light
+        troublemakers  troublemakers among the approaching vehicles
+    Speeds change almost every tick, so only their sum is kept:
+    mean_approach_speed() reads the current speed of the approaching
+    vehicles when it is called.
+
+    listener: optional object told about vehicles registered
+    (vehicle_added), unregistered (vehicle_removed) and passing the light
+    (vehicle_passed), e.g. OnlineMetrics for the vehicle delays.
+    """
+
+    def __init__(self, light_pos=0, approach_range=APPROACH_RANGE):
+        self.light_pos = light_pos
+        self.approach_range = approach_range
+        self.approach_start = light_pos - approach_range
+        self.records = {}    # vehicle id -> [key, stopped, approaching, troublemaker, before light]
+        self.vehicles = {}   # vehicle id -> Vehicle
+        self.counts = {}
+        self.speed_sums = {}
+        self.stopped = {}
+        self.approaching = {}   # (direction, lane) -> ids of the approaching vehicles
+        self.troublemakers = {}
+        self.changes = 0     # counter updates so far
+        self.listener = None
+
+    def register(self, vehicles):
+        """
+        Start listening to the given vehicles.
+        """
+        for v in vehicles:
+            record = self._record(v)
+            self.records[v.id] = record
+            self.vehicles[v.id] = v
+            self._apply(v.id, record, 1)
+            v.bus = self
+            if self.listener is not None:
+                self.listener.vehicle_added(v)
+
+    def unregister(self, vehicle):
+        """
+        Stop listening to a vehicle (e.g. when it leaves the simulation).
+        """
+        if self.listener is not None:
+            self.listener.vehicle_removed(vehicle)
+        self._apply(vehicle.id, self.records.pop(vehicle.id), -1)
+        del self.vehicles[vehicle.id]
+        vehicle.bus = None
+
+    def publish(self, v):
+        """
+        Apply the changes of a vehicle's state since its last report.
+        """
+        record = self.records[v.id]
+        key = record[0]
+        pos = v.x if v.direction == "x" else v.y
+        if record[4] and pos >= self.light_pos and self.listener is not None:
+            self.listener.vehicle_passed(v)
+        if key != (v.direction, v.lane):
+            self._apply(v.id, record, -1)
+            record[:] = self._record(v)
+            self._apply(v.id, record, 1)
+            return
+
+        if v.stopped != record[1]:
+            self.stopped[key] += 1 if v.stopped else -1
+            record[1] = v.stopped
+            self.changes += 1
+
+        record[4] = pos < self.light_pos
+        approaching = self.approach_start <= pos < self.light_pos
+        if approaching != record[2]:
+            sign = 1 if approaching else -1
+            if approaching:
+                self.approaching[key].add(v.id)
+            else:
+                self.approaching[key].discard(v.id)
+            self.troublemakers[key] += sign * record[3]
+            record[2] = approaching
+            self.changes += 1
+
+    def speed_changed(self, v, change):
+        """
+        Add the speed change of a vehicle during its move to the speed sums.
+        """
+        self.speed_sums[self.records[v.id][0]] += change
+
+    def queue(self, direction):
+        """
+        Stopped vehicles in one direction, all lanes.
+        """
+        return self._total(self.stopped, direction)
+
+    def vehicle_count(self, direction, lane=None):
+        """
+        Registered vehicles in one direction (one lane, or all lanes).
+        """
+        return self._total(self.counts, direction, lane)
+
+    def speed_sum(self, direction, lane=None):
+        """
+        Sum of the current speeds in one direction (one lane, or all lanes).
+        """
+        return self._total(self.speed_sums, direction, lane)
+
+    def approaching_count(self, direction, lane=None):
+        """
+        Vehicles on the approach in one direction (one lane, or all lanes).
+        """
+        return sum(len(ids) for ids in self._lanes(self.approaching, direction, lane))
+
+    def mean_approach_speed(self, direction, lane=None):
+        """
+        Mean current speed of the approaching vehicles (0 if there are none);
+        O(approaching vehicles).
+        """
+        speeds = [self.vehicles[vid].speed for ids in self._lanes(self.approaching, direction, lane)
+                  for vid in ids]
+        return sum(speeds) / len(speeds) if speeds else 0.0
+
+    def troublemaker_present(self, direction, lane=None):
+        """
+        Whether a troublemaker is on the approach in one direction (one lane, or all lanes).
+        """
+        return self._total(self.troublemakers, direction, lane) > 0
+
+    def _record(self, v):
+        pos = v.x if v.direction == "x" else v.y
+        approaching = self.approach_start <= pos < self.light_pos
+        return [(v.direction, v.lane), v.stopped, approaching, int(v.is_troublemaker), pos < self.light_pos]
+
+    def _apply(self, vid, record, sign):
+        """
+        Add (sign=1) or remove (sign=-1) a vehicle's record from the counters.
+        """
+        key, stopped, approaching, troublemaker, _ = record
+        if key not in self.stopped:
+            self.stopped[key] = self.troublemakers[key] = self.counts[key] = 0
+            self.speed_sums[key] = 0.0
+            self.approaching[key] = set()
+        self.counts[key] += sign
+        self.speed_sums[key] += sign * self.vehicles[vid].speed
+        self.stopped[key] += sign * stopped
+        if approaching:
+            if sign > 0:
+                self.approaching[key].add(vid)
+            else:
+                self.approaching[key].discard(vid)
+            self.troublemakers[key] += sign * troublemaker
+        self.changes += 1
+
+    @staticmethod
+    def _lanes(counters, direction, lane=None):
+        if lane is not None:
+            return [counters[(direction, lane)]] if (direction, lane) in counters else []
+        return [value for (d, _), value in counters.items() if d == direction]
+
+    @staticmethod
+    def _total(counters, direction, lane=None):
+        return sum(V2IBus._lanes(counters, direction, lane))
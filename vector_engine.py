@@ -0,0 +1,485 @@
+import argparse
+import random
+import numpy as np
+from vehicle import STOP_LINE_DISTANCE, APPROACH_DISTANCE
+
+# Integer codes used for the direction of travel
+DIRECTION_CODES = {"x": 0, "y": 1}
+DIRECTION_NAMES = ("x", "y")
+
+# Integer codes used for the traffic light state
+LIGHT_STATES = ("green_x", "yellow_x", "green_y", "yellow_y")
+LIGHT_STATE_CODES = {name: code for code, name in enumerate(LIGHT_STATES)}
+
+# Integer codes used for the traffic light mode
+LIGHT_MODES = ("fixed", "adaptive", "rl", "rl_table", "mpc")
+LIGHT_MODE_CODES = {name: code for code, name in enumerate(LIGHT_MODES)}
+
+
+class VehicleArrays:
+    """
+    Struct-of-arrays vehicle engine.
+
+    Keeps the state of a whole fleet in NumPy arrays and advances every
+    vehicle with a few masked array operations per tick instead of calling
+    Vehicle.move once per vehicle. The driving rules are the ones from
+    Vehicle.move (stop line, approach distance, dynamic safe gap, reaction
+    delay and troublemaker braking).
+
+    Vehicles move in id order like in the object loop (platoons are
+    generated front to back): a vehicle sees the state its leader ends the
+    tick in if the leader has the lower id, its start-of-tick state
+    otherwise. step() decides everyone from the start-of-tick state and
+    then re-decides the followers whose leader ended up elsewhere, which
+    takes a few passes over the fleet. Troublemaker draws are taken in
+    fleet order.
+
+    Several independent intersections can share one fleet: `instance` tells
+    which intersection a vehicle belongs to, and leaders never cross instances.
+    """
+
+    FIELDS = ("id", "instance", "direction", "lane", "pos", "speed", "max_speed", "length",
+              "acceleration", "deceleration", "reaction_delay", "delay_timer",
+              "stopped", "is_troublemaker", "strict_stop")
+
+    def __init__(self, n=0):
+        self.id = np.zeros(n, dtype=np.int64)
+        self.instance = np.zeros(n, dtype=np.int64)
+        self.direction = np.zeros(n, dtype=np.int8)   # 0 = x, 1 = y
+        self.lane = np.zeros(n, dtype=np.float64)
+        self.pos = np.zeros(n, dtype=np.float64)      # position along the direction of travel
+        self.speed = np.zeros(n, dtype=np.float64)
+        self.max_speed = np.zeros(n, dtype=np.float64)
+        self.length = np.zeros(n, dtype=np.float64)
+        self.acceleration = np.zeros(n, dtype=np.float64)
+        self.deceleration = np.zeros(n, dtype=np.float64)
+        self.reaction_delay = np.zeros(n, dtype=np.float64)
+        self.delay_timer = np.zeros(n, dtype=np.float64)
+        self.stopped = np.zeros(n, dtype=bool)
+        self.is_troublemaker = np.zeros(n, dtype=bool)
+        # Stops on red anywhere before the stop line, not only within the
+        # approach distance: the front of the initial platoon (ids 0-3, as in
+        # Vehicle.move); never set for pooled arrivals
+        self.strict_stop = np.zeros(n, dtype=bool)
+
+    def __len__(self):
+        return len(self.pos)
+
+    @classmethod
+    def from_vehicles(cls, vehicles, instance=0):
+        """
+        Build the arrays from a list of Vehicle objects (order is kept).
+        """
+        fleet = cls(len(vehicles))
+        fleet.instance[:] = instance
+        for i, v in enumerate(vehicles):
+            fleet.id[i] = v.id
+            fleet.direction[i] = DIRECTION_CODES[v.direction]
+            fleet.lane[i] = v.lane
+            fleet.pos[i] = v.x if v.direction == "x" else v.y
+            fleet.speed[i] = v.speed
+            fleet.max_speed[i] = v.max_speed
+            fleet.length[i] = v.length
+            fleet.acceleration[i] = v.acceleration
+            fleet.deceleration[i] = v.deceleration
+            fleet.reaction_delay[i] = v.reaction_delay
+            fleet.delay_timer[i] = v.delay_timer
+            fleet.stopped[i] = v.stopped
+            fleet.is_troublemaker[i] = v.is_troublemaker
+            fleet.strict_stop[i] = v.id < 4
+        return fleet
+
+    @classmethod
+    def concatenate(cls, fleets):
+        """
+        Join several fleets into one, keeping their order.
+        """
+        fleet = cls(0)
+        for name in cls.FIELDS:
+            setattr(fleet, name, np.concatenate([getattr(f, name) for f in fleets]))
+        return fleet
+
+    def select(self, indices):
+        """
+        New fleet of the same class holding only the given vehicles (index
+        array or boolean mask).
+        """
+        fleet = type(self)(0)
+        for name in self.FIELDS:
+            setattr(fleet, name, getattr(self, name)[indices])
+        return fleet
+
+    def write_back(self, vehicles):
+        """
+        Copy the dynamic state back into the Vehicle objects it was built from.
+        """
+        for i, v in enumerate(vehicles):
+            if v.direction == "x":
+                v.x = float(self.pos[i])
+            else:
+                v.y = float(self.pos[i])
+            v.speed = float(self.speed[i])
+            v.delay_timer = float(self.delay_timer[i])
+            v.stopped = bool(self.stopped[i])
+
+    @property
+    def x(self):
+        return np.where(self.direction == 0, self.pos, self.lane)
+
+    @property
+    def y(self):
+        return np.where(self.direction == 0, self.lane, self.pos)
+
+    def leaders(self):
+        """
+        Index of the leading vehicle of every vehicle (-1 if there is none).
+
+        Same rule as LeaderIndex: the leader is the closest vehicle of the
+        same direction and lane that is strictly ahead; ties go to the
+        vehicle that comes first in the fleet.
+        """
+        return _leaders(self.pos, [self.instance, self.direction, self.lane])
+
+    def can_go(self, light):
+        """
+        Per-vehicle result of light.allows_movement for vehicles before the stop line.
+        """
+        go_x = light.state == "green_x"
+        go_y = light.state == "green_y"
+        return np.where(self.direction == 0, go_x, go_y)
+
+    def step(self, dt, light=None, light_pos=0, can_go=None, rngs=None, leader=None, uniforms=None,
+             known=None):
+        """
+        Advance every vehicle by one tick of length dt.
+
+        light: a single TrafficLight shared by all vehicles, or
+        can_go: per-vehicle green flags (e.g. from LightArrays.can_go) instead.
+        rngs: optional random.Random per instance for troublemaker braking;
+              the global `random` module is used otherwise.
+        leader: leaders() of the current state, if the caller already has it.
+        uniforms: optional per-vehicle random numbers in [0, 1) for this tick,
+                  used for troublemaker braking instead of rngs/`random`.
+        known: optional (indices, pos, speed, stopped) end-of-tick state of
+               vehicles moved elsewhere (partition ghosts); they end up in it
+               and their followers are decided with it.
+        light_pos may be an array (one light position per vehicle).
+        """
+        n = len(self.pos)
+        if n == 0:
+            return
+        pos = self.pos
+        speed = self.speed
+        stop_line = light_pos - STOP_LINE_DISTANCE
+        self.delay_timer += dt
+        must_stop = np.zeros(n, dtype=bool)
+        before_line = pos < stop_line
+
+        # --- Traffic light check ---
+        if light is not None:
+            can_go = self.can_go(light)
+        if can_go is not None:
+            blocked = before_line & ~can_go
+            must_stop |= blocked & self.strict_stop
+            near = blocked & (stop_line - pos <= APPROACH_DISTANCE)
+            must_stop |= near
+            far = blocked & ~near
+            speed[far] = np.maximum(speed[far] - self.deceleration[far] * dt * 0.5,
+                                    self.max_speed[far] * 0.5)
+
+        # --- Random braking for troublemaker vehicles (draws in fleet order) ---
+        hit = np.zeros(n, dtype=bool)
+        candidates = np.flatnonzero(self.is_troublemaker & before_line)
+        if candidates.size:
+            if uniforms is not None:
+                draws = uniforms[candidates]
+            elif rngs is None:
+                draws = np.array([random.random() for _ in range(candidates.size)])
+            else:
+                draws = np.array([rngs[i].random() for i in self.instance[candidates]])
+            hit[candidates[draws < 0.01]] = True
+
+        # --- Leading vehicle check ---
+        # First with every leader at its start-of-tick state; then followers of
+        # leaders that move first (lower id) are decided again with the state
+        # their leader ended up in, until no decision changes
+        if leader is None:
+            leader = self.leaders()
+        has_front = np.flatnonzero(leader >= 0)
+        front = leader[has_front]
+        safe_gap = 7 + speed[has_front] * 0.3
+        gap = pos[front] - pos[has_front] - self.length[has_front]
+        follow = (gap < safe_gap) | (self.stopped[front] & (gap < safe_gap + 2))
+        decided = must_stop.copy()
+        decided[has_front] |= follow
+        start_speed = speed.copy()
+        new_speed, new_stopped = self._advance(slice(None), decided, start_speed, hit, dt)
+        new_pos = pos + new_speed * dt
+        moves_first = self.id[front] < self.id[has_front]
+        if known is not None:
+            fixed, known_pos, known_speed, known_stopped = known
+            new_pos[fixed] = known_pos
+            new_speed[fixed] = known_speed
+            new_stopped[fixed] = known_stopped
+            is_fixed = np.zeros(n, dtype=bool)
+            is_fixed[fixed] = True
+            moves_first &= ~is_fixed[has_front]
+
+        moves_first = np.flatnonzero(moves_first)
+        seen_pos = pos[front[moves_first]]
+        seen_stopped = self.stopped[front[moves_first]]
+        rows = np.arange(len(moves_first))
+        while rows.size:
+            leaders = front[moves_first[rows]]
+            outdated = (new_pos[leaders] != seen_pos[rows]) | (new_stopped[leaders] != seen_stopped[rows])
+            rows = rows[outdated]
+            if not rows.size:
+                break
+            leaders = leaders[outdated]
+            seen_pos[rows] = new_pos[leaders]
+            seen_stopped[rows] = new_stopped[leaders]
+            i = has_front[moves_first[rows]]
+            gap = seen_pos[rows] - pos[i] - self.length[i]
+            safe = safe_gap[moves_first[rows]]
+            decision = must_stop[i] | (gap < safe) | (seen_stopped[rows] & (gap < safe + 2))
+            speed_i, stopped_i = self._advance(i, decision, start_speed, hit, dt)
+            changed = (speed_i != new_speed[i]) | (stopped_i != new_stopped[i])
+            new_speed[i] = speed_i
+            new_stopped[i] = stopped_i
+            new_pos[i] = pos[i] + speed_i * dt
+
+            # Followers of the vehicles that changed are checked next
+            moved = np.zeros(n, dtype=bool)
+            moved[i[changed]] = True
+            rows = np.flatnonzero(moved[front[moves_first]])
+
+        # --- Position update ---
+        speed[:] = new_speed
+        self.stopped[:] = new_stopped
+        pos[:] = new_pos
+        self.delay_timer[self.stopped] = 0
+
+    def _advance(self, i, must_stop, speed, hit, dt):
+        """
+        Speed and stopped flag of vehicles i after the reaction delay rule
+        and troublemaker braking, from their speed after the light check.
+        """
+        speed = speed[i]
+        brake = must_stop & (self.delay_timer[i] >= self.reaction_delay[i])
+        speed = np.where(brake,
+                         np.maximum(0, speed - self.deceleration[i] * dt),
+                         np.minimum(self.max_speed[i], speed + self.acceleration[i] * dt))
+        stopped = brake & (speed < 0.1)
+        speed = np.where(hit[i], np.maximum(0, speed - self.deceleration[i] * dt), speed)
+        return speed, stopped
+
+    def queue_counts(self):
+        """
+        Number of stopped vehicles in the X and Y directions.
+        """
+        queue_x = int(np.count_nonzero(self.stopped & (self.direction == 0)))
+        queue_y = int(np.count_nonzero(self.stopped & (self.direction == 1)))
+        return queue_x, queue_y
+
+    def queue_counts_by_instance(self, num_instances):
+        """
+        Stopped vehicles per instance, as two arrays (X and Y direction).
+        """
+        queue_x = np.bincount(self.instance[self.stopped & (self.direction == 0)],
+                              minlength=num_instances)
+        queue_y = np.bincount(self.instance[self.stopped & (self.direction == 1)],
+                              minlength=num_instances)
+        return queue_x, queue_y
+
+
+class LightArrays:
+    """
+    Many independent traffic lights stepped together.
+
+    Mirrors TrafficLight.update for the fixed, adaptive, rl and rl_table
+    modes, with one array entry per light. States and modes are stored as
+    the integer codes from LIGHT_STATES and LIGHT_MODES; rl_table lights
+    share one compiled policy (policy_table). mpc lights need a planner
+    with their own vehicles and are only run as TrafficLight.
+    """
+
+    def __init__(self, n, mode="fixed"):
+        self.mode = np.full(n, LIGHT_MODE_CODES[mode], dtype=np.int8)
+        self.state = np.full(n, LIGHT_STATE_CODES["green_x"], dtype=np.int8)
+        self.timer = np.zeros(n)
+        self.green_timer = np.zeros(n)
+        self.yellow_timer = np.zeros(n)
+        self.red_timer = np.zeros(n)
+        self.queue_x = np.zeros(n, dtype=np.int64)
+        self.queue_y = np.zeros(n, dtype=np.int64)
+        self.policy_table = None
+
+        # Same parameters as TrafficLight
+        self.cycle_time = 15
+        self.min_green_time = 5
+        self.yellow_duration = 2
+        self.max_red_time = 10
+
+    def __len__(self):
+        return len(self.state)
+
+    def reset(self, indices):
+        """
+        Put the given lights back to the initial TrafficLight state.
+        """
+        self.state[indices] = LIGHT_STATE_CODES["green_x"]
+        for timer in (self.timer, self.green_timer, self.yellow_timer, self.red_timer):
+            timer[indices] = 0
+        self.queue_x[indices] = 0
+        self.queue_y[indices] = 0
+
+    def receive_counts(self, queue_x, queue_y):
+        """
+        Store the stopped-vehicle counts used by adaptive lights.
+        """
+        self.queue_x[:] = queue_x
+        self.queue_y[:] = queue_y
+
+    def update(self, dt, rl_action=None):
+        """
+        Advance all lights by dt. rl_action holds one action per light
+        (only read for lights in rl mode).
+        """
+        self.timer += dt
+        self.green_timer += dt
+
+        # Handle yellow phase transition
+        yellow = (self.state == 1) | (self.state == 3)
+        self.yellow_timer[yellow] += dt
+        done = yellow & (self.yellow_timer >= self.yellow_duration)
+        self.state[done] = (self.state[done] + 1) % 4
+        self.green_timer[done] = 0
+        green = ~yellow
+        switch = np.zeros(len(self.state), dtype=bool)
+
+        # Fixed cycle mode
+        fixed = green & (self.mode == 0) & (self.timer >= self.cycle_time)
+        switch |= fixed
+        self.timer[fixed] = 0
+
+        # Adaptive V2I mode
+        adaptive = green & (self.mode == 1) & (self.green_timer >= self.min_green_time)
+        switch |= adaptive & (self.state == 0) & (self.queue_y - self.queue_x >= 2)
+        switch |= adaptive & (self.state == 2) & (self.queue_x - self.queue_y >= 2)
+
+        # Reinforcement Learning mode (rl_table: actions from the compiled policy)
+        rl = green & (self.mode == 2) if rl_action is not None else np.zeros(len(self.state), dtype=bool)
+        table = green & (self.mode == 3)
+        if table.any():
+            looked_up = self.policy_table.lookup(self.queue_x, self.queue_y, self.light_state_numbers())
+            rl_action = looked_up if rl_action is None else np.where(table, looked_up, rl_action)
+            rl |= table
+        if rl.any():
+            hold = rl & (rl_action == 0)
+            self.red_timer[hold] += dt
+            self.red_timer[rl & ~hold] = 0
+            requested = rl & (rl_action == 1) & (self.green_timer >= self.min_green_time)
+            starved = rl & ~requested & (self.red_timer >= self.max_red_time)
+            self.red_timer[starved] = 0
+            switch |= requested | starved
+
+        # Start the yellow phase before switching directions
+        self.yellow_timer[switch] = 0
+        self.state[switch] += 1
+
+    def can_go(self, light_index, direction):
+        """
+        Green flag for vehicles before the stop line, given each vehicle's
+        light and direction code.
+        """
+        return self.state[light_index] == 2 * direction
+
+    def light_state_numbers(self):
+        """
+        Observation value of each light: 0 if X is green, 1 otherwise.
+        """
+        return (self.state != 0).astype(np.int64)
+
+
+def _leaders(pos, keys):
+    """
+    For every element, the index of the closest element with the same keys
+    and a strictly larger position, or -1.
+    """
+    n = len(pos)
+    leader = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return leader
+    order = np.lexsort([pos] + list(keys)[::-1])
+    p = pos[order]
+    k = [key[order] for key in keys]
+
+    # Runs of equal (keys, position) so that ties are never leaders of each other
+    same_group = np.ones(n - 1, dtype=bool)
+    for key in k:
+        same_group &= key[1:] == key[:-1]
+    new_run = np.ones(n, dtype=bool)
+    new_run[1:] = ~same_group | (p[1:] != p[:-1])
+    run_starts = np.append(np.flatnonzero(new_run), n)
+    run_id = np.cumsum(new_run) - 1
+    nxt = run_starts[run_id + 1]
+
+    valid = nxt < n
+    for key in k:
+        valid[valid] = key[nxt[valid]] == key[valid]
+    leader[order[valid]] = order[nxt[valid]]
+    return leader
+
+
+def engine_trajectories(engine, num_vehicles_x, num_vehicles_y, ticks, dt, seed):
+    """
+    (ticks, vehicles, 3) array of position, speed and stopped flag, in
+    id order, of an IntersectionEnv episode with the given engine and
+    seeded random actions.
+    """
+    from intersection_env import IntersectionEnv
+
+    env = IntersectionEnv(num_vehicles_x, num_vehicles_y, sim_duration=float("inf"), dt=dt, engine=engine)
+    env.reset(seed=seed)
+    actions = np.random.default_rng(seed).integers(0, 2, ticks)
+    trajectory = []
+    for action in actions:
+        env.step(int(action))
+        if engine == "objects":
+            vehicles = sorted(env.vehicles, key=lambda v: v.id)
+            trajectory.append([(v.x if v.direction == "x" else v.y, v.speed, v.stopped) for v in vehicles])
+        else:
+            order = np.argsort(env.fleet.id)
+            trajectory.append(np.column_stack([env.fleet.pos[order], env.fleet.speed[order],
+                                               env.fleet.stopped[order]]))
+    return np.array(trajectory, dtype=np.float64)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the array engine with the Vehicle object loop.")
+    parser.add_argument("--check", action="store_true", help="run the comparison")
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[16, 80, 300],
+                        help="vehicles per scenario (split over both directions)")
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--ticks", type=int, default=400)
+    parser.add_argument("--dt", type=float, default=0.25)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.check:
+        print("Nothing to do; use --check to compare the engines.")
+        return
+    for n in args.vehicles:
+        worst = np.zeros(3)
+        for seed in range(args.seeds):
+            objects = engine_trajectories("objects", n // 2, n - n // 2, args.ticks, args.dt, seed)
+            arrays = engine_trajectories("arrays", n // 2, n - n // 2, args.ticks, args.dt, seed)
+            worst = np.maximum(worst, np.abs(objects - arrays).max(axis=(0, 1)))
+        print(f"{n:5d} vehicles, {args.seeds} seeds x {args.ticks} ticks: max |position| difference "
+              f"{worst[0]:.3g} m, speed {worst[1]:.3g} m/s, stopped flags {'equal' if not worst[2] else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
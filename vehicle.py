@@ -3,6 +3,9 @@ import random
 # Distance from the traffic light where vehicles must stop
 STOP_LINE_DISTANCE = 20
 
+# Distance before the stop line within which vehicles must stop on red
+APPROACH_DISTANCE = 15
+
 class Vehicle:
     """
     A class representing a vehicle in the traffic simulation.
@@ -10,6 +13,10 @@ class Vehicle:
     rules, and respond to traffic lights and other vehicles.
     """
 
+    __slots__ = ("id", "length", "type", "max_speed", "speed", "acceleration", "deceleration",
+                 "reaction_delay", "direction", "lane", "is_troublemaker", "stopped",
+                 "delay_timer", "x", "y", "bus")
+
     def __init__(self, vid, direction="x", start_pos=None, lane=0,
                  is_troublemaker=False, fast_start=True):
         self.id = vid
@@ -28,6 +35,7 @@ class Vehicle:
         self.is_troublemaker = is_troublemaker
         self.stopped = False
         self.delay_timer = 0.0
+        self.bus = None  # V2IBus this vehicle publishes its state to, if any
 
         # Initial position
         if direction == "x":
@@ -60,9 +68,11 @@ class Vehicle:
         """
         self.delay_timer += dt
         must_stop = False
+        was_stopped = self.stopped
+        old_speed = self.speed
         pos = self.x if self.direction == "x" else self.y
         stop_line = light_pos - STOP_LINE_DISTANCE
-        approach_distance = 15  # meters before the stop line
+        approach_distance = APPROACH_DISTANCE  # meters before the stop line
 
         # --- Traffic light check ---
         if light and pos < stop_line:
@@ -112,3 +122,14 @@ class Vehicle:
 
         if self.stopped:
             self.delay_timer = 0
+
+        # --- V2I: report state transitions only (and the speed change for the sums) ---
+        bus = self.bus
+        if bus is not None:
+            if self.speed != old_speed:
+                bus.speed_changed(self, self.speed - old_speed)
+            new_pos = self.x if self.direction == "x" else self.y
+            if (self.stopped != was_stopped
+                    or (pos < bus.approach_start) != (new_pos < bus.approach_start)
+                    or (pos < bus.light_pos) != (new_pos < bus.light_pos)):
+                bus.publish(self)